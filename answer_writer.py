@@ -0,0 +1,274 @@
+"""
+Buffered quiz answer writer for Trinity Training Guide
+
+When a whole class submits answers at the same moment, committing every
+answer in its own transaction makes the requests queue up behind the
+database write lock. With ANSWER_WRITE_QUEUE enabled, answers are still
+graded synchronously (against the cached quiz bundle), but the writes are
+handed to a per-worker background thread. It flushes them as one multi-row
+upsert, plus one completion check per (user, module), every
+ANSWER_QUEUE_FLUSH_INTERVAL seconds or as soon as ANSWER_QUEUE_BATCH_SIZE
+answers are waiting.
+
+An answer that completes a module is written straight away with the user's
+other queued answers (write_user()), so the next module is unlocked by the
+time the response arrives.
+
+The queue is flushed when the interpreter shuts down, so a graceful worker
+restart does not lose answers. When the queue is full, submit() refuses the
+answers and the caller writes them synchronously instead.
+
+Usage:
+    writer = AnswerWriter(app)
+    if not writer.submit(user.id, module_id, graded_answers):
+        update_user_quiz_answers(user.id, module_id, graded_answers)
+    writer.write_user(user.id)  # before reading the user's progress back
+    writer.stats()  # queue depth, batch sizes, flush timings
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, quiz_answer_row, upsert_user_quiz_answers, record_module_completion
+
+
+class _PendingAnswer:
+    """A graded answer waiting to be written"""
+    __slots__ = ('row', 'module_id', 'attempts')
+
+    def __init__(self, row, module_id):
+        self.row = row
+        self.module_id = module_id
+        self.attempts = 0
+
+
+class AnswerWriter:
+    """Per-worker queue that writes quiz answers in batches"""
+
+    MAX_ATTEMPTS = 3
+    SHUTDOWN_TIMEOUT = 10  # seconds to wait for the final flush
+
+    def __init__(self, app):
+        self.app = app
+        self.flush_interval = app.config.get('ANSWER_QUEUE_FLUSH_INTERVAL', 0.02)
+        self.batch_size = app.config.get('ANSWER_QUEUE_BATCH_SIZE', 200)
+        self.max_depth = app.config.get('ANSWER_QUEUE_MAX_DEPTH', 10000)
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._writing = False  # A batch has been taken and is being written
+        self._stats = {
+            'queued': 0,
+            'written': 0,
+            'rejected': 0,
+            'dropped': 0,
+            'batches': 0,
+            'failed_batches': 0,
+            'peak_depth': 0,
+            'in_flight': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+        atexit.register(self.stop)
+
+    def __repr__(self):
+        return f'<AnswerWriter depth={len(self._queue)}>'
+
+    def submit(self, user_id, module_id, graded_answers):
+        """
+        Queue graded answers (dicts as returned by ModuleQuizBundle.grade)
+        for writing.
+
+        Returns:
+            True if the answers were queued, False if the queue is full or
+            shutting down and the caller must write them itself
+        """
+        now = datetime.utcnow()
+        with self._cond:
+            if self._stopping or len(self._queue) + len(graded_answers) > self.max_depth:
+                self._stats['rejected'] += len(graded_answers)
+                return False
+
+            self._ensure_thread()
+            for answer in graded_answers:
+                self._queue.append(_PendingAnswer(quiz_answer_row(user_id, answer, now), module_id))
+
+            self._stats['queued'] += len(graded_answers)
+            self._stats['peak_depth'] = max(self._stats['peak_depth'], len(self._queue))
+            self._cond.notify_all()
+
+        return True
+
+    def write_user(self, user_id):
+        """
+        Write a user's queued answers now, in the calling thread, after any
+        batch already being written. Call this before reading the user's
+        progress back, e.g. when an answer completes a module.
+        """
+        with self._cond:
+            batch = self._take_batch(user_id)
+        self._flush(batch)
+
+    def stats(self):
+        """Queue depth and flush metrics for this worker"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['depth'] = len(self._queue)
+            stats['running'] = bool(self._thread and self._thread.is_alive())
+
+        total_flush_ms = stats.pop('total_flush_ms')
+        stats['avg_flush_ms'] = round(total_flush_ms / stats['batches'], 2) if stats['batches'] else 0.0
+        return stats
+
+    def stop(self):
+        """Flush everything still queued and stop the writer thread"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+
+        if thread and thread.is_alive():
+            thread.join(self.SHUTDOWN_TIMEOUT)
+
+        # No thread in this process (or it did not finish) - flush here
+        while self._queue:
+            with self._cond:
+                batch = self._take_batch()
+            self._flush(batch)
+
+    # ------------------------------------------------------------------------
+
+    def _ensure_thread(self):
+        """Start the writer thread in this process if needed (call with the lock held)"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='answer-writer', daemon=True)
+        self._thread.start()
+
+    def _take_batch(self, user_id=None):
+        """
+        Take the next batch, or all of one user's answers, to write (call with
+        the lock held). Waits for the batch being written to finish first, so
+        batches are committed in the order they were taken.
+        """
+        while self._writing:
+            self._cond.wait()
+
+        if user_id is None:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        else:
+            batch = [pending for pending in self._queue if pending.row['user_id'] == user_id]
+            if batch:
+                self._queue = deque(pending for pending in self._queue if pending.row['user_id'] != user_id)
+
+        self._writing = bool(batch)
+        self._stats['in_flight'] = len(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+
+                # Give a batch a moment to build up, unless it is already full
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._queue) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = self._take_batch()
+
+            self._flush(batch)
+
+    def _flush(self, batch):
+        """
+        Write one batch in a single transaction. If that fails, write its
+        answers one at a time, so a bad row (e.g. for a question or user
+        deleted since) only holds back itself, and re-queue the ones that fail.
+        """
+        if not batch:
+            return
+
+        # One upsert statement can only touch each (user, question) once -
+        # keep the latest answer
+        latest = {}
+        for pending in batch:
+            latest[(pending.row['user_id'], pending.row['quiz_question_id'])] = pending
+        pending_answers = list(latest.values())
+
+        failed = pending_answers
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                failed = [] if self._write(pending_answers) else pending_answers
+                if failed and len(pending_answers) > 1:
+                    failed = [pending for pending in pending_answers if not self._write([pending])]
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+                self._stats['in_flight'] = 0
+                self._stats['written'] += len(pending_answers) - len(failed)
+                self._stats['batches'] += 1
+                self._stats['last_batch_size'] = len(pending_answers)
+                self._stats['last_flush_ms'] = round(elapsed_ms, 2)
+                self._stats['total_flush_ms'] += elapsed_ms
+                if failed:
+                    self._stats['failed_batches'] += 1
+                    self._retry(failed)
+
+    def _write(self, pending_answers):
+        """Write answers and their completion checks in one transaction. Returns False if it failed."""
+        try:
+            upsert_user_quiz_answers([pending.row for pending in pending_answers])
+            for user_id, module_id in {(p.row['user_id'], p.module_id) for p in pending_answers}:
+                record_module_completion(user_id, module_id)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            if len(pending_answers) == 1:
+                self.app.logger.exception(
+                    'Failed to write quiz answer %s for user %s',
+                    pending_answers[0].row['quiz_question_id'], pending_answers[0].row['user_id']
+                )
+            else:
+                self.app.logger.exception(
+                    'Failed to write %d quiz answers - writing them one at a time', len(pending_answers)
+                )
+            return False
+        return True
+
+    def _retry(self, pending_answers):
+        """
+        Put failed answers back at the front of the queue, dropping answers
+        that keep failing (call with the lock held)
+        """
+        for pending in reversed(pending_answers):
+            pending.attempts += 1
+            if pending.attempts < self.MAX_ATTEMPTS:
+                self._queue.appendleft(pending)
+            else:
+                self._stats['dropped'] += 1
+                self.app.logger.error(
+                    'Dropped quiz answer %s (choice %s) for user %s after %d attempts',
+                    pending.row['quiz_question_id'], pending.row['selected_choice'],
+                    pending.row['user_id'], pending.attempts
+                )
@@ -0,0 +1,160 @@
+"""
+Response compression for Trinity Training Guide
+
+Gunicorn sends responses exactly as the app returns them, so without a
+compressing proxy in front every page went out uncompressed: 155KB for the
+glossary, 28KB for the table of contents. HTML and JSON responses of at
+least COMPRESSION_MIN_BYTES are now compressed when the browser accepts it:
+brotli when the brotli package is installed, gzip otherwise.
+
+Responses that are already encoded (pre-compressed static files), streamed,
+partial or marked no-transform are left alone. A compressed response gets a
+weak ETag, since its bytes differ from the uncompressed page with the same
+tag. Conditional GETs compare ETags weakly, so 304s keep working.
+
+Pages from the page cache are not gzipped from scratch. The static text
+between their per-user regions is deflated once per cached page, and each
+response joins those blocks with the freshly deflated per-user fragments
+(see deflate_block and gzip_blocks).
+"""
+
+import gzip
+import struct
+import threading
+import zlib
+
+from flask import current_app, g, request
+
+try:
+    import brotli
+except ImportError:  # Optional - responses are gzipped without it
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = {'text/html', 'application/json', 'text/plain'}
+
+# Preferred first
+ENCODINGS = ('br', 'gzip')
+
+# No file name, mtime 0, unknown OS
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+# An empty final deflate block
+FINAL_BLOCK = zlib.compressobj(wbits=-zlib.MAX_WBITS).flush()
+
+
+def deflate_block(data, level):
+    """
+    Raw deflate of data ending on a byte boundary, so blocks compressed
+    separately can be joined into one stream
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def gzip_blocks(blocks, data):
+    """
+    A gzip body from deflate_block() output.
+
+    Args:
+        blocks: Deflated pieces of data, in order
+        data: The uncompressed data, for the checksum and length
+    """
+    trailer = struct.pack('<II', zlib.crc32(data), len(data) & 0xffffffff)
+    return b''.join((GZIP_HEADER, *blocks, FINAL_BLOCK, trailer))
+
+
+# ============================================================================
+# STATS
+# ============================================================================
+
+_stats = {'responses': 0, 'reused': 0, 'bytes_in': 0, 'bytes_out': 0}
+_stats_lock = threading.Lock()
+
+
+def compression_stats():
+    """Counters of this worker's compressed responses"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['ratio'] = round(stats['bytes_in'] / stats['bytes_out'], 2) if stats['bytes_out'] else None
+    stats['brotli'] = brotli is not None
+    return stats
+
+
+# ============================================================================
+# MIDDLEWARE
+# ============================================================================
+
+def _accepted_encoding():
+    for encoding in ENCODINGS:
+        if encoding == 'br' and brotli is None:
+            continue
+        if request.accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def _cached_page_gzip(body, level):
+    """The response body as gzip from its cached page's deflated text, if it is one"""
+    cached = g.get('cached_page')
+    if cached is None:
+        return None
+    html, page, slots, locks = cached
+    if html.encode('utf-8') != body:  # The route changed the page after splicing
+        return None
+    return page.gzip(body, slots, locks, level)
+
+
+def compress_response(response):
+    """after_request hook: compress large text responses the browser can decode"""
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or 'no-transform' in response.headers.get('Cache-Control', '')
+    ):
+        return response
+
+    body = response.get_data()
+    if len(body) < current_app.config.get('COMPRESSION_MIN_BYTES', 1024):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _accepted_encoding()
+    if encoding is None:
+        return response
+
+    reused = False
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=current_app.config.get('COMPRESSION_BROTLI_QUALITY', 5))
+    else:
+        level = current_app.config.get('COMPRESSION_LEVEL', 6)
+        compressed = _cached_page_gzip(body, level)
+        reused = compressed is not None
+        if compressed is None:
+            compressed = gzip.compress(body, compresslevel=level, mtime=0)
+
+    if len(compressed) >= len(body):
+        return response
+
+    response.set_data(compressed)
+    response.content_encoding = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    with _stats_lock:
+        _stats['responses'] += 1
+        _stats['reused'] += reused
+        _stats['bytes_in'] += len(body)
+        _stats['bytes_out'] += len(compressed)
+    return response
+
+
+def init_compression(app):
+    """Compress responses if COMPRESSION_ENABLED is on"""
+    if app.config.get('COMPRESSION_ENABLED', True):
+        app.after_request(compress_response)
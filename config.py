@@ -27,12 +27,106 @@ class Config:
     SESSION_COOKIE_SAMESITE = 'Lax'
     PERMANENT_SESSION_LIFETIME = 7 * 24 * 60 * 60  # 7 days in seconds
     
+    # Session storage (see session_store.py): 'cookie' keeps the whole session
+    # in a signed cookie; 'database', 'filesystem' or 'redis' keep it on the
+    # server and the cookie only carries an opaque session ID
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND') or 'cookie'
+    SESSION_FILE_DIR = os.environ.get('SESSION_FILE_DIR')  # Defaults to instance/sessions
+    SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL') or 'redis://localhost:6379/0'
+    SESSION_REFRESH_INTERVAL = 60 * 60  # seconds between expiry refreshes of an unchanged session
+    SESSION_SWEEP_INTERVAL = 60 * 60  # seconds between removals of expired sessions
+    
     # Application settings
     PREVIEW_MODE_PASSWORD = os.environ.get('PREVIEW_MODE_PASSWORD') or 'preview123'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file upload
     
     # Pagination
     ITEMS_PER_PAGE = 20
+    
+    # How often (seconds) each worker checks the content version stamp
+    # to decide whether cached curriculum data must be rebuilt
+    CONTENT_VERSION_CHECK_INTERVAL = 5
+    
+    # How often (seconds) each worker re-reads a user's session_version to
+    # decide whether the user data cached in the session is still valid
+    USER_VERSION_CHECK_INTERVAL = 5
+    
+    # Quiz answer shuffling:
+    #   'deterministic' - order derived from a keyed hash, nothing stored until an answer is submitted
+    #   'random'        - random order saved to user_quiz_answers on first view
+    QUIZ_SHUFFLE_MODE = os.environ.get('QUIZ_SHUFFLE_MODE') or 'deterministic'
+    QUIZ_SHUFFLE_SECRET = os.environ.get('QUIZ_SHUFFLE_SECRET')  # Defaults to SECRET_KEY
+    
+    # /metrics/* endpoints: shown only to preview-mode (admin) users unless
+    # this is on (e.g. for a scraper on a private network)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    
+    # Per-worker cache of module quiz bundles (questions + one user's answers)
+    QUIZ_BUNDLE_TTL = 30 * 60  # seconds - roughly one module attempt
+    QUIZ_BUNDLE_CACHE_SIZE = 2048  # max cached (user, module) bundles per worker
+    
+    # Buffered answer writes (see answer_writer.py): answers are graded at once
+    # but written by a background thread as one multi-row upsert per batch
+    ANSWER_WRITE_QUEUE = os.environ.get('ANSWER_WRITE_QUEUE', '').lower() in ('1', 'true', 'yes')
+    ANSWER_QUEUE_FLUSH_INTERVAL = 0.02  # seconds to let a batch build up
+    ANSWER_QUEUE_BATCH_SIZE = 200  # flush as soon as this many answers are waiting
+    ANSWER_QUEUE_MAX_DEPTH = 10000  # beyond this, answers are written synchronously
+    
+    # Cache of rendered chapter/module pages (see page_cache.py)
+    PAGE_CACHE_ENABLED = True
+    PAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024  # per worker
+    
+    # Cache-Control per route for conditional GETs (see http_cache.py). Pages
+    # show the user's name, so they are private. 'no-cache' makes the browser
+    # revalidate (cheap 304s) so lock state is always re-checked.
+    HTTP_CACHE_POLICIES = {
+        'cover': 'private, max-age=300',
+        'glossary': 'private, max-age=300',
+        'glossary_search': 'private, max-age=300',
+        'trucks': 'private, max-age=300',
+        'chapter': 'private, no-cache',
+        'module': 'private, no-cache',
+        'module_page': 'private, no-cache',
+    }
+    
+    # Most results /api/glossary/search returns (see glossary.py)
+    GLOSSARY_SEARCH_MAX_RESULTS = 200
+    
+    # Compiled templates (see template_cache.py): a bytecode cache shared by
+    # the workers (in the system temp directory unless set), and compiling
+    # every template at startup
+    JINJA_BYTECODE_CACHE = True
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+    TEMPLATE_WARMUP = True
+    
+    # Compress HTML and JSON responses (see compression.py) - turn off when a
+    # proxy in front already compresses them
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    COMPRESSION_MIN_BYTES = 1024  # smaller responses are sent as they are
+    COMPRESSION_LEVEL = 6  # gzip, 1-9
+    COMPRESSION_BROTLI_QUALITY = 5  # brotli, 0-11 (when the brotli package is installed)
+    
+    # Link the first mention of each glossary term on module pages (see glossary_links.py)
+    GLOSSARY_AUTOLINK = True
+    
+    # Full-text search (see search.py): 'auto' uses the database's full-text
+    # table once `flask build-search-index` has filled it, 'memory' never does
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+    SEARCH_RESULTS_LIMIT = 20
+    
+    # Content-hashed static URLs with immutable caching, once `flask build-assets`
+    # has written static/dist/manifest.json (see static_assets.py)
+    STATIC_FINGERPRINTING = True
+    
+    # Widths (px) of the image derivatives written by `flask build-images`
+    # (see responsive_images.py)
+    RESPONSIVE_IMAGE_WIDTHS = (320, 640, 960, 1280, 1920)
+    RESPONSIVE_IMAGE_QUALITY = 80
+    
+    # Inline the above-the-fold CSS written by `flask build-critical-css` and
+    # load the full stylesheet asynchronously (see critical_css.py)
+    CRITICAL_CSS_ENABLED = True
+    CRITICAL_CSS_FOLD_ELEMENTS = 50  # elements of <main> treated as visible on load
 
 
 class DevelopmentConfig(Config):
@@ -49,6 +143,10 @@ class DevelopmentConfig(Config):
     
     # Development-specific settings
     EXPLAIN_TEMPLATE_LOADING = True
+    PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', '').lower() in ('1', 'true', 'yes')  # Templates are edited live
+    STATIC_FINGERPRINTING = os.environ.get('STATIC_FINGERPRINTING', '').lower() in ('1', 'true', 'yes')  # CSS/JS are edited live
+    CRITICAL_CSS_ENABLED = os.environ.get('CRITICAL_CSS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    TEMPLATE_WARMUP = os.environ.get('TEMPLATE_WARMUP', '').lower() in ('1', 'true', 'yes')  # Reloader restarts often
 
 
 class TestingConfig(Config):
@@ -62,6 +160,8 @@ class TestingConfig(Config):
     
     # Testing-specific settings
     WTF_CSRF_ENABLED = False  # Disable CSRF for testing
+    CONTENT_VERSION_CHECK_INTERVAL = 0  # Always see content changes immediately
+    USER_VERSION_CHECK_INTERVAL = 0
 
 
 class ProductionConfig(Config):
@@ -0,0 +1,250 @@
+"""
+Content compilation for Trinity Training Guide
+
+Module.content_markdown is written with [PRO TIP]-style callouts and plain
+section headings. Turning it into HTML takes a callout pass, a heading pass
+and a markdown conversion. The old app did all three on every request, and
+built a new markdown.Markdown instance each time.
+
+compile_modules() does this once per module and stores the result in
+Module.rendered_html, with Module.content_hash (a SHA-256 of the markdown
+and COMPILER_VERSION) recording what it was compiled from. It runs after
+db_migration.py and import_data.py load content, and via
+`flask compile-content`. Modules whose hash still matches are skipped, so
+only changed modules are compiled. Readers of rendered_html never process
+markdown.
+
+The same pass splits each module into screen-sized pages
+(split_content_into_pages, by estimated visual height) and stores them as
+ModulePage rows with their line ranges and HTML. A page of a module is a
+primary-key lookup (get_module_page), and page counts are part of the
+curriculum index. Pages are rewritten only when the content hash changes.
+
+Bump COMPILER_VERSION when the output of convert_to_html changes, so every
+module is compiled again.
+"""
+
+import hashlib
+import re
+
+import markdown
+
+from models import db, Module, ModulePage
+
+
+COMPILER_VERSION = 2
+
+MARKDOWN_EXTENSIONS = ['nl2br', 'sane_lists']
+
+# [TYPE] Content, up to a blank line or the next callout
+CALLOUT_PATTERN = re.compile(r'\[([A-Z\s]+)\]\s*(.+?)(?=\n\n|\[(?:[A-Z\s]+)\]|$)', re.DOTALL)
+
+CALLOUT_STYLES = {
+    'PRO TIP': ('callout-tip', '💡'),
+    'COMMON MISTAKE': ('callout-warning', '⚠️'),
+    'REAL EXAMPLE': ('callout-example', '📊'),
+    'KEY TAKEAWAY': ('callout-key', '🎯'),
+    'IMPORTANT': ('callout-important', '⚡'),
+    'NOTE': ('callout-note', '📝')
+}
+DEFAULT_CALLOUT_STYLE = ('callout-default', '📌')
+
+HEADING_PREFIXES = ('Months ', 'Year ', 'Why ', 'What ', 'The ')
+
+# Height of a page in estimate_visual_height units (about one viewport)
+PAGE_HEIGHT = 27.5
+
+# Callout lines that start a callout
+CALLOUT_START_PATTERN = re.compile(r'^\[([A-Z\s]+)\]')
+
+
+def _replace_callout(match):
+    callout_type = match.group(1).strip()
+    content = match.group(2).strip()
+    css_class, icon = CALLOUT_STYLES.get(callout_type, DEFAULT_CALLOUT_STYLE)
+    return (
+        f'<div class="callout {css_class}"><div class="callout-title">{icon} <strong>{callout_type}</strong></div>'
+        f'<div class="callout-content">{content}</div></div>\n\n'
+    )
+
+
+def process_callouts(text):
+    """Convert [TYPE] content callouts to styled HTML blocks"""
+    if not text:
+        return ""
+    return CALLOUT_PATTERN.sub(_replace_callout, text)
+
+
+def preprocess_content(text):
+    """
+    Bold the plain-text section headings: short lines followed by a long
+    line, that start with a capital and end with a colon, have at most six
+    words or start with a heading word ("Months 1-3: The Learning Phase")
+    """
+    if not text:
+        return ""
+
+    lines = text.split('\n')
+    processed = []
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped:
+            processed.append('')
+            continue
+
+        next_line = lines[i + 1].strip() if i + 1 < len(lines) else ''
+        is_heading = (
+            len(stripped) < 70
+            and len(next_line) > 50
+            and stripped[0].isupper()
+            and (stripped.endswith(':') or stripped.count(' ') <= 5 or stripped.startswith(HEADING_PREFIXES))
+        )
+
+        if is_heading:
+            if processed and processed[-1] != '':
+                processed.append('')
+            processed.append(f"**{stripped}**")
+            processed.append('')
+        else:
+            processed.append(line)
+
+    return '\n'.join(processed)
+
+
+def convert_to_html(text, md=None):
+    """
+    Convert module markdown (with callouts) to HTML.
+
+    Args:
+        text: Markdown source
+        md: markdown.Markdown instance to reuse, if converting many texts
+    """
+    if not text:
+        return ""
+    if md is None:
+        md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return md.reset().convert(preprocess_content(process_callouts(text)))
+
+
+def estimate_visual_height(line, is_in_callout=False, is_callout_start=False):
+    """
+    Estimated rendered height of a line, where 1.0 is one line of body text.
+    Callouts are taller for their title bar, padding and borders.
+    """
+    stripped = line.strip()
+    if not stripped:
+        return 0.3 if is_in_callout else 0.5
+    if is_callout_start:
+        return 4.0
+    if is_in_callout:
+        return max(1, len(stripped) / 50) * 1.8  # ~50 characters per callout line
+    if stripped.startswith('**') and stripped.endswith('**'):
+        return 2.5
+    return max(1, len(stripped) / 60) * 1.2  # ~60 characters per line
+
+
+def split_content_into_pages(text, max_height=PAGE_HEIGHT):
+    """
+    Split module markdown into pages of at most max_height estimated height.
+    Callouts are never split, and a bold heading that would overflow a page
+    starts the next one.
+
+    Returns:
+        [(line_start, line_end), ...] - line ranges of text.split('\n')
+    """
+    if not text:
+        return [(0, 1)]
+
+    lines = text.split('\n')
+    pages = []
+    page_start = 0
+    height = 0.0
+    callout_start = None
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+
+        if CALLOUT_START_PATTERN.match(stripped):
+            callout_start = i
+            continue
+
+        # A callout ends at its first blank line (or the end of the text)
+        if callout_start is not None:
+            if stripped and i < len(lines) - 1:
+                continue
+            callout_height = estimate_visual_height(lines[callout_start], False, True) + sum(
+                estimate_visual_height(callout_line, True, False)
+                for callout_line in lines[callout_start + 1:i + 1]
+            )
+            # Callouts get a 15% margin so they are sure to fit
+            if height + callout_height > max_height * 0.85 and callout_start > page_start:
+                pages.append((page_start, callout_start))
+                page_start = callout_start
+                height = callout_height
+            else:
+                height += callout_height
+            callout_start = None
+            continue
+
+        line_height = estimate_visual_height(line, False, False)
+        if height + line_height > max_height and i > page_start:
+            if stripped.startswith('**'):
+                pages.append((page_start, i))
+                page_start = i
+                height = line_height
+            else:
+                pages.append((page_start, i + 1))
+                page_start = i + 1
+                height = 0.0
+        else:
+            height += line_height
+
+    if page_start < len(lines):
+        pages.append((page_start, len(lines)))
+    return pages
+
+
+def content_hash(text):
+    """Hash of a module's markdown and the compiler version it is compiled with"""
+    return hashlib.sha256(f'{COMPILER_VERSION}\n{text or ""}'.encode('utf-8')).hexdigest()
+
+
+def compile_modules(force=False):
+    """
+    Compile the modules whose markdown changed since they were last compiled,
+    and rewrite their pages. The caller commits.
+
+    Args:
+        force: Compile every module
+
+    Returns:
+        (compiled, unchanged) module counts
+    """
+    md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    compiled = unchanged = 0
+    for module in Module.query.order_by(Module.id).all():
+        digest = content_hash(module.content_markdown)
+        if not force and module.content_hash == digest and module.rendered_html is not None:
+            unchanged += 1
+            continue
+        module.rendered_html = convert_to_html(module.content_markdown, md)
+        module.content_hash = digest
+
+        lines = (module.content_markdown or '').split('\n')
+        module.pages = [
+            ModulePage(
+                page_num=page_num, line_start=line_start, line_end=line_end,
+                content_html=convert_to_html('\n'.join(lines[line_start:line_end]), md)
+            )
+            for page_num, (line_start, line_end) in enumerate(
+                split_content_into_pages(module.content_markdown), start=1
+            )
+        ]
+        compiled += 1
+    db.session.flush()
+    return compiled, unchanged
+
+
+def get_module_page(module_id, page_num):
+    """A compiled page of a module (1-based), or None"""
+    return db.session.get(ModulePage, (module_id, page_num))
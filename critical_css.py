@@ -0,0 +1,311 @@
+"""
+Critical CSS for Trinity Training Guide
+
+Every page used to block its first paint on css/styles.css.
+`flask build-critical-css` renders one sample page per layout (cover, table
+of contents, chapter page, module page) and works out which stylesheet rules
+style the part of the page that is visible on load:
+- everything outside <main> (the header and the fixed progress bar)
+- the first CRITICAL_CSS_FOLD_ELEMENTS elements inside <main>
+
+It keeps those rules (and the @media blocks around them), minus rules that
+only apply on interaction (:hover, :focus, ...). The result is written to
+static/critical/<layout>.css.
+
+Routes pass critical_layout to their template. With CRITICAL_CSS_ENABLED on
+and the layout's CSS built, base.html inlines it in a <style> tag and loads
+the full stylesheet asynchronously (preload, then switch to stylesheet on
+load, with a <noscript> fallback). Pages without critical CSS keep the normal
+blocking <link>.
+
+Selector matching is deliberately generous: sibling combinators, attribute
+selectors and structural pseudo-classes are treated as matching, so the
+inlined CSS may hold a few extra rules but does not miss any.
+"""
+
+import os
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+
+from flask import current_app
+from markupsafe import Markup
+
+
+OUTPUT_DIR = 'critical'
+
+# Layout -> sample page rendered to find the visible elements
+CRITICAL_PAGES = {
+    'cover': '/cover',
+    'toc': '/toc',
+    'chapter': '/chapter/1/intro',
+    'module': '/module/1.1',
+}
+
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'
+}
+
+COMMENT = re.compile(r'/\*.*?\*/', re.S)
+INTERACTIVE = re.compile(r':(hover|focus|focus-visible|focus-within|active|visited|target)\b')
+PSEUDO = re.compile(r'::?[\w-]+(\([^)]*\))?')
+ATTRIBUTE = re.compile(r'\[[^\]]*\]')
+SELECTOR_PART = re.compile(r'\s*([>+~])\s*|\s+|([^\s>+~]+)')
+
+
+class Element:
+    __slots__ = ('tag', 'id', 'classes', 'parent')
+
+    def __init__(self, tag, attrs, parent):
+        self.tag = tag
+        self.id = attrs.get('id')
+        self.classes = frozenset((attrs.get('class') or '').split())
+        self.parent = parent
+
+    def matches(self, compound):
+        tag, ids, classes = compound
+        return (
+            (tag is None or tag == self.tag) and
+            all(i == self.id for i in ids) and
+            classes <= self.classes
+        )
+
+
+class FoldParser(HTMLParser):
+    """Collects the elements visible on load, and the page's stylesheet links"""
+
+    def __init__(self, main_budget):
+        super().__init__()
+        self.main_budget = main_budget
+        self.stack = []
+        self.visible = []
+        self.stylesheets = []
+        self.in_body = False
+        self.main_depth = None
+        self.main_seen = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'link' and ('stylesheet' in (attrs.get('rel') or '') or attrs.get('as') == 'style'):
+            self.stylesheets.append(attrs.get('href'))
+
+        parent = self.stack[-1] if self.stack else None
+        element = Element(tag, attrs, parent)
+
+        if tag == 'body':
+            self.in_body = True
+        if tag in ('html', 'body'):
+            self.visible.append(element)
+        elif self.in_body:
+            if self.main_depth is None:
+                self.visible.append(element)
+                if tag == 'main':
+                    self.main_depth = len(self.stack)
+            elif self.main_seen < self.main_budget:
+                self.main_seen += 1
+                self.visible.append(element)
+
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(element)
+
+    def handle_endtag(self, tag):
+        # Pop to the matching open element (tolerates unclosed tags)
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                break
+        if tag == 'main' and self.main_depth is not None and len(self.stack) <= self.main_depth:
+            # Back outside <main>: following elements (progress bar) are page chrome
+            self.main_depth = None
+            self.main_seen = self.main_budget
+
+
+# ============================================================================
+# SELECTOR MATCHING
+# ============================================================================
+
+def _split_top_level(text, separator=','):
+    parts, depth, current = [], 0, []
+    for char in text:
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        if char == separator and depth == 0:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append(''.join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _compound(text):
+    tag = re.match(r'[a-zA-Z][\w-]*', text)
+    return (
+        tag.group(0).lower() if tag else None,
+        tuple(re.findall(r'#([\w-]+)', text)),
+        frozenset(re.findall(r'\.([\w-]+)', text))
+    )
+
+
+def _parse_selector(selector):
+    """
+    Split a selector into compounds from the right, each with the combinator
+    to its left: '.a > .b .c' -> [(.c, ' '), (.b, '>'), (.a, None)]
+    """
+    selector = PSEUDO.sub('', ATTRIBUTE.sub('', selector.replace(':root', 'html')))
+
+    compounds, combinators = [], []
+    pending = None
+    for match in SELECTOR_PART.finditer(selector):
+        combinator, compound = match.groups()
+        if compound:
+            if compounds:
+                combinators.append(pending or ' ')
+            compounds.append(_compound(compound))
+            pending = None
+        elif combinator:
+            pending = combinator
+
+    # combinators[i] sits between compounds[i] and compounds[i + 1]
+    return [
+        (compounds[i], combinators[i - 1] if i > 0 else None)
+        for i in range(len(compounds) - 1, -1, -1)
+    ]
+
+
+def _match_from(element, steps):
+    compound, combinator = steps[0]
+    if not element.matches(compound):
+        return False
+    if len(steps) == 1:
+        return True
+    rest = steps[1:]
+    if combinator == '>':
+        return element.parent is not None and _match_from(element.parent, rest)
+    if combinator == ' ':
+        node = element.parent
+        while node is not None:
+            if _match_from(node, rest):
+                return True
+            node = node.parent
+        return False
+    return True  # Siblings are not tracked - assume '+' and '~' match
+
+
+def selector_is_critical(selector, visible):
+    if INTERACTIVE.search(selector):
+        return False
+    steps = _parse_selector(selector)
+    if not steps:
+        return True  # Only pseudo-elements, e.g. ::selection
+    return any(_match_from(element, steps) for element in visible)
+
+
+# ============================================================================
+# STYLESHEET FILTERING
+# ============================================================================
+
+def _blocks(css):
+    """Split CSS into (prelude, body) pairs at the top level"""
+    blocks, i = [], 0
+    while True:
+        start = css.find('{', i)
+        if start == -1:
+            return blocks
+        depth, j = 1, start + 1
+        while depth and j < len(css):
+            depth += (css[j] == '{') - (css[j] == '}')
+            j += 1
+        prelude = css[i:start].rsplit(';', 1)[-1].strip()
+        blocks.append((prelude, css[start + 1:j - 1]))
+        i = j
+
+
+def extract_critical(css, visible, _nested=False):
+    """The rules of a stylesheet that apply to the visible elements, minified"""
+    if not _nested:
+        css = COMMENT.sub('', css)
+
+    out = []
+    for prelude, body in _blocks(css):
+        if prelude.startswith('@media') or prelude.startswith('@supports'):
+            inner = extract_critical(body, visible, _nested=True)
+            if inner:
+                out.append(f'{" ".join(prelude.split())}{{{inner}}}')
+        elif prelude.startswith('@'):
+            continue  # @keyframes, @font-face, ... are not needed for first paint
+        else:
+            selectors = [s for s in _split_top_level(prelude) if selector_is_critical(s, visible)]
+            if selectors:
+                declarations = ' '.join(body.split()).strip().rstrip(';')
+                out.append(f'{",".join(selectors)}{{{declarations}}}')
+    return ''.join(out)
+
+
+def build_critical_css(app, fold_elements=50):
+    """
+    Render each layout's sample page and write its critical CSS.
+
+    Returns:
+        dict of layout -> size in bytes
+    """
+    static = Path(app.static_folder)
+    prefix = f'{app.static_url_path}/'
+    output = static / OUTPUT_DIR
+    output.mkdir(parents=True, exist_ok=True)
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['preview_mode'] = True
+        sess['seen_intros'] = list(range(1, 20))
+
+    sizes = {}
+    for layout, path in CRITICAL_PAGES.items():
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f'{path} returned {response.status_code}')
+
+        parser = FoldParser(fold_elements)
+        parser.feed(response.get_data(as_text=True))
+
+        css = []
+        for href in parser.stylesheets:
+            if href and href.startswith(prefix):
+                css.append(extract_critical((static / href[len(prefix):]).read_text(encoding='utf-8'), parser.visible))
+        critical = ''.join(css).replace('</', '<\\/')
+
+        target = output / f'{layout}.css'
+        tmp_path = target.with_name(f'{target.name}.{os.getpid()}.tmp')
+        tmp_path.write_text(critical, encoding='utf-8')
+        os.replace(tmp_path, target)
+        sizes[layout] = len(critical.encode('utf-8'))
+
+    return sizes
+
+
+# ============================================================================
+# TEMPLATES
+# ============================================================================
+
+def load_critical_css(static_folder):
+    """Read static/critical/*.css into a dict of layout -> CSS"""
+    directory = Path(static_folder) / OUTPUT_DIR
+    if not directory.is_dir():
+        return {}
+    return {path.stem: path.read_text(encoding='utf-8') for path in directory.glob('*.css')}
+
+
+def critical_css(layout):
+    """The inlinable CSS for a layout, or None to use the blocking stylesheet"""
+    if not layout or not current_app.config.get('CRITICAL_CSS_ENABLED', True):
+        return None
+    css = current_app.extensions.get('critical_css', {}).get(layout)
+    return Markup(css) if css else None
+
+
+def init_critical_css(app):
+    """Load the built critical CSS and make critical_css() available to templates"""
+    app.extensions['critical_css'] = load_critical_css(app.static_folder)
+    app.jinja_env.globals['critical_css'] = critical_css
@@ -0,0 +1,355 @@
+"""
+Curriculum index for Trinity Training Guide
+
+Builds an immutable, in-memory view of the course structure (chapters,
+modules, sub-modules, quiz questions and page navigation) once per worker
+from the Chapter/Module/QuizQuestion tables. Routes use it for navigation
+and progress bars without querying content on every request.
+
+The index is rebuilt only when the content version stamp changes
+(see models.bump_content_version).
+"""
+
+import re
+import threading
+import time
+from pathlib import Path
+from types import MappingProxyType
+
+from flask import current_app, url_for
+from sqlalchemy import func
+
+from models import (
+    db, Chapter, Module, ModulePage, QuizQuestion, get_content_version,
+    module_sort_key, module_bit_positions
+)
+
+
+SUB_MODULE_TEMPLATE_PATTERN = re.compile(r'^module_(\d+)_(\d+)_(\d+)\.html$')
+
+
+def is_sub_module_id(module_id):
+    """Check if a module ID is a sub-module (e.g., "2.2.1")"""
+    return len(module_id.split('.')) == 3
+
+
+class _Frozen:
+    """Base class for immutable __slots__ records"""
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+
+class ChapterEntry(_Frozen):
+    """A chapter with its page navigation (intro, summary, action_items)"""
+    __slots__ = ('id', 'title', 'module_ids', 'page_nav')
+
+    def __repr__(self):
+        return f'<ChapterEntry {self.id}: {self.title}>'
+
+
+class ModuleEntry(_Frozen):
+    """
+    A module or sub-module page with precomputed navigation.
+
+    quiz_nav holds (prev_url, next_url) for each quiz question, in order.
+    page_count is the number of compiled content pages (see content_compiler.py).
+    """
+    __slots__ = (
+        'id', 'chapter_id', 'parent_id', 'sub_module_ids', 'in_database',
+        'quiz_question_ids', 'progress_percent', 'prev_url', 'next_url',
+        'after_url', 'quiz_nav', 'quiz_progress_percent', 'template_path',
+        'page_count'
+    )
+
+    @property
+    def quiz_count(self):
+        return len(self.quiz_question_ids)
+
+    @property
+    def has_quiz(self):
+        return bool(self.quiz_question_ids)
+
+    def __repr__(self):
+        return f'<ModuleEntry {self.id}>'
+
+
+class CurriculumIndex(_Frozen):
+    """
+    Immutable snapshot of the course structure for one content version.
+
+    Attributes:
+        version: Content version the index was built from
+        chapters: {chapter_id: ChapterEntry}, in display order
+        modules: {module_id: ModuleEntry} for every module and sub-module page
+        chapter_modules: {chapter_id: (module_id, ...)} for modules stored in
+                         the database, sorted (e.g., 2.2 before 2.2.1 before 2.3)
+        quiz_counts: {module_id: number of quiz questions} for database modules
+        module_bits: {module_id: bit position} in UserState.completed_modules
+    """
+    __slots__ = ('version', 'chapters', 'modules', 'chapter_modules', 'quiz_counts', 'module_bits')
+
+    def __repr__(self):
+        return f'<CurriculumIndex v{self.version}: {len(self.modules)} modules>'
+
+    @property
+    def last_chapter_id(self):
+        return next(reversed(self.chapters)) if self.chapters else None
+
+    def get_module(self, module_id):
+        return self.modules.get(module_id)
+
+    def get_chapter(self, chapter_id):
+        return self.chapters.get(chapter_id)
+
+    @classmethod
+    def build(cls, version, templates_dir=None):
+        """
+        Build the index from the database. Must be called inside a request
+        context so navigation URLs can be generated with url_for.
+
+        Sub-modules that only exist as templates (e.g., module_2_2_1.html)
+        are discovered from templates_dir so they are part of navigation.
+        """
+        chapter_rows = Chapter.query.order_by(Chapter.display_order, Chapter.id).all()
+        module_rows = db.session.query(Module.id, Module.chapter_id).all()
+        question_rows = (
+            db.session.query(QuizQuestion.id, QuizQuestion.module_id)
+            .order_by(QuizQuestion.module_id, QuizQuestion.display_order)
+            .all()
+        )
+        page_counts = dict(
+            db.session.query(ModulePage.module_id, func.count()).group_by(ModulePage.module_id).all()
+        )
+
+        if templates_dir is None:
+            templates_dir = Path(current_app.root_path) / current_app.template_folder
+
+        question_ids = {}
+        for question_id, module_id in question_rows:
+            question_ids.setdefault(module_id, []).append(question_id)
+
+        chapter_modules = {chapter.id: [] for chapter in chapter_rows}
+        for module_id, chapter_id in module_rows:
+            chapter_modules.setdefault(chapter_id, []).append(module_id)
+        for module_ids in chapter_modules.values():
+            module_ids.sort(key=module_sort_key)
+
+        # Main modules and their sub-modules, per chapter
+        main_modules = {}
+        sub_modules = {}
+        for chapter_id, module_ids in chapter_modules.items():
+            main_modules[chapter_id] = [m for m in module_ids if not is_sub_module_id(m)]
+            for module_id in module_ids:
+                if is_sub_module_id(module_id):
+                    parent_id = module_id.rsplit('.', 1)[0]
+                    sub_modules.setdefault(parent_id, set()).add(module_id)
+
+        for chapter_id in chapter_modules:
+            chapter_dir = Path(templates_dir) / 'chapters' / f'chapter{chapter_id}'
+            if not chapter_dir.is_dir():
+                continue
+            for path in chapter_dir.iterdir():
+                match = SUB_MODULE_TEMPLATE_PATTERN.match(path.name)
+                if match and int(match.group(1)) == chapter_id:
+                    parent_id = f'{match.group(1)}.{int(match.group(2))}'
+                    sub_modules.setdefault(parent_id, set()).add(
+                        f'{parent_id}.{int(match.group(3))}'
+                    )
+
+        sub_modules = {
+            parent_id: sorted(ids, key=module_sort_key)
+            for parent_id, ids in sub_modules.items()
+        }
+
+        modules = {}
+        chapters = {}
+        chapter_ids = list(chapter_modules)
+        chapter_titles = {chapter.id: chapter.title for chapter in chapter_rows}
+        db_module_ids = {module_id for module_id, _ in module_rows}
+
+        for position, chapter_id in enumerate(chapter_ids):
+            mains = main_modules[chapter_id]
+            total = len(mains)
+            summary_url = url_for('chapter', chapter_num=chapter_id, page='summary')
+
+            for ordinal, module_id in enumerate(mains, start=1):
+                subs = sub_modules.get(module_id, [])
+                quiz_ids = tuple(question_ids.get(module_id, ()))
+
+                if ordinal == 1:
+                    prev_url = url_for('chapter', chapter_num=chapter_id, page='intro')
+                else:
+                    prev_url = cls._exit_url(mains[ordinal - 2], sub_modules, question_ids)
+
+                # Where to go after this module (and its quiz) is finished
+                after_url = summary_url if ordinal >= total else url_for('module', module_id=mains[ordinal])
+
+                if subs:
+                    next_url = url_for('module', module_id=subs[0])
+                elif quiz_ids:
+                    next_url = url_for('quiz', module_id=module_id, question_num=1)
+                else:
+                    next_url = after_url
+
+                quiz_nav = tuple(
+                    (
+                        url_for('quiz', module_id=module_id, question_num=n - 1) if n > 1
+                        else url_for('module', module_id=module_id),
+                        url_for('quiz', module_id=module_id, question_num=n + 1) if n < len(quiz_ids)
+                        else after_url
+                    )
+                    for n in range(1, len(quiz_ids) + 1)
+                )
+
+                progress_percent = int((ordinal / total) * 100)
+
+                modules[module_id] = ModuleEntry(
+                    id=module_id,
+                    chapter_id=chapter_id,
+                    parent_id=None,
+                    sub_module_ids=tuple(subs),
+                    in_database=True,
+                    quiz_question_ids=quiz_ids,
+                    progress_percent=progress_percent,
+                    prev_url=prev_url,
+                    next_url=next_url,
+                    after_url=after_url,
+                    quiz_nav=quiz_nav,
+                    quiz_progress_percent=progress_percent,
+                    template_path=cls._template_path(chapter_id, module_id),
+                    page_count=page_counts.get(module_id, 0),
+                )
+
+                for sub_num, sub_id in enumerate(subs, start=1):
+                    if sub_num == 1:
+                        sub_prev_url = url_for('module', module_id=module_id)
+                    else:
+                        sub_prev_url = url_for('module', module_id=subs[sub_num - 2])
+
+                    if sub_num < len(subs):
+                        sub_next_url = url_for('module', module_id=subs[sub_num])
+                    elif quiz_ids:
+                        sub_next_url = url_for('quiz', module_id=module_id, question_num=1)
+                    else:
+                        sub_next_url = after_url
+
+                    # Progress within the parent module's share of the chapter
+                    base_progress = int(((ordinal - 1) / total) * 100)
+                    sub_progress = int((sub_num / len(subs)) * (100 / total))
+
+                    modules[sub_id] = ModuleEntry(
+                        id=sub_id,
+                        chapter_id=chapter_id,
+                        parent_id=module_id,
+                        sub_module_ids=(),
+                        in_database=sub_id in db_module_ids,
+                        quiz_question_ids=(),
+                        progress_percent=base_progress + sub_progress,
+                        prev_url=sub_prev_url,
+                        next_url=sub_next_url,
+                        after_url=after_url,
+                        quiz_nav=(),
+                        quiz_progress_percent=progress_percent,
+                        template_path=cls._template_path(chapter_id, sub_id),
+                        page_count=page_counts.get(sub_id, 0),
+                    )
+
+            first_chapter = position == 0
+            last_chapter = position == len(chapter_ids) - 1
+            page_nav = {
+                'intro': (
+                    url_for('toc') if first_chapter
+                    else url_for('chapter', chapter_num=chapter_ids[position - 1], page='action_items'),
+                    url_for('module', module_id=mains[0]) if mains else summary_url
+                ),
+                'summary': (
+                    url_for('module', module_id=mains[-1]) if mains
+                    else url_for('chapter', chapter_num=chapter_id, page='intro'),
+                    url_for('chapter', chapter_num=chapter_id, page='action_items')
+                ),
+                'action_items': (
+                    summary_url,
+                    url_for('toc') if last_chapter
+                    else url_for('chapter', chapter_num=chapter_ids[position + 1], page='intro')
+                ),
+            }
+
+            chapters[chapter_id] = ChapterEntry(
+                id=chapter_id,
+                title=chapter_titles.get(chapter_id, ''),
+                module_ids=tuple(mains),
+                page_nav=MappingProxyType(page_nav),
+            )
+
+        return cls(
+            version=version,
+            chapters=MappingProxyType(chapters),
+            modules=MappingProxyType(modules),
+            chapter_modules=MappingProxyType({
+                chapter_id: tuple(module_ids) for chapter_id, module_ids in chapter_modules.items()
+            }),
+            quiz_counts=MappingProxyType({
+                module_id: len(question_ids.get(module_id, ())) for module_id in db_module_ids
+            }),
+            module_bits=MappingProxyType(module_bit_positions(db_module_ids)),
+        )
+
+    @staticmethod
+    def _exit_url(module_id, sub_modules, question_ids):
+        """URL of the last page of a module: its last quiz question or last sub-module"""
+        quiz_count = len(question_ids.get(module_id, ()))
+        if quiz_count > 0:
+            return url_for('quiz', module_id=module_id, question_num=quiz_count)
+        if sub_modules.get(module_id):
+            return url_for('module', module_id=sub_modules[module_id][-1])
+        return url_for('module', module_id=module_id)
+
+    @staticmethod
+    def _template_path(chapter_id, module_id):
+        return f"chapters/chapter{chapter_id}/module_{module_id.replace('.', '_')}.html"
+
+
+# ============================================================================
+# PER-WORKER CACHE
+# ============================================================================
+
+_index = None
+_checked_at = None
+_lock = threading.Lock()
+
+
+def get_curriculum_index():
+    """
+    Get the curriculum index for this worker, rebuilding it if the content
+    version changed. The version stamp is checked at most once every
+    CONTENT_VERSION_CHECK_INTERVAL seconds.
+    """
+    global _index, _checked_at
+
+    interval = current_app.config.get('CONTENT_VERSION_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+    if _index is not None and _checked_at is not None and now - _checked_at < interval:
+        return _index
+
+    with _lock:
+        version = get_content_version()
+        if _index is None or _index.version != version:
+            _index = CurriculumIndex.build(version)
+        _checked_at = now
+
+    return _index
+
+
+def invalidate_curriculum_index():
+    """Force the next get_curriculum_index() call to re-check the content version"""
+    global _checked_at
+    _checked_at = None
@@ -2,7 +2,8 @@
 Database Migration Script for Trinity Training Guide
 
 This script extracts data from existing files and populates the database:
-- Chapters, modules, and content from project.md
+- Chapters, modules, and content from project.md (module HTML is compiled
+  from it, see content_compiler.py)
 - Quiz questions from main.py
 - Glossary terms from project.md
 
@@ -27,9 +28,10 @@ sys.path.insert(0, str(Path(__file__).parent))
 from flask import Flask
 from models import (
     db, Chapter, Module, ChapterSection, QuizQuestion, 
-    GlossaryTerm, User, get_or_create_user
+    GlossaryTerm, User, get_or_create_user, bump_content_version
 )
 from config import get_config
+from content_compiler import compile_modules
 from sqlalchemy.exc import OperationalError
 import os
 
@@ -646,6 +648,8 @@ def main():
                 content_migrator = ContentMigrator()
                 content_migrator.migrate_chapters()
                 content_migrator.migrate_modules()
+                compiled, unchanged = compile_modules()
+                print(f"[+] Compiled {compiled} modules to HTML ({unchanged} unchanged)\n")
             
             # Migrate quiz questions
             if migrate_all or args.quizzes_only:
@@ -657,6 +661,10 @@ def main():
                 glossary_migrator = GlossaryMigrator()
                 glossary_migrator.migrate_glossary()
             
+            # Stamp a new content version so running workers rebuild cached content
+            bump_content_version()
+            db.session.commit()
+            
             # Always verify at the end of a full migration
             if migrate_all:
                 verify_migration()
@@ -0,0 +1,295 @@
+"""
+Glossary for Trinity Training Guide
+
+The glossary lives at the end of project.md as "Mod X.X - Term - Definition"
+lines. It is parsed once per worker into an immutable Glossary with
+everything the glossary page needs precomputed (anchor slugs, search text,
+the list without the truck types shown on /trucks).
+
+The parsed glossary is rebuilt when project.md changes (by modification
+time) or the content version stamp changes. Both are checked at most once
+every CONTENT_VERSION_CHECK_INTERVAL seconds. If project.md has no glossary
+section, the terms come from the glossary_terms table instead.
+
+Each Glossary also carries a GlossarySearchIndex for the typeahead search
+(/api/glossary/search): a prefix trie over term names and the words in them,
+and an inverted index of the words in definitions. The last word of a query
+is matched as a prefix, since the trainee is still typing it.
+"""
+
+import bisect
+import heapq
+import itertools
+import math
+import re
+import threading
+import time
+from pathlib import Path
+from types import MappingProxyType
+
+from flask import current_app
+
+from curriculum import _Frozen
+from models import GlossaryTerm, get_content_version
+
+
+PROJECT_MD_PATH = Path(__file__).parent / "project.md"
+
+GLOSSARY_HEADER_PATTERN = re.compile(r'^[ \t]*GLOSSARY OF FREIGHT AGENT TERMS[ \t]*$', re.IGNORECASE | re.MULTILINE)
+
+# Pattern: "Mod X.X - Term Name - Definition"
+# Use " - " (space-hyphen-space) as delimiter to support hyphenated terms like "Less-Than-Truckload"
+TERM_PATTERN = re.compile(r'^(Mod\s+[\d.]+)\s+-\s+(.+?)\s+-\s+(.+)$')
+
+# Truck types are shown on the /trucks page instead
+TRUCK_TERM_NAMES = frozenset({
+    'Dry Van Trailer',
+    'Refrigerated Trailer (Reefer)',
+    'Flatbed Trailer',
+    'Step Deck (Drop Deck) Trailer',
+    'Tanker Trailer',
+    'Box Truck'
+})
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Search ranking weights
+SCORE_EXACT_NAME = 100.0
+SCORE_NAME_PREFIX = 50.0
+SCORE_NAME_WORD = 10.0
+
+
+def term_slug(name):
+    """Anchor ID of a term (e.g., "Step Deck (Drop Deck) Trailer" -> "step-deck-drop-deck-trailer")"""
+    return name.lower().replace(' ', '-').replace('(', '').replace(')', '').replace('/', '-')
+
+
+class GlossaryEntry(_Frozen):
+    """One glossary term"""
+    __slots__ = ('slug', 'name', 'module', 'definition', 'search_text')
+
+    def __repr__(self):
+        return f'<GlossaryEntry {self.name}>'
+
+
+class Glossary(_Frozen):
+    """
+    Immutable snapshot of the glossary.
+
+    Attributes:
+        source: (content version, project.md mtime) the glossary was built from
+        terms: every GlossaryEntry, in glossary order
+        page_terms: terms listed on the glossary page (truck types excluded)
+        by_slug: {slug: GlossaryEntry}
+        search_index: GlossarySearchIndex over all terms
+    """
+    __slots__ = ('source', 'terms', 'page_terms', 'by_slug', 'search_index')
+
+    def __repr__(self):
+        return f'<Glossary {len(self.terms)} terms>'
+
+    @classmethod
+    def build(cls, source, markdown_text):
+        terms = parse_glossary_terms(markdown_text) if markdown_text else []
+        if not terms:
+            terms = [
+                {'module': term.category or '', 'name': term.term, 'definition': term.definition}
+                for term in GlossaryTerm.query.order_by(GlossaryTerm.display_order, GlossaryTerm.id)
+            ]
+
+        entries = tuple(
+            GlossaryEntry(
+                slug=term_slug(term['name']),
+                name=term['name'],
+                module=term['module'],
+                definition=term['definition'],
+                search_text=f"{term['name'].lower()} {term['definition'].lower()}"
+            )
+            for term in terms
+        )
+        return cls(
+            source=source,
+            terms=entries,
+            page_terms=tuple(entry for entry in entries if entry.name not in TRUCK_TERM_NAMES),
+            by_slug=MappingProxyType({entry.slug: entry for entry in entries}),
+            search_index=GlossarySearchIndex(entries)
+        )
+
+
+def extract_glossary(markdown_text):
+    """Get the non-empty lines after the glossary header of project.md"""
+    match = GLOSSARY_HEADER_PATTERN.search(markdown_text)
+    if not match:
+        return ""
+    lines = markdown_text[match.end():].splitlines()
+    return "\n".join(line for line in lines if line.strip()).strip()
+
+
+def parse_glossary_terms(markdown_text):
+    """Parse the glossary of project.md into dicts with module, name and definition"""
+    terms = []
+    for line in extract_glossary(markdown_text).splitlines():
+        match = TERM_PATTERN.match(line.strip())
+        if match:
+            terms.append({
+                'module': match.group(1).strip(),
+                'name': match.group(2).strip(),
+                'definition': match.group(3).strip()
+            })
+    return terms
+
+
+# ============================================================================
+# SEARCH
+# ============================================================================
+
+def tokenize(text):
+    """Lowercase words of a text ("Less-Than-Truckload (LTL)" -> less, than, truckload, ltl)"""
+    return WORD_PATTERN.findall(text.lower())
+
+
+class PrefixTrie:
+    """Maps every prefix of the inserted keys to the IDs of the entries it starts"""
+    __slots__ = ('root',)
+
+    def __init__(self):
+        self.root = ({}, [])  # (children by character, entry IDs)
+
+    def insert(self, key, entry_id):
+        children = self.root[0]
+        for char in key:
+            node = children.get(char)
+            if node is None:
+                node = children[char] = ({}, [])
+            children, ids = node
+            if not ids or ids[-1] != entry_id:
+                ids.append(entry_id)
+
+    def lookup(self, prefix):
+        """IDs of the entries with a key starting with prefix"""
+        node = self.root
+        for char in prefix:
+            node = node[0].get(char)
+            if node is None:
+                return ()
+        return node[1]
+
+
+class GlossarySearchIndex:
+    """
+    Ranked term search. Every query word must match the term's name (as a
+    word prefix) or its definition. Scores favour, in order: the exact name,
+    names starting with the query, names containing the query words, then
+    definitions by TF-IDF of the matched words.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.names = PrefixTrie()
+        self.name_words = PrefixTrie()
+        postings = {}  # word -> {entry ID: occurrences in the definition}
+
+        for entry_id, entry in enumerate(entries):
+            self.names.insert(entry.name.lower(), entry_id)
+            for word in tokenize(entry.name):
+                self.name_words.insert(word, entry_id)
+            for word in tokenize(entry.definition):
+                counts = postings.setdefault(word, {})
+                counts[entry_id] = counts.get(entry_id, 0) + 1
+
+        self.vocabulary = sorted(postings)
+        self.postings = {
+            word: {
+                entry_id: (1 + math.log(count)) * math.log(1 + len(entries) / len(counts))
+                for entry_id, count in counts.items()
+            }
+            for word, counts in postings.items()
+        }
+
+    def _definition_scores(self, word, is_prefix):
+        if not is_prefix:
+            return self.postings.get(word, {})
+        scores = {}
+        start = bisect.bisect_left(self.vocabulary, word)
+        for candidate in itertools.islice(self.vocabulary, start, None):
+            if not candidate.startswith(word):
+                break
+            for entry_id, score in self.postings[candidate].items():
+                scores[entry_id] = max(scores.get(entry_id, 0.0), score)
+        return scores
+
+    def search(self, query, limit=20):
+        """
+        Find terms matching a query.
+
+        Returns:
+            list of (GlossaryEntry, score), best first
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+
+        scores = None
+        for position, word in enumerate(words):
+            word_scores = dict(self._definition_scores(word, is_prefix=position == len(words) - 1))
+            for entry_id in self.name_words.lookup(word):
+                word_scores[entry_id] = word_scores.get(entry_id, 0.0) + SCORE_NAME_WORD
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {
+                    entry_id: score + word_scores[entry_id]
+                    for entry_id, score in scores.items()
+                    if entry_id in word_scores
+                }
+            if not scores:
+                break
+
+        phrase = ' '.join(query.lower().split())
+        for entry_id in self.names.lookup(phrase):
+            bonus = SCORE_EXACT_NAME if self.entries[entry_id].name.lower() == phrase else SCORE_NAME_PREFIX
+            scores[entry_id] = scores.get(entry_id, 0.0) + bonus
+
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], self.entries[item[0]].name))
+        return [(self.entries[entry_id], score) for entry_id, score in ranked]
+
+
+# ============================================================================
+# PER-WORKER CACHE
+# ============================================================================
+
+_glossary = None
+_checked_at = None
+_lock = threading.Lock()
+
+
+def _project_md_mtime():
+    try:
+        return PROJECT_MD_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def get_glossary():
+    """
+    Get this worker's parsed glossary, rebuilding it if project.md or the
+    content version changed.
+    """
+    global _glossary, _checked_at
+
+    interval = current_app.config.get('CONTENT_VERSION_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+    if _glossary is not None and _checked_at is not None and now - _checked_at < interval:
+        return _glossary
+
+    with _lock:
+        source = (get_content_version(), _project_md_mtime())
+        if _glossary is None or _glossary.source != source:
+            try:
+                text = PROJECT_MD_PATH.read_text(encoding="utf-8", errors="ignore")
+            except FileNotFoundError:
+                text = ""
+            _glossary = Glossary.build(source, text)
+        _checked_at = now
+
+    return _glossary
@@ -0,0 +1,245 @@
+"""
+Automatic glossary links for Trinity Training Guide
+
+Module pages link the first mention of each glossary term to the glossary,
+with the same hover tooltip (term and definition) the templates use for
+hand-written links. Trainees no longer have to open the glossary in another
+tab to look a term up.
+
+Terms are found with an Aho-Corasick automaton built once per glossary from
+every spelling of every term: the name, its parts around a parenthesis
+("Less-Than-Truckload" and "LTL" for "Less-Than-Truckload (LTL)"), plurals
+and hyphens written as spaces. One pass over the page finds every spelling
+of every term, however many terms there are.
+
+Only text inside <main> is linked, never inside links, headings, buttons,
+scripts or styles, and only at word boundaries. Terms the template already
+links are left alone. Linking happens when a module page is rendered into
+the page cache, so it runs once per page per content version and glossary.
+"""
+
+import re
+import threading
+from collections import deque
+
+from flask import url_for
+from markupsafe import escape
+
+from glossary import TRUCK_TERM_NAMES, get_glossary
+
+
+# Text inside these elements is never linked
+SKIP_TAGS = frozenset({
+    'a', 'button', 'code', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'label', 'pre', 'script', 'select', 'style', 'svg', 'textarea', 'title'
+})
+
+MIN_ALIAS_LENGTH = 3
+
+TAG_PATTERN = re.compile(r'(<!--.*?-->|<[^>]*>)', re.S)
+TAG_NAME_PATTERN = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)')
+PARENTHESIS_PATTERN = re.compile(r'\s*\(([^)]*)\)\s*')
+LINKED_SLUG_PATTERN = re.compile(r'<a\s[^>]*?href="[^"#]*#([^"]+)"[^>]*class="glossary-term-link"')
+
+LINK_TEMPLATE = (
+    '<a href="{url}" class="glossary-term-link" target="_blank">{text}'
+    '<span class="glossary-tooltip">'
+    '<span class="glossary-tooltip-term">{name}</span>'
+    '<span class="glossary-tooltip-definition">{definition}</span>'
+    '</span></a>'
+)
+
+
+class TermMatcher:
+    """
+    Aho-Corasick automaton: finds every occurrence of a set of patterns in
+    one pass over a text.
+    """
+
+    def __init__(self, patterns):
+        """
+        Args:
+            patterns: {pattern: value}
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]  # per state: (pattern length, value) of the patterns ending there
+
+        for pattern, value in patterns.items():
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] = ((len(pattern), value),)
+
+        # Breadth-first, so a state's failure state is finished before it
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] += self.output[self.fail[next_state]]
+
+    def finditer(self, text):
+        """Yield (start, end, value) for every pattern occurrence, by end position"""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, value in output[state]:
+                yield position + 1 - length, position + 1, value
+
+
+def _plural(alias):
+    if alias.endswith(('s', ')')) or (alias.isupper() and len(alias) <= 3):
+        return None
+    if alias.endswith(('x', 'ch', 'sh')):
+        return alias + 'es'
+    if alias.endswith('y') and alias[-2:-1] not in 'aeiou':
+        return alias[:-1] + 'ies'
+    return alias + 's'
+
+
+def term_aliases(name):
+    """
+    Spellings of a term to link, e.g. "Less-Than-Truckload (LTL)" ->
+    less-than-truckload (ltl), less-than-truckload, ltl, less than truckload, ...
+    """
+    parenthetical = PARENTHESIS_PATTERN.search(name)
+    aliases = [name]
+    if parenthetical:
+        aliases.append(PARENTHESIS_PATTERN.sub(' ', name).strip())
+        aliases.append(parenthetical.group(1).strip())
+
+    spellings = []
+    for alias in aliases:
+        spellings.append(alias)
+        if '-' in alias:
+            spellings.append(alias.replace('-', ' '))
+    spellings += [plural for plural in map(_plural, spellings) if plural]
+
+    return list(dict.fromkeys(
+        spelling.lower() for spelling in spellings if len(spelling) >= MIN_ALIAS_LENGTH
+    ))
+
+
+class GlossaryLinker:
+    """Links the first mention of each glossary term in a page"""
+
+    def __init__(self, source, terms, urls):
+        """
+        Args:
+            source: Source stamp of the glossary the linker was built from
+            terms: GlossaryEntry objects
+            urls: {slug: URL of the term's entry}
+        """
+        self.source = source
+        self.links = {}
+        patterns = {}
+        for term in terms:
+            self.links[term.slug] = (urls[term.slug], escape(term.name), escape(term.definition))
+            for alias in term_aliases(term.name):
+                # Text is matched in its HTML-escaped form, as it appears in the page
+                patterns.setdefault(str(escape(alias)), term.slug)
+        self.matcher = TermMatcher(patterns)
+
+    def __repr__(self):
+        return f'<GlossaryLinker {len(self.links)} terms, {len(self.matcher.goto)} states>'
+
+    def link(self, html):
+        """Return the page with the first mention of each term in <main> linked"""
+        start = html.find('<main')
+        end = html.rfind('</main>')
+        if start == -1 or end < start:
+            return html
+
+        body = html[start:end]
+        linked = set(LINKED_SLUG_PATTERN.findall(body))
+        parts = []
+        skip_depth = 0
+        for i, part in enumerate(TAG_PATTERN.split(body)):
+            if i % 2:
+                tag = TAG_NAME_PATTERN.match(part)
+                if tag and tag.group(2).lower() in SKIP_TAGS and not part.endswith('/>'):
+                    skip_depth = max(0, skip_depth + (-1 if tag.group(1) else 1))
+                parts.append(part)
+            elif skip_depth or not part.strip():
+                parts.append(part)
+            else:
+                parts.append(self._link_text(part, linked))
+
+        return html[:start] + ''.join(parts) + html[end:]
+
+    def _link_text(self, text, linked):
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            lowered = ''.join(c if len(c) == 1 else o for o, c in zip(text, map(str.lower, text)))
+
+        # Leftmost-longest matches at word boundaries
+        chosen = []
+        for match_start, match_end, slug in sorted(
+            self.matcher.finditer(lowered), key=lambda match: (match[0], match[0] - match[1])
+        ):
+            if chosen and match_start < chosen[-1][1]:
+                continue
+            if match_start > 0 and text[match_start - 1].isalnum():
+                continue
+            if match_end < len(text) and text[match_end].isalnum():
+                continue
+            chosen.append((match_start, match_end, slug))
+
+        out = []
+        position = 0
+        for match_start, match_end, slug in chosen:
+            if slug in linked:
+                continue
+            linked.add(slug)
+            url, name, definition = self.links[slug]
+            out.append(text[position:match_start])
+            out.append(LINK_TEMPLATE.format(
+                url=url, text=text[match_start:match_end], name=name, definition=definition
+            ))
+            position = match_end
+        if not out:
+            return text
+        out.append(text[position:])
+        return ''.join(out)
+
+
+# ============================================================================
+# PER-WORKER CACHE
+# ============================================================================
+
+_linker = None
+_linker_lock = threading.Lock()
+
+
+def get_glossary_linker():
+    """Get this worker's linker, rebuilding it when the glossary changes"""
+    global _linker
+
+    glossary = get_glossary()
+    if _linker is not None and _linker.source == glossary.source:
+        return _linker
+
+    with _linker_lock:
+        if _linker is None or _linker.source != glossary.source:
+            urls = {
+                term.slug: url_for('trucks' if term.name in TRUCK_TERM_NAMES else 'glossary', _anchor=term.slug)
+                for term in glossary.terms
+            }
+            _linker = GlossaryLinker(glossary.source, glossary.terms, urls)
+    return _linker
@@ -0,0 +1,120 @@
+"""
+Conditional GET support for Trinity Training Guide
+
+Content pages get an ETag built from:
+- the build ID (modification times of the code, templates, static files and
+  project.md, read once per worker)
+- the content version stamp
+- the page, and the per-user parts of the page (username, preview flag)
+
+Routes compute the ETag after their access checks (login, locks, seen
+intros) but before loading or rendering content, and answer 304 Not Modified
+when the browser already has that version.
+
+Each route has a Cache-Control policy in HTTP_CACHE_POLICIES. All of them are
+private because pages show the user's name. Responses that carry flashed
+messages are never cached, since the message must only be shown once.
+"""
+
+import hashlib
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+from flask import current_app, g, make_response, request, session
+
+
+DEFAULT_POLICY = 'private, no-cache'
+
+# Files whose changes mean a new deploy, relative to the app root
+BUILD_FILE_PATTERNS = ('*.py', 'project.md', 'templates/**/*.html', 'static/**/*')
+
+
+_build = None
+_build_lock = threading.Lock()
+
+
+def get_build_info():
+    """
+    Get (build_id, last_modified) for this deploy, computed once per worker
+    from file modification times.
+    """
+    global _build
+    if _build is None:
+        with _build_lock:
+            if _build is None:
+                root = Path(current_app.root_path)
+                mtimes = sorted(
+                    (str(path.relative_to(root)), path.stat().st_mtime)
+                    for pattern in BUILD_FILE_PATTERNS
+                    for path in root.glob(pattern)
+                    if path.is_file()
+                )
+                build_id = hashlib.sha1(repr(mtimes).encode('utf-8')).hexdigest()[:12]
+                newest = max((mtime for _, mtime in mtimes), default=0)
+                last_modified = datetime.fromtimestamp(int(newest), tz=timezone.utc)
+                _build = (build_id, last_modified)
+    return _build
+
+
+def page_etag(route, *parts):
+    """ETag for a page of a route, covering the deploy and the per-user parts of base.html"""
+    build_id, _ = get_build_info()
+    key = '|'.join(str(part) for part in (
+        route, build_id, session.get('username'), bool(session.get('preview_mode')), *parts
+    ))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+
+
+def _cacheable():
+    """
+    Only GETs without flashed messages are cacheable - a flashed message is
+    shown once, so the browser must never keep it. Decided on first call,
+    before rendering consumes the messages.
+    """
+    if 'http_cacheable' not in g:
+        g.http_cacheable = request.method in ('GET', 'HEAD') and not session.get('_flashes')
+    return g.http_cacheable
+
+
+def not_modified(route, etag, last_modified=None):
+    """
+    Return a 304 response if the browser's copy matches, otherwise None.
+
+    Args:
+        route: Route name, for the Cache-Control policy
+        etag: ETag of the page the route would render
+        last_modified: datetime the content last changed, if known
+    """
+    if not _cacheable():
+        return None
+
+    if request.if_none_match:
+        # Weak comparison: compressed responses carry the ETag as weak
+        matched = request.if_none_match.contains_weak(etag)
+    elif last_modified is not None and request.if_modified_since:
+        matched = last_modified <= request.if_modified_since
+    else:
+        matched = False
+
+    if not matched:
+        return None
+
+    response = make_response('', 304)
+    return with_cache_headers(response, route, etag, last_modified)
+
+
+def with_cache_headers(response, route, etag, last_modified=None):
+    """Add ETag, Last-Modified and the route's Cache-Control policy to a response"""
+    response = make_response(response)
+    if not _cacheable():
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    policies = current_app.config.get('HTTP_CACHE_POLICIES', {})
+    response.headers['Cache-Control'] = policies.get(route, DEFAULT_POLICY)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.vary.add('Cookie')
+    return response
@@ -22,9 +22,11 @@ sys.path.insert(0, str(Path(__file__).parent))
 from flask import Flask
 from models import (
     db, Chapter, Module, ChapterSection, QuizQuestion,
-    GlossaryTerm, User, UserProgress, UserQuizAnswer
+    GlossaryTerm, User, UserProgress, UserQuizAnswer, bump_content_version,
+    rebuild_user_state
 )
 from config import get_config
+from content_compiler import compile_modules
 import os
 
 
@@ -394,6 +396,28 @@ def main():
                 print(f"    [!] Error: {e}")
                 results[table_name] = {'error': str(e)}
 
+        # Compile the markdown of new or changed modules to HTML
+        if 'modules' in results and 'error' not in results['modules']:
+            compiled, unchanged = compile_modules()
+            db.session.commit()
+            print(f"\n[*] Compiled {compiled} modules to HTML ({unchanged} unchanged)")
+
+        # Stamp a new content version so running workers rebuild cached content
+        content_tables = {'chapters', 'modules', 'chapter_sections', 'quiz_questions', 'glossary_terms'}
+        if content_tables & set(results):
+            bump_content_version()
+            db.session.commit()
+
+        # Imported answers and progress bypass the per-user completed-modules
+        # masks - recompute them (same as `flask user-state-rebuild`)
+        user_tables = {'users', 'user_progress', 'user_quiz_answers'}
+        if user_tables & set(results):
+            user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+            for user_id in user_ids:
+                rebuild_user_state(user_id)
+            db.session.commit()
+            print(f"\n[*] Rebuilt progress state for {len(user_ids)} users")
+
         # Summary
         print("\n" + "=" * 60)
         print("IMPORT SUMMARY")
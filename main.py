@@ -1,7 +1,9 @@
-from flask import Flask, render_template, redirect, url_for, request, session, jsonify, flash
-import re
+import time
+BOOT_STARTED = time.perf_counter()  # For the startup time in /metrics/startup
+
+from flask import Flask, render_template, redirect, url_for, request, session, jsonify, flash, g
 import json
-from pathlib import Path
+import threading
 import markdown
 from datetime import datetime
 from dotenv import load_dotenv
@@ -11,11 +13,28 @@ load_dotenv()
 # Database imports
 from models import (
     db, Chapter, Module, ChapterSection, QuizQuestion, 
-    GlossaryTerm, User, get_or_create_user,
+    GlossaryTerm, User, UserState, get_or_create_user, get_user_session_version,
+    bump_content_version, mark_intro_seen,
     get_module_completion_status as db_get_module_completion,
     get_chapter_completion_status as db_get_chapter_completion,
-    update_user_quiz_answer
+    update_user_quiz_answer, update_user_quiz_answers
 )
+from curriculum import get_curriculum_index, invalidate_curriculum_index
+from progress import ProgressSnapshot
+from quiz_bundle import get_module_quiz_bundle, record_quiz_answer, record_quiz_answers
+from answer_writer import AnswerWriter
+from session_store import init_session_store, invalidate_user_sessions
+from page_cache import get_page_cache, render_cached_page
+from glossary import TRUCK_TERM_NAMES, get_glossary
+from glossary_links import get_glossary_linker
+from http_cache import get_build_info, page_etag, not_modified, with_cache_headers
+from static_assets import build_assets, init_static_assets
+from responsive_images import build_images, init_responsive_images
+from critical_css import build_critical_css, init_critical_css
+from search import build_search_index, search_content
+from content_compiler import compile_modules, get_module_page
+from template_cache import init_template_cache
+from compression import compression_stats, init_compression
 from config import get_config
 
 app = Flask(__name__)
@@ -27,32 +46,124 @@ app.config.from_object(config)
 # Initialize database
 db.init_app(app)
 
-PROJECT_MD_PATH = Path(__file__).parent / "project.md"
+# Server-side sessions when SESSION_BACKEND is set (see session_store.py)
+init_session_store(app)
+
+# Content-hashed static URLs once `flask build-assets` has run (see static_assets.py)
+init_static_assets(app)
+
+# Width-bucketed image derivatives from `flask build-images` (see responsive_images.py)
+init_responsive_images(app)
+
+# Inlined above-the-fold CSS from `flask build-critical-css` (see critical_css.py)
+init_critical_css(app)
+
+# Bytecode cache and compile-at-startup for templates (see template_cache.py)
+init_template_cache(app, started=BOOT_STARTED)
+
+# gzip/brotli for HTML and JSON responses (see compression.py)
+init_compression(app)
+
+# Optional buffered answer writes for classroom bursts (see answer_writer.py)
+answer_writer = AnswerWriter(app) if app.config.get('ANSWER_WRITE_QUEUE') else None
 
 # ============================================================================
 # USER SESSION MANAGEMENT
 # ============================================================================
 
+class SessionUser:
+    """
+    The current user as known from the session claim: enough for routes
+    (id, username, preview mode) without loading the users row.
+    """
+    __slots__ = ('id', 'username', 'is_preview_mode')
+
+    def __init__(self, id, username, is_preview_mode):
+        self.id = id
+        self.username = username
+        self.is_preview_mode = bool(is_preview_mode)
+
+    def __repr__(self):
+        return f'<SessionUser {self.username}>'
+
+
+# Per-worker cache of users' session versions: {user_id: (version, checked_at)}
+_user_versions = {}
+_user_versions_lock = threading.Lock()
+
+
+def get_cached_user_version(user_id):
+    """
+    Get a user's session version, re-reading it from the database at most
+    once every USER_VERSION_CHECK_INTERVAL seconds per worker.
+    """
+    interval = app.config.get('USER_VERSION_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+
+    with _user_versions_lock:
+        cached = _user_versions.get(user_id)
+    if cached and now - cached[1] < interval:
+        return cached[0]
+
+    version = get_user_session_version(user_id)
+    with _user_versions_lock:
+        _user_versions[user_id] = (version, now)
+    return version
+
+
+def set_session_value(key, value):
+    """Set a session value only if it changed, so the cookie is not re-sent needlessly"""
+    if session.get(key) != value:
+        session[key] = value
+
+
+def store_user_claim(user):
+    """
+    Cache the user's identity in the session, tagged with the user's
+    session_version so it is dropped once the users row changes.
+    """
+    set_session_value('user_id', user.id)
+    set_session_value('username', user.username)
+    # Database is the source of truth for preview mode
+    set_session_value('preview_mode', bool(user.is_preview_mode))
+    set_session_value('user_claim', {
+        'id': user.id,
+        'username': user.username,
+        'preview': bool(user.is_preview_mode),
+        'v': user.session_version
+    })
+    with _user_versions_lock:
+        _user_versions[user.id] = (user.session_version, time.monotonic())
+
+
 def get_current_user():
     """
     Get or create the current user from session.
     For now, uses anonymous users. Can be extended for authentication later.
+
+    The user is resolved once per request (memoized on flask.g). While the
+    session claim matches the user's session_version, no users row is loaded.
     """
+    if 'current_user' not in g:
+        g.current_user = _resolve_current_user()
+    return g.current_user
+
+
+def _resolve_current_user():
     # Check if user ID is in session
     user_id = session.get('user_id')
     
     if user_id:
+        claim = session.get('user_claim')
+        if claim and claim.get('id') == user_id and claim.get('v') == get_cached_user_version(user_id):
+            user = SessionUser(claim['id'], claim['username'], claim['preview'])
+            set_session_value('preview_mode', user.is_preview_mode)
+            return user
+
         user = User.query.get(user_id)
         if user:
-            # Sync preview_mode from database to session
-            # Database is the source of truth - always sync from database
-            if user.is_preview_mode:
-                session['preview_mode'] = True
-            else:
-                # Clear session preview_mode if database says user shouldn't have it
-                session['preview_mode'] = False
-            session.modified = True
-            return user
+            store_user_claim(user)
+            return SessionUser(user.id, user.username, user.is_preview_mode)
     
     # Check for preview mode
     is_preview = session.get('preview_mode', False)
@@ -64,17 +175,16 @@ def get_current_user():
         username = session.get('username', 'anonymous_user')
     
     user = get_or_create_user(username, is_preview=is_preview)
-    session['user_id'] = user.id
-    session['username'] = user.username
-    
-    # Sync preview_mode from database to session (database is source of truth)
-    if user.is_preview_mode:
-        session['preview_mode'] = True
-    else:
-        session['preview_mode'] = False
-    session.modified = True
+    store_user_claim(user)
     
-    return user
+    return SessionUser(user.id, user.username, user.is_preview_mode)
+
+
+def has_seen_intro(state, chapter_num):
+    """Check the user's state row (and, for older sessions, the session) for a seen chapter intro"""
+    if state is not None and state.has_seen_intro(chapter_num):
+        return True
+    return chapter_num in session.get('seen_intros', [])
 
 
 # ============================================================================
@@ -82,49 +192,6 @@ def get_current_user():
 # ============================================================================
 
 
-def extract_glossary(markdown_text: str):
-    """Extract glossary terms from the markdown."""
-    lines = markdown_text.splitlines()
-    in_glossary = False
-    glossary_lines = []
-    
-    for raw_line in lines:
-        stripped = raw_line.strip()
-        if re.match(r"^GLOSSARY OF FREIGHT AGENT TERMS$", stripped, flags=re.IGNORECASE):
-            in_glossary = True
-            continue
-        if in_glossary and stripped:
-            glossary_lines.append(raw_line)
-    
-    print(f"[extract_glossary] Found {len(glossary_lines)} glossary terms")
-    return "\n".join(glossary_lines).strip()
-
-
-def parse_glossary_terms(markdown_text: str):
-    """Parse glossary into structured term objects."""
-    glossary_text = extract_glossary(markdown_text)
-    terms = []
-    
-    # Pattern: "Mod X.X - Term Name - Definition"
-    # Use " - " (space-hyphen-space) as delimiter to support hyphenated terms like "Less-Than-Truckload"
-    pattern = re.compile(r'^(Mod\s+[\d.]+)\s+-\s+(.+?)\s+-\s+(.+)$')
-    
-    for line in glossary_text.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        match = pattern.match(line)
-        if match:
-            terms.append({
-                'module': match.group(1).strip(),
-                'name': match.group(2).strip(),
-                'definition': match.group(3).strip()
-            })
-    
-    print(f"[parse_glossary_terms] Parsed {len(terms)} structured terms")
-    return terms
-
-
 def get_module_completion_status(session_quiz_answers_or_user_id, module_id):
     """
     Check if all quizzes for a module are completed.
@@ -193,7 +260,12 @@ def cover():
     """Professional cover page"""
     if not session.get('logged_in') and not session.get('preview_mode'):
         return redirect(url_for("login"))
-    return render_template("pages/cover.html")
+
+    etag = page_etag('cover')
+    last_modified = get_build_info()[1]
+    return not_modified('cover', etag, last_modified) or with_cache_headers(
+        render_template("pages/cover.html", critical_layout='cover'), 'cover', etag, last_modified
+    )
 
 
 @app.route("/toc")
@@ -205,81 +277,19 @@ def toc():
     user = get_current_user()
     preview_mode = session.get('preview_mode', False) or (user.is_preview_mode if user else False)
 
-    # Build module completion status
-    module_completion = {}
-    all_modules = Module.query.order_by(Module.id).all()
-    for mod in all_modules:
-        module_completion[mod.id] = get_module_completion_status(user.id, mod.id) if user else False
-
-    # Get chapter completion status
-    chapter_complete = {}
-    for ch_num in range(1, 10):
-        chapter_complete[ch_num] = get_chapter_completion_status(user.id, ch_num) if user else False
-
-    # Build module_locked dictionary
-    module_locked = {}
-    if not preview_mode:
-        # Build chapter_modules dynamically from database (future-proof for new sub-modules)
-        chapter_modules = {}
-        for mod in all_modules:
-            ch_id = mod.chapter_id
-            if ch_id not in chapter_modules:
-                chapter_modules[ch_id] = []
-            chapter_modules[ch_id].append(mod.id)
-
-        # Sort each chapter's modules correctly (e.g., 2.2 before 2.2.1 before 2.3)
-        for ch_id in chapter_modules:
-            chapter_modules[ch_id].sort(key=lambda x: [int(p) for p in x.split('.')])
-
-        for ch_num, modules in chapter_modules.items():
-            prev_chapter_complete = chapter_complete.get(ch_num - 1, True) if ch_num > 1 else True
-            for i, mod_id in enumerate(modules):
-                if i == 0:
-                    # First module of chapter - locked if previous chapter not complete
-                    module_locked[mod_id] = not prev_chapter_complete
-                else:
-                    # Check if this is a sub-module (e.g., 2.2.1)
-                    is_sub_module = len(mod_id.split('.')) == 3
-
-                    if is_sub_module:
-                        # For sub-modules, check if the module BEFORE the parent is complete
-                        # e.g., for 2.2.1, check if 2.1 is complete (not 2.2)
-                        # Sub-modules are content within the parent module - quiz comes AFTER sub-modules
-                        parent_id = '.'.join(mod_id.split('.')[:2])  # "2.2.1" -> "2.2"
-                        parent_idx = modules.index(parent_id) if parent_id in modules else 0
-                        if parent_idx == 0:
-                            # Parent is first module of chapter
-                            module_locked[mod_id] = not prev_chapter_complete
-                        else:
-                            # Check module before the parent
-                            prev_mod_id = modules[parent_idx - 1]
-                            # Skip any sub-modules when looking for the previous main module
-                            while len(prev_mod_id.split('.')) == 3 and parent_idx > 1:
-                                parent_idx -= 1
-                                prev_mod_id = modules[parent_idx - 1]
-                            module_locked[mod_id] = not module_completion.get(prev_mod_id, True)
-                    else:
-                        # Other modules - locked if previous module not complete
-                        prev_mod_id = modules[i - 1]
-                        # Default to True (complete) if not in dict - allows progression for modules without quizzes
-                        module_locked[mod_id] = not module_completion.get(prev_mod_id, True)
-
-    # Build chapter_locked dictionary
-    chapter_locked = {}
+    # The page is cached per content version; only the lock state is per user
+    curriculum = get_curriculum_index()
+    locks = {'module': (), 'chapter': ()}
     if not preview_mode:
-        for ch_num in range(1, 10):
-            if ch_num == 1:
-                chapter_locked[ch_num] = False
-            else:
-                chapter_locked[ch_num] = not chapter_complete.get(ch_num - 1, False)
+        # One snapshot covers lock state for the whole curriculum
+        snapshot = ProgressSnapshot.for_user(user.id, curriculum)
+        locks = {
+            'module': {m for m, locked in snapshot.module_locked.items() if locked},
+            'chapter': {str(c) for c, locked in snapshot.chapter_locked.items() if locked},
+        }
 
-    return render_template(
-        "pages/toc.html",
-        preview_mode=preview_mode,
-        module_completion=module_completion,
-        module_locked=module_locked,
-        chapter_locked=chapter_locked,
-        chapter_complete=chapter_complete
+    return render_cached_page(
+        "pages/toc.html", "toc", curriculum.version, locks=locks, critical_layout='toc'
     )
 
 
@@ -291,70 +301,58 @@ def chapter(chapter_num, page):
     if not session.get('logged_in') and not session.get('preview_mode'):
         return redirect(url_for("login"))
 
-    # Mark chapter intro as seen when user views it
-    if page == 'intro':
-        seen_intros = session.get('seen_intros', [])
-        if chapter_num not in seen_intros:
-            seen_intros.append(chapter_num)
-            session['seen_intros'] = seen_intros
-            session.modified = True
+    # Valid page types
+    valid_pages = ['intro', 'summary', 'action_items']
+    if page not in valid_pages:
+        return redirect(url_for("toc"))
+
+    curriculum = get_curriculum_index()
+    chapter_entry = curriculum.get_chapter(chapter_num)
+    if not chapter_entry:
+        return redirect(url_for("toc"))
 
-    # Check if chapter is locked for non-preview users
     user = get_current_user()
+    state = db.session.get(UserState, user.id)
+
+    # Check if chapter is locked for non-preview users
     preview_mode = session.get('preview_mode', False) or (user.is_preview_mode if user else False)
 
     if not preview_mode and user and chapter_num > 1:
         # Check if previous chapter is complete
-        prev_chapter_complete = get_chapter_completion_status(user.id, chapter_num - 1)
-        if not prev_chapter_complete:
+        if ProgressSnapshot.for_user(user.id, curriculum, state).is_chapter_locked(chapter_num):
             flash("This chapter is locked. Please complete the previous chapter first.", "warning")
             return redirect(url_for("toc"))
 
-    # Chapter titles for progress bar
-    chapter_titles = {
-        1: "Welcome to Freight Brokerage",
-        2: "Understanding the Industry Landscape",
-        3: "The Role of a Freight Agent",
-        4: "Truck Types and Specifications",
-        5: "Load Types and Cargo Categories",
-        6: "Load Restrictions and Regulations",
-        7: "Building Your Customer Base",
-        8: "Sales Strategies for Freight Agents",
-        9: "Effective Follow-Up Systems"
-    }
-
-    # Module counts per chapter
-    module_counts = {1: 6, 2: 9, 3: 9, 4: 11, 5: 10, 6: 11, 7: 5, 8: 9, 9: 9}
+    # Mark chapter intro as seen when user views it
+    if page == 'intro' and not has_seen_intro(state, chapter_num):
+        mark_intro_seen(user.id, chapter_num)
+        db.session.commit()
 
-    # Valid page types
-    valid_pages = ['intro', 'summary', 'action_items']
-    if page not in valid_pages:
-        return redirect(url_for("toc"))
+    etag = page_etag('chapter', curriculum.version, chapter_num, page)
+    response = not_modified('chapter', etag)
+    if response:
+        return response
 
     # Calculate progress (placeholder - can be enhanced with user progress tracking)
     progress_percent = 0
 
     # Navigation URLs
-    if page == 'intro':
-        prev_url = url_for('toc') if chapter_num == 1 else url_for('chapter', chapter_num=chapter_num-1, page='action_items')
-        next_url = url_for('module', module_id=f'{chapter_num}.1')
-    elif page == 'summary':
-        prev_url = url_for('module', module_id=f'{chapter_num}.{module_counts.get(chapter_num, 6)}')
-        next_url = url_for('chapter', chapter_num=chapter_num, page='action_items')
-    elif page == 'action_items':
-        prev_url = url_for('chapter', chapter_num=chapter_num, page='summary')
-        next_url = url_for('chapter', chapter_num=chapter_num+1, page='intro') if chapter_num < 9 else url_for('toc')
+    prev_url, next_url = chapter_entry.page_nav[page]
 
     template_path = f"chapters/chapter{chapter_num}/{page}.html"
 
-    return render_template(
+    html = render_cached_page(
         template_path,
+        f"{chapter_num}/{page}",
+        curriculum.version,
+        critical_layout='chapter',
         chapter_num=chapter_num,
-        chapter_title=chapter_titles.get(chapter_num, ""),
+        chapter_title=chapter_entry.title,
         progress_percent=progress_percent,
         prev_url=prev_url,
         next_url=next_url
     )
+    return with_cache_headers(html, 'chapter', etag)
 
 
 @app.route("/module/<module_id>")
@@ -375,188 +373,92 @@ def module(module_id):
     except (ValueError, IndexError):
         return redirect(url_for("toc"))
 
+    user = get_current_user()
+    state = db.session.get(UserState, user.id)
+
     # If this is the first module (X.1) and user hasn't seen the chapter intro, redirect to intro
     if module_num == 1 and sub_module_num is None:
-        seen_intros = session.get('seen_intros', [])
-        if chapter_num not in seen_intros:
+        if not has_seen_intro(state, chapter_num):
             return redirect(url_for('chapter', chapter_num=chapter_num, page='intro'))
 
+    curriculum = get_curriculum_index()
+    module_entry = curriculum.get_module(module_id)
+    if not module_entry:
+        return redirect(url_for("toc"))
+
     # Check if module is locked for non-preview users
-    user = get_current_user()
     preview_mode = session.get('preview_mode', False) or (user.is_preview_mode if user else False)
 
     if not preview_mode and user:
-        # Get chapter completion status
-        chapter_complete = {}
-        for ch_num in range(1, 10):
-            chapter_complete[ch_num] = get_chapter_completion_status(user.id, ch_num)
-
-        # Get module completion status and build chapter_modules dynamically from DB
-        module_completion = {}
-        chapter_modules = {}
-        all_modules = Module.query.order_by(Module.id).all()
-        for mod in all_modules:
-            module_completion[mod.id] = get_module_completion_status(user.id, mod.id)
-            ch_id = mod.chapter_id
-            if ch_id not in chapter_modules:
-                chapter_modules[ch_id] = []
-            chapter_modules[ch_id].append(mod.id)
-
-        # Sort each chapter's modules correctly (e.g., 2.2 before 2.2.1 before 2.3)
-        for ch_id in chapter_modules:
-            chapter_modules[ch_id].sort(key=lambda x: [int(p) for p in x.split('.')])
-
-        # Check if current module is locked
-        is_locked = False
-        modules_in_chapter = chapter_modules.get(chapter_num, [])
-
-        if module_id in modules_in_chapter:
-            idx = modules_in_chapter.index(module_id)
-            if idx == 0:
-                # First module of chapter - locked if previous chapter not complete
-                prev_chapter_complete = chapter_complete.get(chapter_num - 1, True) if chapter_num > 1 else True
-                is_locked = not prev_chapter_complete
-            else:
-                # Check if this is a sub-module (e.g., 2.2.1)
-                is_sub_module = len(module_id.split('.')) == 3
-
-                if is_sub_module:
-                    # For sub-modules, check if the module BEFORE the parent is complete
-                    # e.g., for 2.2.1, check if 2.1 is complete (not 2.2)
-                    # Sub-modules are content within the parent module - quiz comes AFTER sub-modules
-                    parent_id = '.'.join(module_id.split('.')[:2])  # "2.2.1" -> "2.2"
-                    parent_idx = modules_in_chapter.index(parent_id) if parent_id in modules_in_chapter else 0
-                    if parent_idx == 0:
-                        # Parent is first module of chapter
-                        prev_chapter_complete = chapter_complete.get(chapter_num - 1, True) if chapter_num > 1 else True
-                        is_locked = not prev_chapter_complete
-                    else:
-                        # Check module before the parent
-                        prev_mod_id = modules_in_chapter[parent_idx - 1]
-                        # Skip any sub-modules when looking for the previous main module
-                        while len(prev_mod_id.split('.')) == 3 and parent_idx > 1:
-                            parent_idx -= 1
-                            prev_mod_id = modules_in_chapter[parent_idx - 1]
-                        is_locked = not module_completion.get(prev_mod_id, True)
-                else:
-                    # Not first module - locked if previous module not complete
-                    prev_mod_id = modules_in_chapter[idx - 1]
-                    # Default to True (unlocked) if module not in dict - allows progression for modules without quizzes
-                    is_locked = not module_completion.get(prev_mod_id, True)
+        is_locked = ProgressSnapshot.for_user(user.id, curriculum, state).is_module_locked(module_id)
 
         if is_locked:
             flash("This module is locked. Please complete the previous modules first.", "warning")
             return redirect(url_for("toc"))
 
-    # Chapter titles for progress bar
-    chapter_titles = {
-        1: "Welcome to Freight Brokerage",
-        2: "Understanding the Industry Landscape",
-        3: "The Role of a Freight Agent",
-        4: "Truck Types and Specifications",
-        5: "Load Types and Cargo Categories",
-        6: "Load Restrictions and Regulations",
-        7: "Building Your Customer Base",
-        8: "Sales Strategies for Freight Agents",
-        9: "Effective Follow-Up Systems"
-    }
-
-    # Module counts per chapter
-    module_counts = {1: 6, 2: 9, 3: 9, 4: 11, 5: 10, 6: 11, 7: 5, 8: 9, 9: 9}
-    max_module = module_counts.get(chapter_num, 6)
-
-    # Sub-module configuration: maps parent module to number of sub-modules
-    sub_module_counts = {
-        "2.2": 6,  # Module 2.2 has sub-modules 2.2.1 through 2.2.6
-    }
-
-    parent_module_id = f"{chapter_num}.{module_num}"
-    max_sub_module = sub_module_counts.get(parent_module_id, 0)
-
-    # Calculate progress
-    if sub_module_num:
-        # For sub-modules, calculate progress within the parent module range
-        base_progress = int(((module_num - 1) / max_module) * 100)
-        sub_progress = int((sub_module_num / max_sub_module) * (100 / max_module))
-        progress_percent = base_progress + sub_progress
-    else:
-        progress_percent = int((module_num / max_module) * 100)
+    # Glossary terms are linked as the page is rendered, so it depends on the glossary too
+    linker = get_glossary_linker() if app.config.get('GLOSSARY_AUTOLINK', True) else None
+    stamp = (curriculum.version, linker.source) if linker else curriculum.version
 
-    # Navigation URLs
-    if sub_module_num:
-        # Sub-module navigation
-        if sub_module_num == 1:
-            # First sub-module - previous goes to parent module
-            prev_url = url_for('module', module_id=parent_module_id)
-        else:
-            # Previous sub-module
-            prev_url = url_for('module', module_id=f'{parent_module_id}.{sub_module_num - 1}')
-
-        if sub_module_num >= max_sub_module:
-            # Last sub-module - check if parent module has quiz
-            quiz_count = QuizQuestion.query.filter_by(module_id=parent_module_id).count()
-            if quiz_count > 0:
-                next_url = url_for('quiz', module_id=parent_module_id, question_num=1)
-            elif module_num >= max_module:
-                next_url = url_for('chapter', chapter_num=chapter_num, page='summary')
-            else:
-                next_url = url_for('module', module_id=f'{chapter_num}.{module_num + 1}')
-        else:
-            # Next sub-module
-            next_url = url_for('module', module_id=f'{parent_module_id}.{sub_module_num + 1}')
-    else:
-        # Regular module navigation
-        if module_num == 1:
-            prev_url = url_for('chapter', chapter_num=chapter_num, page='intro')
-        else:
-            # Check if previous module has sub-modules
-            prev_module_id = f'{chapter_num}.{module_num-1}'
-            prev_max_sub = sub_module_counts.get(prev_module_id, 0)
-            if prev_max_sub > 0:
-                # Previous module has sub-modules - check if last sub-module has quiz
-                prev_quiz_count = QuizQuestion.query.filter_by(module_id=prev_module_id).count()
-                if prev_quiz_count > 0:
-                    prev_url = url_for('quiz', module_id=prev_module_id, question_num=prev_quiz_count)
-                else:
-                    prev_url = url_for('module', module_id=f'{prev_module_id}.{prev_max_sub}')
-            else:
-                # Check if previous module has quiz
-                prev_quiz_count = QuizQuestion.query.filter_by(module_id=prev_module_id).count()
-                if prev_quiz_count > 0:
-                    prev_url = url_for('quiz', module_id=prev_module_id, question_num=prev_quiz_count)
-                else:
-                    prev_url = url_for('module', module_id=prev_module_id)
-
-        # Check if this module has sub-modules
-        if max_sub_module > 0:
-            # Has sub-modules - next goes to first sub-module
-            next_url = url_for('module', module_id=f'{parent_module_id}.1')
-        else:
-            # Check if this module has quiz questions
-            quiz_count = QuizQuestion.query.filter_by(module_id=module_id).count()
-
-            if quiz_count > 0:
-                # Has quiz - next goes to quiz
-                next_url = url_for('quiz', module_id=module_id, question_num=1)
-            elif module_num >= max_module:
-                # No quiz, last module - go to summary
-                next_url = url_for('chapter', chapter_num=chapter_num, page='summary')
-            else:
-                # No quiz - go to next module
-                next_url = url_for('module', module_id=f'{chapter_num}.{module_num+1}')
+    etag = page_etag('module', stamp, module_id)
+    response = not_modified('module', etag)
+    if response:
+        return response
 
-    template_path = f"chapters/chapter{chapter_num}/module_{module_id.replace('.', '_')}.html"
+    # Sub-modules share the parent module's quiz
+    parent_entry = curriculum.get_module(module_entry.parent_id) if module_entry.parent_id else module_entry
 
-    return render_template(
-        template_path,
+    html = render_cached_page(
+        module_entry.template_path,
+        module_id,
+        stamp,
+        transform=linker.link if linker else None,
+        critical_layout='module',
         module_id=module_id,
         chapter_num=chapter_num,
-        chapter_title=chapter_titles.get(chapter_num, ""),
-        progress_percent=progress_percent,
-        prev_url=prev_url,
-        next_url=next_url,
-        has_quiz=QuizQuestion.query.filter_by(module_id=parent_module_id if sub_module_num else module_id).count() > 0
+        chapter_title=curriculum.get_chapter(module_entry.chapter_id).title,
+        progress_percent=module_entry.progress_percent,
+        prev_url=module_entry.prev_url,
+        next_url=module_entry.next_url,
+        has_quiz=parent_entry.has_quiz
     )
+    return with_cache_headers(html, 'module', etag)
+
+
+@app.route("/api/module/<module_id>/page/<int:page_num>")
+def module_page(module_id, page_num):
+    """One page of a module's compiled content, with its place in the module ("page 2 of 5")"""
+    if not session.get('logged_in') and not session.get('preview_mode'):
+        return jsonify({'error': 'Not logged in'}), 401
+
+    curriculum = get_curriculum_index()
+    module_entry = curriculum.get_module(module_id)
+    if not module_entry or not 1 <= page_num <= module_entry.page_count:
+        return jsonify({'error': 'Page not found'}), 404
+
+    user = get_current_user()
+    preview_mode = session.get('preview_mode', False) or (user.is_preview_mode if user else False)
+    if not preview_mode and user and ProgressSnapshot.for_user(user.id, curriculum).is_module_locked(module_id):
+        return jsonify({'error': 'This module is locked'}), 403
+
+    etag = page_etag('module_page', curriculum.version, module_id, page_num)
+    response = not_modified('module_page', etag)
+    if response:
+        return response
+
+    page = get_module_page(module_id, page_num)
+    if page is None:  # Recompiled since this worker's index was built
+        return jsonify({'error': 'Page not found'}), 404
+
+    page_count = module_entry.page_count
+    return with_cache_headers(jsonify({
+        'module_id': module_id,
+        'page': page_num,
+        'pages': page_count,
+        'html': page.content_html,
+        'prev_url': url_for('module_page', module_id=module_id, page_num=page_num - 1) if page_num > 1 else None,
+        'next_url': url_for('module_page', module_id=module_id, page_num=page_num + 1) if page_num < page_count else None
+    }), 'module_page', etag)
 
 
 @app.route("/quiz/<module_id>", defaults={'question_num': 1})
@@ -572,81 +474,36 @@ def quiz(module_id, question_num):
     if not user:
         return redirect(url_for("login"))
 
-    # Parse module ID
-    try:
-        parts = module_id.split('.')
-        chapter_num = int(parts[0])
-        module_num = int(parts[1])
-    except (ValueError, IndexError):
+    curriculum = get_curriculum_index()
+    module_entry = curriculum.get_module(module_id)
+    if not module_entry:
         return redirect(url_for("toc"))
 
-    # Chapter titles
-    chapter_titles = {
-        1: "Welcome to Freight Brokerage",
-        2: "Understanding the Industry Landscape",
-        3: "The Role of a Freight Agent",
-        4: "Truck Types and Specifications",
-        5: "Load Types and Cargo Categories",
-        6: "Load Restrictions and Regulations",
-        7: "Building Your Customer Base",
-        8: "Sales Strategies for Freight Agents",
-        9: "Effective Follow-Up Systems"
-    }
-
-    # Module counts per chapter
-    module_counts = {1: 6, 2: 9, 3: 9, 4: 11, 5: 10, 6: 11, 7: 5, 8: 9, 9: 9}
-    max_module = module_counts.get(chapter_num, 6)
-
-    # Get quiz questions for this module
-    db_questions = QuizQuestion.query.filter_by(module_id=module_id).order_by(QuizQuestion.display_order).all()
-
-    if not db_questions:
+    if not module_entry.has_quiz:
         # No quiz questions - go to next module or summary
-        if module_num >= max_module:
-            return redirect(url_for('chapter', chapter_num=chapter_num, page='summary'))
-        else:
-            return redirect(url_for('module', module_id=f'{chapter_num}.{module_num+1}'))
+        return redirect(module_entry.after_url)
+
+    # Questions plus the user's answers for the whole module, cached per worker
+    bundle = get_module_quiz_bundle(user.id, module_id, curriculum.version, get_cached_user_version(user.id))
 
     # Validate question number
-    if question_num < 1 or question_num > len(db_questions):
+    total_questions = min(module_entry.quiz_count, bundle.total_questions)
+    if not total_questions:
+        return redirect(module_entry.after_url)
+    if question_num < 1 or question_num > total_questions:
         return redirect(url_for('quiz', module_id=module_id, question_num=1))
 
     # Get the current question
-    current_question = db_questions[question_num - 1]
-    question_data = current_question.get_shuffled_for_user(user.id)
-    total_questions = len(db_questions)
+    question_data, already_answered, was_correct = bundle.get_question(question_num)
 
     # Navigation
-    prev_url = url_for('quiz', module_id=module_id, question_num=question_num-1) if question_num > 1 else url_for('module', module_id=module_id)
-
-    if question_num >= total_questions:
-        # Last question - next goes to next module or summary
-        if module_num >= max_module:
-            next_url = url_for('chapter', chapter_num=chapter_num, page='summary')
-        else:
-            next_url = url_for('module', module_id=f'{chapter_num}.{module_num+1}')
-    else:
-        next_url = url_for('quiz', module_id=module_id, question_num=question_num+1)
-
-    # Check if user already answered this question
-    from models import UserQuizAnswer
-    existing_answer = UserQuizAnswer.query.filter_by(
-        user_id=user.id,
-        quiz_question_id=current_question.id
-    ).first()
-
-    already_answered = existing_answer and existing_answer.selected_choice is not None
-    was_correct = bool(existing_answer.is_correct) if already_answered else None
-
-    # Add selected_choice to question_data so template can highlight wrong answer
-    if already_answered and existing_answer.selected_choice:
-        question_data['selected_choice'] = existing_answer.selected_choice
+    prev_url, next_url = module_entry.quiz_nav[question_num - 1]
 
     return render_template(
         "pages/quiz.html",
         module_id=module_id,
-        chapter_num=chapter_num,
-        chapter_title=chapter_titles.get(chapter_num, ""),
+        chapter_num=module_entry.chapter_id,
+        chapter_title=curriculum.get_chapter(module_entry.chapter_id).title,
         question=question_data,
         question_num=question_num,
         total_questions=total_questions,
@@ -654,7 +511,7 @@ def quiz(module_id, question_num):
         next_url=next_url,
         already_answered=already_answered,
         was_correct=was_correct,
-        progress_percent=int((module_num / max_module) * 100)
+        progress_percent=module_entry.quiz_progress_percent
     )
 
 
@@ -674,7 +531,10 @@ def submit_quiz(module_id, question_num=1):
     selected_index = int(data.get('selected_index', data.get('answer', 0)))
     answer_order = data.get('answer_order', ['a', 'b', 'c', 'd'])
 
-    if isinstance(answer_order, str):
+    if app.config.get('QUIZ_SHUFFLE_MODE', 'deterministic') == 'deterministic':
+        # Recompute the shuffle order on the server instead of trusting the client
+        answer_order = None
+    elif isinstance(answer_order, str):
         if answer_order.strip():
             try:
                 answer_order = json.loads(answer_order)
@@ -683,15 +543,170 @@ def submit_quiz(module_id, question_num=1):
         else:
             answer_order = ['a', 'b', 'c', 'd']
 
-    result = update_user_quiz_answer(user.id, question_id, selected_index, answer_order)
+    result = None
+    if answer_writer is not None:
+        result = queue_quiz_answer(user.id, module_id, question_id, selected_index, answer_order)
+    if result is None:
+        result = update_user_quiz_answer(user.id, question_id, selected_index, answer_order)
+
+    if result.get('selected_choice'):
+        record_quiz_answer(user.id, result['module_id'], question_id, result['selected_choice'],
+                           result['is_correct'], result['answer_order'])
 
     if request.is_json:
-        return jsonify(result)
+        return jsonify({'is_correct': result['is_correct'], 'explanation': result['explanation']})
     else:
         # For form submission, redirect to next question or next module
         return redirect(url_for('quiz', module_id=module_id, question_num=question_num))
 
 
+def queue_quiz_answer(user_id, module_id, question_id, selected_index, answer_order):
+    """
+    Grade an answer against the cached quiz bundle and hand the write to the
+    answer writer queue.
+
+    Returns:
+        Result dict like update_user_quiz_answer, or None if the answer could
+        not be graded or queued and must be written synchronously
+    """
+    curriculum = get_curriculum_index()
+    if not curriculum.get_module(module_id):
+        return None
+
+    bundle = get_module_quiz_bundle(user_id, module_id, curriculum.version, get_cached_user_version(user_id))
+    try:
+        result = bundle.grade(question_id, selected_index, answer_order)
+    except ValueError:
+        return None
+
+    if not answer_writer.submit(user_id, module_id, [result]):
+        return None
+    if bundle.completes_module([question_id]):
+        # The lock checks read committed progress - unlock the next module now
+        answer_writer.write_user(user_id)
+
+    result['module_id'] = module_id
+    return result
+
+
+def metrics_allowed():
+    """Whether this request may read the /metrics/* endpoints"""
+    if app.config.get('METRICS_ENABLED', False):
+        return True
+    if not session.get('logged_in') and not session.get('preview_mode'):
+        return False
+    user = get_current_user()
+    return session.get('preview_mode', False) or (user.is_preview_mode if user else False)
+
+
+@app.route("/metrics/answer-queue")
+def answer_queue_metrics():
+    """Queue depth and flush timings of this worker's answer writer"""
+    if not metrics_allowed():
+        return jsonify({'error': 'Not found'}), 404
+    if answer_writer is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **answer_writer.stats()})
+
+
+@app.route("/metrics/startup")
+def startup_metrics():
+    """How long this worker took to start and to compile its templates"""
+    if not metrics_allowed():
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(app.extensions.get('template_cache', {}))
+
+
+@app.route("/metrics/page-cache")
+def page_cache_metrics():
+    """Hit/miss counters and size of this worker's rendered-page cache"""
+    if not metrics_allowed():
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({'enabled': app.config.get('PAGE_CACHE_ENABLED', True), **get_page_cache().stats()})
+
+
+@app.route("/metrics/compression")
+def compression_metrics():
+    """Bytes in and out of this worker's compressed responses"""
+    if not metrics_allowed():
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({'enabled': app.config.get('COMPRESSION_ENABLED', True), **compression_stats()})
+
+
+@app.route("/submit-quiz/<module_id>", methods=["POST"])
+def submit_module_quiz(module_id):
+    """
+    Handle submission of several (or all) answers of a module's quiz at once.
+
+    Expects JSON: {"answers": [{"question_id": ..., "selected_index": ...,
+                                "answer_order": [...] (random mode only)}, ...]}
+    Answers are graded against the cached quiz bundle and saved with one
+    multi-row upsert and one completion check.
+    """
+    if not session.get('logged_in') and not session.get('preview_mode'):
+        return jsonify({'error': 'Not logged in'}), 401
+
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'User not found'}), 401
+
+    data = request.get_json(silent=True) or {}
+    answers = data.get('answers')
+    if not isinstance(answers, list) or not answers:
+        return jsonify({'error': 'answers must be a non-empty list'}), 400
+
+    curriculum = get_curriculum_index()
+    if not curriculum.get_module(module_id):
+        return jsonify({'error': 'Module not found'}), 404
+
+    preview_mode = session.get('preview_mode', False) or user.is_preview_mode
+    if not preview_mode and ProgressSnapshot.for_user(user.id, curriculum).is_module_locked(module_id):
+        return jsonify({'error': 'This module is locked'}), 403
+
+    bundle = get_module_quiz_bundle(user.id, module_id, curriculum.version, get_cached_user_version(user.id))
+    random_mode = app.config.get('QUIZ_SHUFFLE_MODE', 'deterministic') != 'deterministic'
+
+    # Grade in memory; a later answer to the same question replaces an earlier one
+    graded = {}
+    for answer in answers:
+        if not isinstance(answer, dict):
+            return jsonify({'error': 'Each answer must be an object'}), 400
+        try:
+            result = bundle.grade(
+                answer.get('question_id'),
+                answer.get('selected_index'),
+                answer.get('answer_order') if random_mode else None
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        graded[result['question_id']] = result
+    graded = list(graded.values())
+
+    if answer_writer is not None and answer_writer.submit(user.id, module_id, graded):
+        module_complete = bundle.completes_module(result['question_id'] for result in graded)
+        if module_complete:
+            # The lock checks read committed progress - unlock the next module now
+            answer_writer.write_user(user.id)
+    else:
+        module_complete = update_user_quiz_answers(user.id, module_id, graded)
+    record_quiz_answers(user.id, module_id, graded)
+
+    correct = sum(1 for result in graded if result['is_correct'])
+    return jsonify({
+        'results': [
+            {
+                'question_id': result['question_id'],
+                'is_correct': result['is_correct'],
+                'explanation': result['explanation']
+            }
+            for result in graded
+        ],
+        'correct': correct,
+        'total': len(graded),
+        'module_complete': module_complete
+    })
+
+
 # ============================================================================
 # END NEW TEMPLATE-BASED ROUTES
 # ============================================================================
@@ -781,28 +796,66 @@ def glossary():
     if not session.get('logged_in') and not session.get('preview_mode'):
         return redirect(url_for("login"))
 
-    try:
-        text = PROJECT_MD_PATH.read_text(encoding="utf-8", errors="ignore")
-    except FileNotFoundError:
-        text = ""
-
-    glossary_terms = parse_glossary_terms(text) if text else []
-
-    # Filter out truck types (they're now on the /trucks page)
-    truck_term_names = {
-        'Dry Van Trailer',
-        'Refrigerated Trailer (Reefer)',
-        'Flatbed Trailer',
-        'Step Deck (Drop Deck) Trailer',
-        'Tanker Trailer',
-        'Box Truck'
-    }
-    glossary_terms = [term for term in glossary_terms if term['name'] not in truck_term_names]
+    glossary_data = get_glossary()
 
-    return render_template(
+    etag = page_etag('glossary', glossary_data.source)
+    last_modified = get_build_info()[1]
+    response = not_modified('glossary', etag, last_modified)
+    if response:
+        return response
+
+    # Truck types are filtered out when the glossary is parsed (they're on the /trucks page)
+    html = render_cached_page(
         "glossary.html",
-        glossary_terms=glossary_terms
+        "glossary",
+        glossary_data.source,
+        glossary_terms=glossary_data.page_terms
     )
+    return with_cache_headers(html, 'glossary', etag, last_modified)
+
+
+@app.route("/api/glossary/search")
+def glossary_search():
+    """Ranked glossary terms matching ?q=, for the glossary page's search box"""
+    if not session.get('logged_in') and not session.get('preview_mode'):
+        return jsonify({'error': 'Not logged in'}), 401
+
+    query = request.args.get('q', '').strip()
+    max_results = app.config.get('GLOSSARY_SEARCH_MAX_RESULTS', 200)
+    limit = min(request.args.get('limit', 20, type=int), max_results)
+
+    glossary_data = get_glossary()
+
+    etag = page_etag('glossary_search', glossary_data.source, query.lower(), limit)
+    response = not_modified('glossary_search', etag)
+    if response:
+        return response
+
+    results = []
+    for term, score in glossary_data.search_index.search(query, limit=max(limit, 0)):
+        # Truck types live on the /trucks page
+        page = 'trucks' if term.name in TRUCK_TERM_NAMES else 'glossary'
+        results.append({
+            'slug': term.slug,
+            'name': term.name,
+            'module': term.module,
+            'definition': term.definition,
+            'url': url_for(page, _anchor=term.slug),
+            'score': round(score, 3)
+        })
+
+    return with_cache_headers(jsonify({'query': query, 'results': results}), 'glossary_search', etag)
+
+
+@app.route("/search")
+def search():
+    """Full-text search across modules, chapter pages, quiz explanations and the glossary"""
+    if not session.get('logged_in') and not session.get('preview_mode'):
+        return redirect(url_for("login"))
+
+    query = request.args.get('q', '').strip()
+    results, total = search_content(query, limit=app.config.get('SEARCH_RESULTS_LIMIT', 20)) if query else ([], 0)
+    return render_template("search.html", query=query, results=results, total=total)
 
 
 @app.route("/trucks")
@@ -812,71 +865,78 @@ def trucks():
     if not session.get('logged_in') and not session.get('preview_mode'):
         return redirect(url_for("login"))
 
+    etag = page_etag('trucks')
+    last_modified = get_build_info()[1]
+    response = not_modified('trucks', etag, last_modified)
+    if response:
+        return response
+
     # Define truck types with their images and definitions
     truck_data = [
         {
             'id': 'dry-van-trailer',
             'name': 'Dry Van Trailer',
             'module': 'Mod 4.2',
-            'image': '/static/images/dry_van.jpeg',
+            'image': 'images/dry_van.jpeg',
             'definition': "The most common trailer in trucking: an enclosed rectangular box (53'×8.5'×9' interior) with 43,000-45,000 lb capacity. Used for palletized goods, boxed retail products, and any general freight not requiring temperature control. Benefits include weather protection, cargo security, and versatility across industries."
         },
         {
             'id': 'refrigerated-trailer-reefer',
             'name': 'Refrigerated Trailer (Reefer)',
             'module': 'Mod 4.2',
-            'image': '/static/images/reefer.jpeg',
+            'image': 'images/reefer.jpeg',
             'definition': "Insulated trailers with self-powered refrigeration units maintaining temperatures from -20°F (frozen) to +70°F (climate-controlled). Capacity 40,000-42,000 lbs. Essential for frozen foods, fresh produce, dairy, meat, pharmaceuticals, and anything temperature-sensitive."
         },
         {
             'id': 'flatbed-trailer',
             'name': 'Flatbed Trailer',
             'module': 'Mod 4.3',
-            'image': '/static/images/flatbed.jpeg',
+            'image': 'images/flatbed.jpeg',
             'definition': "An open platform trailer (48' or 53' long × 8.5' wide × 5' deck height) without sides or roof. Used for lumber, steel, pipe, machinery, construction materials, and anything requiring top or side loading. Freight is secured with chains, straps, and blocking/bracing."
         },
         {
             'id': 'step-deck-drop-deck-trailer',
             'name': 'Step Deck (Drop Deck) Trailer',
             'module': 'Mod 4.4',
-            'image': '/static/images/step_deck.jpeg',
+            'image': 'images/step_deck.jpeg',
             'definition': "A flatbed with two deck levels: the front section sits at standard 5' height for about 10 feet, then 'steps down' to approximately 3.5' off ground for the remaining 43 feet. This design allows freight 10-11 feet tall to stay under the 13.5-14' highway height limit."
         },
         {
             'id': 'tanker-trailer',
             'name': 'Tanker Trailer',
             'module': 'Mod 4.6',
-            'image': '/static/images/tanker.jpeg',
+            'image': 'images/tanker.jpeg',
             'definition': "Cylindrical trailers designed for liquid cargo, with capacities ranging from 5,000-9,000 gallons depending on product density and weight limits. Used for fuel, chemicals, milk, food-grade liquids, and industrial fluids. Tankers are specialized: a fuel tanker can't haul milk."
         },
         {
             'id': 'box-truck',
             'name': 'Box Truck',
             'module': 'Mod 4.2',
-            'image': '/static/images/box_truck.jpeg',
+            'image': 'images/box_truck.jpeg',
             'definition': "A medium-duty truck with an integrated cargo box (typically 12-26 feet long), also called a straight truck or cube van. The cab and cargo area are one unit. Used for local deliveries, LTL consolidation, last-mile delivery, and moving services. Highly maneuverable for urban and residential access."
         },
         {
             'id': 'sprinter-van',
             'name': 'Sprinter Van',
             'module': 'Mod 5.8',
-            'image': '/static/images/sprinter_van.jpeg',
+            'image': 'images/sprinter_van.jpeg',
             'definition': "A cargo van (typically 12-15 feet long with 3,000-5,000 lb capacity) used for expedited hot shot deliveries, small urgent shipments, and last-mile service. Drivers don't need a CDL since these are Class 2-3 vehicles under 10,000 lbs GVWR. Faster and more economical than full trucks for small time-critical freight."
         },
         {
             'id': 'conestoga-trailer',
             'name': 'Conestoga Trailer',
             'module': 'Mod 4.5',
-            'image': '/static/images/conestoga1.jpg',
-            'image2': '/static/images/conestoga2.jpg',
+            'image': 'images/conestoga1.jpg',
+            'image2': 'images/conestoga2.jpg',
             'definition': "A flatbed trailer with a retractable rolling tarp system that slides open for side loading, then closes for weather protection. Combines flatbed accessibility with enclosed trailer protection. Ideal for freight needing forklift side-loading but also requiring protection from weather. Premium of $100-300 over standard flatbed."
         }
     ]
 
-    return render_template(
+    html = render_template(
         "trucks.html",
         trucks=truck_data
     )
+    return with_cache_headers(html, 'trucks', etag, last_modified)
 
 
 @app.route("/login", methods=["GET", "POST"])
@@ -904,7 +964,7 @@ def login():
             session['username'] = user.username
             session['logged_in'] = True
             session['preview_mode'] = user.is_preview_mode  # Explicitly sync from database
-            session['quiz_answers'] = {}
+            store_user_claim(user)
 
             # Update last login
             user.last_login = datetime.utcnow()
@@ -951,7 +1011,7 @@ def register():
             session['username'] = new_user.username
             session['logged_in'] = True
             session['preview_mode'] = False  # New users never have preview mode
-            session['quiz_answers'] = {}
+            store_user_claim(new_user)
 
             return redirect(url_for("toc"))
             
@@ -986,6 +1046,7 @@ def preview():
     # Get or create preview user
     user = get_or_create_user('preview_user', is_preview=True)
     session['user_id'] = user.id
+    store_user_claim(user)
     return redirect(url_for("toc"))
 
 
@@ -1064,7 +1125,9 @@ def add_quiz_question():
         )
         
         db.session.add(new_question)
+        bump_content_version()
         db.session.commit()
+        invalidate_curriculum_index()
         
         return redirect(url_for('quiz_questions', success='Question added successfully!'))
     
@@ -1097,7 +1160,9 @@ def update_quiz_question(question_id):
         question.explanation = request.form.get('explanation')
         question.display_order = int(request.form.get('display_order', 1))
         
+        bump_content_version()
         db.session.commit()
+        invalidate_curriculum_index()
         
         return redirect(url_for('quiz_questions', success='Question updated successfully!'))
     
@@ -1118,7 +1183,9 @@ def delete_quiz_question(question_id):
     try:
         question = QuizQuestion.query.get_or_404(question_id)
         db.session.delete(question)
+        bump_content_version()
         db.session.commit()
+        invalidate_curriculum_index()
         
         return jsonify({'success': True})
     
@@ -1135,6 +1202,7 @@ def delete_quiz_question(question_id):
 #   flask user-password <username> <password> - Change user's password
 #   flask user-list                          - List all users
 #   flask user-delete <username>             - Delete a user
+#   flask user-state-rebuild                 - Recompute progress state for all users
 # ============================================================================
 
 import click
@@ -1175,8 +1243,12 @@ def cli_user_password(username, password):
         return
 
     user.set_password(password)
+    user.bump_session_version()
     db.session.commit()
     click.echo(f"Password updated for user '{username}'.")
+    ended = invalidate_user_sessions(app, user.id)
+    if ended:
+        click.echo(f"Ended {ended} active session(s).")
 
 
 @app.cli.command("user-list")
@@ -1210,8 +1282,10 @@ def cli_user_delete(username):
         click.echo(f"Error: User '{username}' not found.")
         return
 
+    user_id = user.id
     db.session.delete(user)
     db.session.commit()
+    invalidate_user_sessions(app, user_id)
     click.echo(f"User '{username}' deleted.")
 
 
@@ -1237,6 +1311,7 @@ def cli_user_preview(username, enable):
         return
 
     user.is_preview_mode = enable
+    user.bump_session_version()
     db.session.commit()
 
     status = "enabled" if enable else "disabled"
@@ -1280,10 +1355,99 @@ def cli_user_reset(username, confirm):
     # Delete all progress
     UserQuizAnswer.query.filter_by(user_id=user.id).delete()
     UserProgress.query.filter_by(user_id=user.id).delete()
+    UserState.query.filter_by(user_id=user.id).delete()
+    user.bump_session_version()
     db.session.commit()
 
     click.echo(f"All progress reset for user '{username}'.")
-    click.echo("User will need to log out and back in for changes to take effect.")
+    ended = invalidate_user_sessions(app, user.id)
+    if ended is None:
+        click.echo("User will need to log out and back in for changes to take effect.")
+    elif ended:
+        click.echo(f"Ended {ended} active session(s); the user will need to log in again.")
+
+
+@app.cli.command("build-images")
+def cli_build_images():
+    """Write responsive WebP/JPEG derivatives of static/images."""
+    try:
+        manifest, written = build_images(
+            app.static_folder,
+            app.config['RESPONSIVE_IMAGE_WIDTHS'],
+            app.config['RESPONSIVE_IMAGE_QUALITY']
+        )
+    except RuntimeError as e:
+        click.echo(f"Error: {e}")
+        return
+
+    click.echo(f"Derivatives for {len(manifest)} images ({written} files written).")
+    click.echo("Run `flask build-assets` next, then restart the app workers.")
+
+
+@app.cli.command("build-critical-css")
+def cli_build_critical_css():
+    """Extract the above-the-fold CSS of the cover, TOC, chapter and module pages."""
+    try:
+        sizes = build_critical_css(app, app.config['CRITICAL_CSS_FOLD_ELEMENTS'])
+    except RuntimeError as e:
+        click.echo(f"Error: {e}")
+        return
+
+    for layout, size in sizes.items():
+        click.echo(f"  {layout}: {size / 1024:.1f} KB")
+    click.echo("Critical CSS written. Restart the app workers to inline it.")
+
+
+@app.cli.command("build-assets")
+@click.option("--clean", is_flag=True, help="Remove fingerprinted files no longer in the manifest.")
+def cli_build_assets(clean):
+    """Fingerprint and pre-compress static files for immutable caching."""
+    manifest = build_assets(app.static_folder, clean=clean)
+
+    files = set(manifest['assets'].values())
+    shared = len(manifest['assets']) - len(files)
+    click.echo(f"Fingerprinted {len(manifest['assets'])} static files into {len(files)} assets "
+               f"({shared} duplicates shared, {len(manifest['encodings'])} pre-compressed).")
+    click.echo("Restart the app workers to serve the new manifest.")
+
+
+@app.cli.command("compile-content")
+@click.option("--force", is_flag=True, help="Compile every module, not only changed ones.")
+def cli_compile_content(force):
+    """Compile module markdown into Module.rendered_html."""
+    compiled, unchanged = compile_modules(force=force)
+    if compiled:
+        bump_content_version()
+    db.session.commit()
+
+    click.echo(f"Compiled {compiled} modules ({unchanged} unchanged).")
+
+
+@app.cli.command("build-search-index")
+def cli_build_search_index():
+    """Fill the database's full-text search table (SQLite FTS5 / Postgres tsvector)."""
+    try:
+        with app.test_request_context():
+            count = build_search_index()
+    except RuntimeError as e:
+        click.echo(f"Error: {e}")
+        return
+
+    click.echo(f"Indexed {count} documents. Searches use the database from now on.")
+    click.echo("Run this again after content changes - until then the in-memory index is used.")
+
+
+@app.cli.command("user-state-rebuild")
+def cli_user_state_rebuild():
+    """Recompute every user's progress state (e.g. after content changes)."""
+    from models import User, rebuild_user_state
+
+    user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+    for user_id in user_ids:
+        rebuild_user_state(user_id)
+    db.session.commit()
+
+    click.echo(f"Progress state rebuilt for {len(user_ids)} users.")
 
 
 if __name__ == "__main__":
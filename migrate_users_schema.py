@@ -1,8 +1,17 @@
 """
-Migration Script: Make User Fields Nullable in Production Database
+Migration Script: Update the users table in the Production Database
 
-This script modifies the users table in PostgreSQL to allow NULL values
-for optional fields: first_name, last_name, employee_id, email, password_hash, last_login
+This script modifies the users table in PostgreSQL to:
+- allow NULL values for optional fields: first_name, last_name, employee_id,
+  email, password_hash, last_login
+- add the session_version column (used to validate user data cached in sessions)
+- create the user_state table (bitmasks of completed modules and seen intros)
+- create the content_version table (stamp bumped whenever content changes)
+- add the rendered_html and content_hash columns to the modules table and
+  create the module_pages table (compiled module HTML and its pages, see
+  content_compiler.py)
+- create the user_sessions table (server-side sessions, used with
+  SESSION_BACKEND=database, see session_store.py)
 
 Usage:
     python migrate_users_schema.py                    # Preview changes (dry-run)
@@ -65,6 +74,62 @@ def check_current_schema(engine):
         return columns
 
 
+def user_state_table_exists(engine):
+    """Check whether the user_state table has been created"""
+    return inspect(engine).has_table('user_state')
+
+
+def module_columns(engine):
+    """Names of the columns of the modules table"""
+    return {column['name'] for column in inspect(engine).get_columns('modules')}
+
+
+# Compiled module HTML (see content_compiler.py)
+MODULE_COLUMNS_SQL = {
+    'rendered_html': "ALTER TABLE modules ADD COLUMN rendered_html TEXT;",
+    'content_hash': "ALTER TABLE modules ADD COLUMN content_hash VARCHAR(64);",
+}
+
+
+MODULE_PAGES_TABLE_SQL = """CREATE TABLE IF NOT EXISTS module_pages (
+    module_id VARCHAR(10) NOT NULL REFERENCES modules(id) ON DELETE CASCADE,
+    page_num INTEGER NOT NULL,
+    line_start INTEGER NOT NULL,
+    line_end INTEGER NOT NULL,
+    content_html TEXT NOT NULL,
+    PRIMARY KEY (module_id, page_num)
+);"""
+
+
+CONTENT_VERSION_TABLE_SQL = """CREATE TABLE IF NOT EXISTS content_version (
+    id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);"""
+
+
+USER_STATE_TABLE_SQL = """CREATE TABLE IF NOT EXISTS user_state (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    completed_modules VARCHAR(128) NOT NULL DEFAULT '0',
+    content_version INTEGER,
+    seen_intros BIGINT NOT NULL DEFAULT 0
+);"""
+
+
+# Server-side sessions (see session_store.py)
+USER_SESSIONS_TABLE_SQL = """CREATE TABLE IF NOT EXISTS user_sessions (
+    id VARCHAR(64) PRIMARY KEY,
+    user_id INTEGER,
+    data TEXT NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);"""
+
+USER_SESSIONS_INDEXES_SQL = (
+    "CREATE INDEX IF NOT EXISTS idx_user_sessions_user_id ON user_sessions(user_id);",
+    "CREATE INDEX IF NOT EXISTS idx_user_sessions_expires_at ON user_sessions(expires_at);",
+)
+
+
 def migrate_schema(engine, apply=False):
     """Migrate users table schema to allow NULL values"""
     
@@ -101,20 +166,73 @@ def migrate_schema(engine, apply=False):
             else:
                 print(f"   {field:20} - NOT FOUND")
         
-        if not changes_needed:
-            print("\n[SUCCESS] All fields already allow NULL values!")
+        statements = [
+            f"ALTER TABLE users ALTER COLUMN {field} DROP NOT NULL;"
+            for field in changes_needed
+        ]
+        
+        if 'session_version' in current_schema:
+            print(f"   {'session_version':20} - present")
+        else:
+            print(f"   {'session_version':20} - NOT FOUND")
+            statements.append(
+                "ALTER TABLE users ADD COLUMN session_version INTEGER NOT NULL DEFAULT 1;"
+            )
+        
+        has_user_state = user_state_table_exists(engine)
+        print(f"   {'user_state table':20} - {'present' if has_user_state else 'NOT FOUND'}")
+        if not has_user_state:
+            statements.append(USER_STATE_TABLE_SQL)
+        
+        has_content_version = inspect(engine).has_table('content_version')
+        print(f"   {'content_version table':20} - {'present' if has_content_version else 'NOT FOUND'}")
+        if not has_content_version:
+            statements.append(CONTENT_VERSION_TABLE_SQL)
+        
+        missing_module_columns = [
+            column for column in MODULE_COLUMNS_SQL if column not in module_columns(engine)
+        ]
+        for column in MODULE_COLUMNS_SQL:
+            print(f"   {'modules.' + column:20} - {'NOT FOUND' if column in missing_module_columns else 'present'}")
+            if column in missing_module_columns:
+                statements.append(MODULE_COLUMNS_SQL[column])
+        
+        has_module_pages = inspect(engine).has_table('module_pages')
+        print(f"   {'module_pages table':20} - {'present' if has_module_pages else 'NOT FOUND'}")
+        if not has_module_pages:
+            statements.append(MODULE_PAGES_TABLE_SQL)
+        
+        has_user_sessions = inspect(engine).has_table('user_sessions')
+        print(f"   {'user_sessions table':20} - {'present' if has_user_sessions else 'NOT FOUND'}")
+        if not has_user_sessions:
+            statements.append(USER_SESSIONS_TABLE_SQL)
+            statements.extend(USER_SESSIONS_INDEXES_SQL)
+        
+        if not statements:
+            print("\n[SUCCESS] Users table is up to date!")
             print("   No migration needed.")
             return
         
-        print(f"\n[*] Found {len(changes_needed)} fields that need to be modified:")
+        print(f"\n[*] Found {len(statements)} changes to make:")
         for field in changes_needed:
-            print(f"   • {field}")
+            print(f"   • {field} (allow NULL)")
+        if 'session_version' not in current_schema:
+            print("   • session_version (add column)")
+        if not has_user_state:
+            print("   • user_state (create table)")
+        if not has_content_version:
+            print("   • content_version (create table)")
+        for column in missing_module_columns:
+            print(f"   • modules.{column} (add column)")
+        if not has_module_pages:
+            print("   • module_pages (create table)")
+        if not has_user_sessions:
+            print("   • user_sessions (create table and indexes)")
         
         if not apply:
             print("\n[DRY RUN] Would execute the following SQL:")
             print()
-            for field in changes_needed:
-                sql = f"ALTER TABLE users ALTER COLUMN {field} DROP NOT NULL;"
+            for sql in statements:
                 print(f"   {sql}")
             print("\nRun with --apply to execute these changes.")
             return
@@ -126,8 +244,7 @@ def migrate_schema(engine, apply=False):
             trans = conn.begin()
             
             try:
-                for field in changes_needed:
-                    sql = f"ALTER TABLE users ALTER COLUMN {field} DROP NOT NULL;"
+                for sql in statements:
                     print(f"   Executing: {sql}")
                     conn.execute(text(sql))
                 
@@ -148,9 +265,42 @@ def migrate_schema(engine, apply=False):
                         else:
                             print(f"   [OK] {field} is now nullable")
                 
+                if 'session_version' in new_schema:
+                    print("   [OK] session_version column present")
+                else:
+                    all_nullable = False
+                    print("   [WARNING] session_version column still missing!")
+                if user_state_table_exists(engine):
+                    print("   [OK] user_state table present")
+                else:
+                    all_nullable = False
+                    print("   [WARNING] user_state table still missing!")
+                if inspect(engine).has_table('content_version'):
+                    print("   [OK] content_version table present")
+                else:
+                    all_nullable = False
+                    print("   [WARNING] content_version table still missing!")
+                if set(MODULE_COLUMNS_SQL) <= module_columns(engine):
+                    print("   [OK] modules.rendered_html and modules.content_hash present")
+                else:
+                    all_nullable = False
+                    print("   [WARNING] modules columns still missing!")
+                if inspect(engine).has_table('module_pages'):
+                    print("   [OK] module_pages table present")
+                else:
+                    all_nullable = False
+                    print("   [WARNING] module_pages table still missing!")
+                if inspect(engine).has_table('user_sessions'):
+                    print("   [OK] user_sessions table present")
+                else:
+                    all_nullable = False
+                    print("   [WARNING] user_sessions table still missing!")
+                
                 if all_nullable:
-                    print("\n[SUCCESS] All fields are now nullable!")
+                    print("\n[SUCCESS] Users table migration completed!")
                     print("   You can now run: python sync_to_production.py")
+                    if missing_module_columns or not has_module_pages:
+                        print("   Then compile module HTML: flask compile-content")
                 
             except Exception as e:
                 trans.rollback()
@@ -175,7 +325,7 @@ def migrate_schema(engine, apply=False):
 def main():
     """Main entry point"""
     parser = argparse.ArgumentParser(
-        description='Migrate users table schema to allow NULL values'
+        description='Migrate users table schema (nullable fields, session_version column, user_state, content_version and user_sessions tables, compiled module columns and pages)'
     )
     parser.add_argument(
         '--apply',
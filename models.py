@@ -5,14 +5,38 @@ This module defines all SQLAlchemy models for the training application.
 Supports both SQLite (development) and PostgreSQL (production).
 """
 
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+import hashlib
+import hmac
+import itertools
 import json
 import random
 
 db = SQLAlchemy()
 
+# All 24 orderings of the four answer letters, in a fixed order
+ANSWER_PERMUTATIONS = [list(p) for p in itertools.permutations('abcd')]
+
+
+def deterministic_answer_order(user_id, question_id, attempt=0):
+    """
+    Get the shuffled answer order for a user and question from a keyed hash of
+    (secret, user_id, question_id, attempt). The same inputs always give the
+    same order, so it can be recomputed on both GET and submit without storing it.
+    """
+    secret = current_app.config.get('QUIZ_SHUFFLE_SECRET') or current_app.config['SECRET_KEY']
+    message = f'{user_id}:{question_id}:{attempt}'.encode('utf-8')
+    digest = hmac.new(secret.encode('utf-8'), message, hashlib.sha256).digest()
+    return list(ANSWER_PERMUTATIONS[int.from_bytes(digest[:8], 'big') % len(ANSWER_PERMUTATIONS)])
+
 
 class Chapter(db.Model):
     """Represents a training chapter (e.g., Chapter 1: Understanding Your Role)"""
@@ -51,6 +75,8 @@ class Module(db.Model):
     chapter_id = db.Column(db.Integer, db.ForeignKey('chapters.id'), nullable=False)
     title = db.Column(db.String(255), nullable=False)
     content_markdown = db.Column(db.Text)
+    rendered_html = db.Column(db.Text)  # content_markdown compiled by content_compiler.py
+    content_hash = db.Column(db.String(64))  # what rendered_html was compiled from
     display_order = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -61,6 +87,9 @@ class Module(db.Model):
                                     cascade='all, delete-orphan')
     user_progress = db.relationship('UserProgress', back_populates='module',
                                    cascade='all, delete-orphan')
+    pages = db.relationship('ModulePage', back_populates='module',
+                            order_by='ModulePage.page_num',
+                            cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Module {self.id}: {self.title}>'
@@ -76,6 +105,26 @@ class Module(db.Model):
         }
 
 
+class ModulePage(db.Model):
+    """
+    One screen of a module's content, as paginated by content_compiler.py.
+    Rewritten whenever the module's content_hash changes.
+    """
+    __tablename__ = 'module_pages'
+    
+    module_id = db.Column(db.String(10), db.ForeignKey('modules.id', ondelete='CASCADE'), primary_key=True)
+    page_num = db.Column(db.Integer, primary_key=True)  # 1-based
+    line_start = db.Column(db.Integer, nullable=False)  # first line of content_markdown on the page
+    line_end = db.Column(db.Integer, nullable=False)  # line after the page's last line
+    content_html = db.Column(db.Text, nullable=False)
+    
+    # Relationships
+    module = db.relationship('Module', back_populates='pages')
+    
+    def __repr__(self):
+        return f'<ModulePage {self.module_id} p{self.page_num}>'
+
+
 class ChapterSection(db.Model):
     """Represents chapter intro, summary, or action items"""
     __tablename__ = 'chapter_sections'
@@ -136,11 +185,26 @@ class QuizQuestion(db.Model):
             'd': self.choice_d
         }
     
+    def get_answer_order(self, user_id, user_answer=None):
+        """
+        Get the shuffle order for a user without writing to the database.
+        Uses the stored order if the user already has one, otherwise the
+        deterministic order. Returns None in 'random' shuffle mode when
+        no order has been stored yet.
+        """
+        if user_answer and user_answer.answer_order:
+            return json.loads(user_answer.answer_order)
+        if current_app.config.get('QUIZ_SHUFFLE_MODE', 'deterministic') == 'deterministic':
+            return deterministic_answer_order(user_id, self.id)
+        return None
+    
     def get_shuffled_for_user(self, user_id):
         """
         Get quiz question with shuffled answers for a specific user.
         If user has already seen this question, returns the same shuffle order.
-        Otherwise, generates and saves a new random order.
+        Otherwise, in 'deterministic' shuffle mode (the default) the order is
+        derived from a keyed hash and nothing is written; in 'random' mode a
+        new random order is generated and saved.
         
         Returns:
             dict with keys: id, question, choices (list), correct_index, 
@@ -152,10 +216,8 @@ class QuizQuestion(db.Model):
             quiz_question_id=self.id
         ).first()
         
-        if user_answer and user_answer.answer_order:
-            # Use existing shuffle order
-            order = json.loads(user_answer.answer_order)
-        else:
+        order = self.get_answer_order(user_id, user_answer)
+        if order is None:
             # Generate new random order
             order = ['a', 'b', 'c', 'd']
             random.shuffle(order)
@@ -202,12 +264,16 @@ class User(db.Model):
     is_preview_mode = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime)
+    # Bumped whenever data cached in the user's session goes stale
+    # (username, preview mode, password, progress reset)
+    session_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     # Relationships
     progress = db.relationship('UserProgress', back_populates='user',
                               cascade='all, delete-orphan')
     quiz_answers = db.relationship('UserQuizAnswer', back_populates='user',
                                   cascade='all, delete-orphan')
+    state = db.relationship('UserState', uselist=False, cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -220,6 +286,10 @@ class User(db.Model):
         """Check if the provided password matches the hash"""
         return check_password_hash(self.password_hash, password)
     
+    def bump_session_version(self):
+        """Invalidate the user data cached in this user's sessions. Does not commit."""
+        self.session_version = (self.session_version or 0) + 1
+    
     def to_dict(self):
         """Convert to dictionary for JSON serialization"""
         return {
@@ -282,16 +352,44 @@ class UserProgress(db.Model):
         return f'<UserProgress user={self.user_id} module={self.module_id} completed={self.completed}>'
     
     def mark_complete(self):
-        """Mark this module as completed"""
+        """Mark this module as completed. The caller commits."""
         self.completed = True
         self.completion_date = datetime.utcnow()
-        db.session.commit()
     
     def mark_incomplete(self):
-        """Mark this module as incomplete (for resets)"""
+        """Mark this module as incomplete (for resets). The caller commits."""
         self.completed = False
         self.completion_date = None
-        db.session.commit()
+
+
+class UserState(db.Model):
+    """
+    Compact per-user progress state, kept in step with the answers by
+    record_module_completion:
+    - completed_modules: hex bitmask, bit N set if the module with ordinal N
+      (see module_bit_positions) is complete. Only valid for content_version.
+    - seen_intros: bitmask, bit N set once the intro of chapter N was viewed
+    """
+    __tablename__ = 'user_state'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    completed_modules = db.Column(db.String(128), nullable=False, default='0')
+    content_version = db.Column(db.Integer)
+    seen_intros = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<UserState user={self.user_id} v{self.content_version}>'
+    
+    @property
+    def completed_mask(self):
+        return int(self.completed_modules or '0', 16)
+    
+    @completed_mask.setter
+    def completed_mask(self, mask):
+        self.completed_modules = format(mask, 'x')
+    
+    def has_seen_intro(self, chapter_id):
+        return bool((self.seen_intros or 0) >> chapter_id & 1)
 
 
 class UserQuizAnswer(db.Model):
@@ -354,6 +452,31 @@ class GlossaryTerm(db.Model):
         }
 
 
+class ContentVersion(db.Model):
+    """Single-row stamp bumped whenever training content changes"""
+    __tablename__ = 'content_version'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ContentVersion {self.version}>'
+
+
+class UserSession(db.Model):
+    """Server-side session data (see session_store.DatabaseSessionBackend)"""
+    __tablename__ = 'user_sessions'
+    
+    id = db.Column(db.String(64), primary_key=True)  # Opaque session ID from the cookie
+    user_id = db.Column(db.Integer, index=True)  # Lets all of a user's sessions be ended at once
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<UserSession user={self.user_id} expires={self.expires_at}>'
+
+
 # Helper functions for common queries
 
 def get_or_create_user(username, is_preview=False):
@@ -366,24 +489,108 @@ def get_or_create_user(username, is_preview=False):
     return user
 
 
+def get_user_session_version(user_id):
+    """Get a user's session version, or None if the user does not exist"""
+    return db.session.query(User.session_version).filter_by(id=user_id).scalar()
+
+
+def module_sort_key(module_id):
+    """Sort key for module IDs so that 2.2 < 2.2.1 < 2.3 < 2.10"""
+    return [int(p) for p in module_id.split('.')]
+
+
+def module_bit_positions(module_ids):
+    """Assign each module its bit in UserState.completed_modules: its ordinal in course order"""
+    return {module_id: bit for bit, module_id in enumerate(sorted(module_ids, key=module_sort_key))}
+
+
+# Bit positions for the current content version, cached per worker: (version, {module_id: bit})
+_module_bits = (None, {})
+
+
+def get_module_bits(version):
+    """Get module bit positions for a content version (one query when the version changes)"""
+    global _module_bits
+    cached_version, bits = _module_bits
+    if cached_version != version:
+        bits = module_bit_positions([module_id for (module_id,) in db.session.query(Module.id)])
+        _module_bits = (version, bits)
+    return bits
+
+
+def get_content_version():
+    """
+    Get the current content version stamp.
+    Returns 0 if content has never been stamped (or the table doesn't exist yet).
+
+    Read inside a savepoint, so a failed read (e.g. a missing table) rolls
+    back only the savepoint, never the caller's pending work.
+    """
+    try:
+        with db.session.begin_nested():
+            version = db.session.execute(
+                select(ContentVersion.version).where(ContentVersion.id == 1)
+            ).scalar()
+    except SQLAlchemyError:
+        return 0
+    return version or 0
+
+
+def bump_content_version(session=None):
+    """
+    Increment the content version stamp. Call this whenever chapters, modules,
+    sections, quiz questions or glossary terms change. The caller commits.
+
+    Args:
+        session: Session to use instead of db.session (e.g. a session bound to
+                 another database, as in sync_to_production.py)
+    """
+    session = session or db.session
+    stamp = session.get(ContentVersion, 1)
+    if not stamp:
+        stamp = ContentVersion(id=1, version=1)
+        session.add(stamp)
+    else:
+        stamp.version = ContentVersion.version + 1
+    return stamp
+
+
+def count_answered_questions(user_id, module_id):
+    """Count the quiz questions in a module that a user has answered"""
+    return UserQuizAnswer.query.join(QuizQuestion).filter(
+        UserQuizAnswer.user_id == user_id,
+        QuizQuestion.module_id == module_id,
+        UserQuizAnswer.selected_choice.isnot(None)
+    ).count()
+
+
 def get_module_completion_status(user_id, module_id):
-    """Check if a user has completed a module (all quizzes answered, regardless of correctness)"""
+    """
+    Check if a user has completed a module (all quizzes answered, regardless of correctness).
+    Read-only: completion is recorded by update_user_quiz_answer when answers are submitted.
+    """
     module = Module.query.get(module_id)
     if not module:
         return True  # Module doesn't exist in DB - allow progression
-    if not module.quiz_questions:
+
+    quiz_count = QuizQuestion.query.filter_by(module_id=module_id).count()
+    if quiz_count == 0:
         return True  # No quizzes for this module - considered complete
 
-    for quiz in module.quiz_questions:
-        answer = UserQuizAnswer.query.filter_by(
-            user_id=user_id,
-            quiz_question_id=quiz.id
-        ).first()
+    return count_answered_questions(user_id, module_id) >= quiz_count
 
-        if not answer or answer.selected_choice is None:
-            return False
 
-    # All quizzes answered - ensure progress record exists
+def record_module_completion(user_id, module_id):
+    """
+    Create or update the user's progress record if the module is now complete.
+    Does not commit - call this inside the answer-submission transaction.
+
+    Returns:
+        True if the module is complete
+    """
+    if not get_module_completion_status(user_id, module_id):
+        return False
+
     progress = UserProgress.query.filter_by(
         user_id=user_id,
         module_id=module_id
@@ -397,13 +604,135 @@ def get_module_completion_status(user_id, module_id):
             completion_date=datetime.utcnow()
         )
         db.session.add(progress)
-        db.session.commit()
     elif not progress.completed:
         progress.mark_complete()
     
+    set_module_complete_in_state(user_id, module_id)
     return True
 
 
+def compute_completed_mask(user_id, bits):
+    """
+    Compute a user's completed-modules bitmask from their answers with two
+    aggregate queries. Modules without quizzes count as complete.
+    """
+    quiz_counts = dict(
+        db.session.query(QuizQuestion.module_id, func.count(QuizQuestion.id))
+        .group_by(QuizQuestion.module_id)
+        .all()
+    )
+    answered_counts = dict(
+        db.session.query(QuizQuestion.module_id, func.count(UserQuizAnswer.id))
+        .join(UserQuizAnswer, UserQuizAnswer.quiz_question_id == QuizQuestion.id)
+        .filter(
+            UserQuizAnswer.user_id == user_id,
+            UserQuizAnswer.selected_choice.isnot(None)
+        )
+        .group_by(QuizQuestion.module_id)
+        .all()
+    )
+
+    mask = 0
+    for module_id, bit in bits.items():
+        if answered_counts.get(module_id, 0) >= quiz_counts.get(module_id, 0):
+            mask |= 1 << bit
+    return mask
+
+
+def _lock_user_state(user_id):
+    """
+    Get the user's state row locked for the rest of the transaction, creating
+    it first if needed. FOR UPDATE cannot lock a row that does not exist yet,
+    so the row is created with an insert that ignores a concurrent insert of
+    the same row (the same dialect-specific upserts as mark_intro_seen).
+    """
+    table = UserState.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        db.session.execute(insert(table).values(user_id=user_id).on_conflict_do_nothing(index_elements=['user_id']))
+    elif dialect in ('mysql', 'mariadb'):
+        stmt = mysql_insert(table).values(user_id=user_id)
+        db.session.execute(stmt.on_duplicate_key_update(user_id=stmt.inserted.user_id))
+    elif db.session.query(UserState.user_id).filter_by(user_id=user_id).first() is None:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(user_id=user_id))
+        except IntegrityError:
+            pass  # Inserted concurrently
+
+    return db.session.query(UserState).filter_by(user_id=user_id).with_for_update().populate_existing().one()
+
+
+def set_module_complete_in_state(user_id, module_id):
+    """
+    Set a module's completion bit in the user's state row, locking the row
+    for the rest of the transaction. If the row was computed for an older
+    content version, the whole mask is recomputed. Does not commit.
+    """
+    version = get_content_version()
+    bits = get_module_bits(version)
+
+    state = _lock_user_state(user_id)
+
+    if state.content_version == version and module_id in bits:
+        state.completed_mask = state.completed_mask | (1 << bits[module_id])
+    else:
+        state.completed_mask = compute_completed_mask(user_id, bits)
+        state.content_version = version
+    return state
+
+
+def rebuild_user_state(user_id):
+    """Recompute a user's completed-modules bitmask from their answers. Does not commit."""
+    version = get_content_version()
+    state = _lock_user_state(user_id)
+    state.completed_mask = compute_completed_mask(user_id, get_module_bits(version))
+    state.content_version = version
+    return state
+
+
+# seen_intros is a signed 64-bit column
+MAX_INTRO_CHAPTER_ID = 62
+
+
+def mark_intro_seen(user_id, chapter_id):
+    """
+    Set a chapter's bit in the user's seen_intros mask with a single atomic
+    upsert (creating the state row if needed). Does not commit.
+
+    Raises:
+        ValueError: chapter_id does not fit in the mask (callers pass only
+                    IDs of existing chapters)
+    """
+    if not 0 <= chapter_id <= MAX_INTRO_CHAPTER_ID:
+        raise ValueError(f"Chapter ID {chapter_id} does not fit in seen_intros")
+
+    bit = 1 << chapter_id
+    table = UserState.__table__
+    seen = table.c.seen_intros.op('|')(bit)
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        stmt = insert(table).values(user_id=user_id, seen_intros=bit)
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['user_id'], set_={'seen_intros': seen}))
+    elif dialect in ('mysql', 'mariadb'):
+        stmt = mysql_insert(table).values(user_id=user_id, seen_intros=bit)
+        db.session.execute(stmt.on_duplicate_key_update(seen_intros=seen))
+    else:
+        # No native upsert - a concurrent first view may insert the row
+        # between our UPDATE and INSERT, so retry the UPDATE if it did
+        update = table.update().where(table.c.user_id == user_id).values(seen_intros=seen)
+        if not db.session.execute(update).rowcount:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(user_id=user_id, seen_intros=bit))
+            except IntegrityError:
+                db.session.execute(update)
+
+
 def get_chapter_completion_status(user_id, chapter_id):
     """Check if all modules in a chapter are completed"""
     chapter = Chapter.query.get(chapter_id)
@@ -417,6 +746,78 @@ def get_chapter_completion_status(user_id, chapter_id):
     return True
 
 
+def quiz_answer_row(user_id, graded_answer, answered_at=None):
+    """
+    Build a user_quiz_answers row for upsert_user_quiz_answers from a graded
+    answer (dict with question_id, selected_choice, is_correct, answer_order).
+    """
+    return {
+        'user_id': user_id,
+        'quiz_question_id': graded_answer['question_id'],
+        'selected_choice': graded_answer['selected_choice'],
+        'is_correct': graded_answer['is_correct'],
+        'answer_order': json.dumps(graded_answer['answer_order']),
+        'answered_at': answered_at or datetime.utcnow()
+    }
+
+
+def upsert_user_quiz_answers(rows):
+    """
+    Insert or update many quiz answers with a single multi-row statement.
+    Does not commit.
+
+    Args:
+        rows: list of dicts with keys user_id, quiz_question_id, selected_choice,
+              is_correct, answer_order (JSON string) and answered_at.
+              At most one row per (user_id, quiz_question_id).
+
+    An existing row keeps its stored answer_order, the same as when answers
+    are submitted one at a time.
+    """
+    if not rows:
+        return
+
+    table = UserQuizAnswer.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'quiz_question_id'],
+            set_={
+                'selected_choice': stmt.excluded.selected_choice,
+                'is_correct': stmt.excluded.is_correct,
+                'answered_at': stmt.excluded.answered_at,
+                'answer_order': func.coalesce(table.c.answer_order, stmt.excluded.answer_order)
+            }
+        )
+        db.session.execute(stmt)
+    elif dialect in ('mysql', 'mariadb'):
+        stmt = mysql_insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            selected_choice=stmt.inserted.selected_choice,
+            is_correct=stmt.inserted.is_correct,
+            answered_at=stmt.inserted.answered_at,
+            answer_order=func.coalesce(table.c.answer_order, stmt.inserted.answer_order)
+        )
+        db.session.execute(stmt)
+    else:
+        # No native upsert - fall back to one lookup per row
+        for row in rows:
+            answer = UserQuizAnswer.query.filter_by(
+                user_id=row['user_id'],
+                quiz_question_id=row['quiz_question_id']
+            ).first()
+            if answer:
+                answer.selected_choice = row['selected_choice']
+                answer.is_correct = row['is_correct']
+                answer.answered_at = row['answered_at']
+                answer.answer_order = answer.answer_order or row['answer_order']
+            else:
+                db.session.add(UserQuizAnswer(**row))
+
+
 def update_user_quiz_answer(user_id, quiz_id, selected_index, answer_order):
     """
     Update user's answer to a quiz question.
@@ -425,25 +826,31 @@ def update_user_quiz_answer(user_id, quiz_id, selected_index, answer_order):
         user_id: User ID
         quiz_id: Quiz question ID
         selected_index: Index (0-3) selected by user in shuffled choices
-        answer_order: List like ['b', 'a', 'd', 'c'] representing shuffle order
+        answer_order: List like ['b', 'a', 'd', 'c'] representing shuffle order.
+                      If None, the order is recomputed on the server
+                      (see QuizQuestion.get_answer_order).
 
     Returns:
-        dict with keys: is_correct, explanation
+        dict with keys: is_correct, explanation, and (when the question exists)
+        module_id, selected_choice, answer_order
     """
     quiz = QuizQuestion.query.get(quiz_id)
     if not quiz:
         return {'is_correct': False, 'explanation': 'Quiz question not found'}
 
-    # Convert selected index to actual choice letter
-    selected_choice = answer_order[selected_index]
-    is_correct = bool(selected_choice == quiz.correct_choice)
-    
     # Update or create answer record
     answer = UserQuizAnswer.query.filter_by(
         user_id=user_id,
         quiz_question_id=quiz_id
     ).first()
     
+    if answer_order is None:
+        answer_order = quiz.get_answer_order(user_id, answer) or ['a', 'b', 'c', 'd']
+
+    # Convert selected index to actual choice letter
+    selected_choice = answer_order[selected_index]
+    is_correct = bool(selected_choice == quiz.correct_choice)
+    
     if answer:
         answer.selected_choice = selected_choice
         answer.is_correct = is_correct
@@ -458,14 +865,39 @@ def update_user_quiz_answer(user_id, quiz_id, selected_index, answer_order):
         )
         db.session.add(answer)
     
+    # Record module completion in the same transaction as the answer
+    record_module_completion(user_id, quiz.module_id)
     db.session.commit()
 
-    # Check if module is now complete
-    if is_correct:
-        get_module_completion_status(user_id, quiz.module_id)
-
     return {
         'is_correct': is_correct,
-        'explanation': quiz.explanation
+        'explanation': quiz.explanation,
+        'module_id': quiz.module_id,
+        'selected_choice': selected_choice,
+        'answer_order': answer_order
     }
 
+
+
+def update_user_quiz_answers(user_id, module_id, graded_answers):
+    """
+    Save many already-graded answers for one module in a single transaction:
+    one multi-row upsert, then one module completion check.
+
+    Args:
+        user_id: User ID
+        module_id: Module ID the questions belong to
+        graded_answers: list of dicts with keys question_id, selected_choice,
+                        is_correct, answer_order (list)
+
+    Returns:
+        True if the module is complete after saving
+    """
+    now = datetime.utcnow()
+    upsert_user_quiz_answers([
+        quiz_answer_row(user_id, answer, now) for answer in graded_answers
+    ])
+
+    module_complete = record_module_completion(user_id, module_id)
+    db.session.commit()
+    return module_complete
@@ -0,0 +1,239 @@
+"""
+Rendered-page cache for Trinity Training Guide
+
+Chapter and module pages depend only on the curriculum (navigation URLs,
+progress percent, has_quiz), which is fixed for a content version, plus two
+small per-user regions of base.html: the username badge and flashed
+messages. Each page is rendered once per (template, page ID, content
+version) with markers in place of those regions. Later requests splice
+freshly rendered per-user fragments into the cached body, so serving a page
+is a dictionary lookup plus two tiny template renders.
+
+The table of contents also differs per user in which modules and chapters
+are locked. Each lockable item is cached in both forms, locked and
+unlocked, and the request's lock sets pick one while splicing, so the 55KB
+page is rendered once per content version instead of once per request.
+
+Pages without lock items also keep their static text deflated once
+compression.py has gzipped them, so a compressed response only deflates the
+per-user fragments.
+
+The cache is a per-worker LRU bounded by PAGE_CACHE_MAX_BYTES.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+from flask import current_app, g, render_template, request, session
+from markupsafe import Markup
+
+from compression import deflate_block, gzip_blocks
+
+
+# Per-user regions of base.html, rendered for every request
+USER_SLOTS = ('user_badge', 'flash_messages')
+
+SLOT_MARKERS = {name: Markup(f'<!--page-cache-slot:{name}-->') for name in USER_SLOTS}
+
+# Per-user alternatives within a page: (kind, key, locked HTML, unlocked HTML)
+MARKER_PATTERN = re.compile(
+    r'<!--page-cache-slot:(\w+)-->'
+    r'|<!--page-cache-lock:(\w+):([\w.]+)-->(.*?)<!--page-cache-unlocked-->(.*?)<!--page-cache-lock-end-->',
+    re.S
+)
+
+
+def lock_marker(kind, key, locked, unlocked):
+    """Both forms of a lockable item, for the cache to choose from per request"""
+    return Markup(
+        '<!--page-cache-lock:{}:{}-->{}<!--page-cache-unlocked-->{}<!--page-cache-lock-end-->'
+    ).format(kind, key, locked, unlocked)
+
+
+class CachedPage:
+    """
+    A rendered page split into static text, per-user slot names and
+    lockable items
+    """
+    __slots__ = ('segments', 'size', 'deflated')
+
+    def __init__(self, html):
+        # Alternates: text, slot name or (kind, key, locked, unlocked), text, ...
+        segments = []
+        position = 0
+        for match in MARKER_PATTERN.finditer(html):
+            slot, kind, key, locked, unlocked = match.groups()
+            segments.append(html[position:match.start()])
+            segments.append(slot or (kind, key, locked, unlocked))
+            position = match.end()
+        segments.append(html[position:])
+        self.segments = tuple(segments)
+        self.size = len(html.encode('utf-8'))
+        self.deflated = None  # (level, deflated static text segments), on first gzip
+
+    def splice(self, slots, locks=None):
+        """
+        Join the page with the rendered per-user fragments.
+
+        Args:
+            slots: {slot name: rendered fragment}
+            locks: {kind: keys of locked items} - items not listed are unlocked
+        """
+        parts = []
+        for i, segment in enumerate(self.segments):
+            if not i % 2:
+                parts.append(segment)
+            elif isinstance(segment, str):
+                parts.append(slots[segment])
+            else:
+                kind, key, locked, unlocked = segment
+                parts.append(locked if locks and key in locks.get(kind, ()) else unlocked)
+        return ''.join(parts)
+
+    def gzip(self, body, slots, locks, level):
+        """
+        The spliced page as gzip, from the static text deflated on first use
+        plus the deflated per-user fragments.
+
+        Args:
+            body: splice(slots, locks) encoded as UTF-8
+            slots, locks: As given to splice
+            level: zlib compression level
+
+        Returns:
+            The gzip body, or None for pages with lock items - their many
+            small segments compress poorly on their own
+        """
+        deflated = self.deflated
+        if deflated is None or deflated[0] != level:
+            blocks = None
+            if all(isinstance(segment, str) for segment in self.segments[1::2]):
+                blocks = tuple(deflate_block(segment.encode('utf-8'), level) for segment in self.segments[::2])
+            deflated = self.deflated = (level, blocks)
+        if deflated[1] is None:
+            return None
+
+        blocks = []
+        for i, block in enumerate(deflated[1]):
+            blocks.append(block)
+            if i < len(self.segments) // 2:
+                fragment = slots[self.segments[2 * i + 1]]
+                if fragment:
+                    blocks.append(deflate_block(fragment.encode('utf-8'), level))
+        return gzip_blocks(blocks, body)
+
+
+class PageCache:
+    """LRU of CachedPage objects bounded by total size in bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._pages = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, key, page):
+        if page.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._pages.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._pages[key] = page
+            self._bytes += page.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._pages.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._pages),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+# ============================================================================
+# PER-WORKER CACHE
+# ============================================================================
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    """Get this worker's page cache, creating it on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PageCache(current_app.config.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    return _cache
+
+
+def render_user_slots():
+    """Render the per-user regions of base.html for the current request"""
+    return {
+        'user_badge': render_template('user_badge.html'),
+        'flash_messages': render_template('flash_messages.html') if session.get('_flashes') else '',
+    }
+
+
+def render_cached_page(template_path, page_id, version, transform=None, locks=None, **context):
+    """
+    Render a chapter, module, glossary or contents page through the page cache.
+
+    Args:
+        template_path: Template to render
+        page_id: Module ID or chapter page (e.g., "2.3" or "2/intro")
+        version: Content version (or other stamp) the context was built from
+        transform: Function applied to the rendered HTML before it is cached
+                   (e.g., glossary linking) - version must cover its inputs
+        locks: {kind: keys of locked items} for templates with lockable items
+               (rendered with lock_marker when cached, from locks when not)
+        context: Template variables - must be the same for every user
+    """
+    if not current_app.config.get('PAGE_CACHE_ENABLED', True):
+        html = render_template(template_path, locks=locks or {}, **context)
+        return transform(html) if transform else html
+
+    cache = get_page_cache()
+    key = (template_path, page_id, version, request.script_root)
+    page = cache.get(key)
+    if page is None:
+        html = render_template(
+            template_path, page_cache_slots=SLOT_MARKERS, page_cache_lock=lock_marker, **context
+        )
+        page = CachedPage(transform(html) if transform else html)
+        cache.put(key, page)
+
+    slots = render_user_slots()
+    html = page.splice(slots, locks)
+    g.cached_page = (html, page, slots, locks)  # For compression.py
+    return html
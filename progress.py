@@ -0,0 +1,150 @@
+"""
+Progress snapshot for Trinity Training Guide
+
+Computes module completion, chapter completion and lock state for the whole
+curriculum from the user's UserState row (a bitmask of completed modules),
+combined with the cached CurriculumIndex, instead of querying every module
+and quiz question one at a time. When the row is missing or was computed for
+an older content version, a single aggregate query over the user's answers
+is used instead.
+
+Usage:
+    snapshot = ProgressSnapshot.for_user(user.id)
+    snapshot.is_module_complete('2.3')
+    snapshot.is_module_locked('2.3')
+    snapshot.is_chapter_locked(3)
+"""
+
+from sqlalchemy import func
+
+from models import db, QuizQuestion, UserQuizAnswer, UserState
+from curriculum import get_curriculum_index, is_sub_module_id
+
+
+class ProgressSnapshot:
+    """
+    Read-only view of one user's progress through the curriculum.
+
+    Built from the curriculum structure (chapters, modules and quiz counts)
+    and the number of answered questions per module for the user.
+    """
+
+    def __init__(self, chapter_modules, module_completion):
+        """
+        Args:
+            chapter_modules: {chapter_id: [module_id, ...]} sorted by module_sort_key
+            module_completion: {module_id: True if complete}
+        """
+        self.chapter_modules = chapter_modules
+        self.module_completion = module_completion
+
+        self.chapter_complete = {
+            chapter_id: all(self.module_completion[m] for m in modules)
+            for chapter_id, modules in chapter_modules.items()
+        }
+
+        self.chapter_locked = {
+            chapter_id: chapter_id > 1 and not self.is_chapter_complete(chapter_id - 1)
+            for chapter_id in chapter_modules
+        }
+
+        self.module_locked = {}
+        for chapter_id, modules in chapter_modules.items():
+            self.module_locked.update(self._compute_module_locks(chapter_id, modules))
+
+    @classmethod
+    def for_user(cls, user_id, curriculum=None, state=None):
+        """
+        Build a snapshot for a user from their state row (fetched here unless
+        given), falling back to one aggregate query if it is missing or stale.
+        """
+        if curriculum is None:
+            curriculum = get_curriculum_index()
+        if state is None:
+            state = db.session.get(UserState, user_id)
+
+        if state is not None and state.content_version == curriculum.version:
+            return cls.from_mask(curriculum, state.completed_mask)
+
+        answered_counts = dict(
+            db.session.query(QuizQuestion.module_id, func.count(UserQuizAnswer.id))
+            .join(UserQuizAnswer, UserQuizAnswer.quiz_question_id == QuizQuestion.id)
+            .filter(
+                UserQuizAnswer.user_id == user_id,
+                UserQuizAnswer.selected_choice.isnot(None)
+            )
+            .group_by(QuizQuestion.module_id)
+            .all()
+        )
+
+        return cls.from_counts(curriculum, answered_counts)
+
+    @classmethod
+    def from_counts(cls, curriculum, answered_counts):
+        """
+        A module is complete when every quiz question has been answered
+        (regardless of correctness). Modules without quizzes are complete.
+        """
+        return cls(curriculum.chapter_modules, {
+            module_id: answered_counts.get(module_id, 0) >= count
+            for module_id, count in curriculum.quiz_counts.items()
+        })
+
+    @classmethod
+    def from_mask(cls, curriculum, completed_mask):
+        """Build a snapshot from a UserState completed-modules bitmask"""
+        return cls(curriculum.chapter_modules, {
+            module_id: bool(completed_mask >> bit & 1)
+            for module_id, bit in curriculum.module_bits.items()
+        })
+
+    def is_module_complete(self, module_id):
+        """Check if a module is completed. Modules not in the DB allow progression."""
+        return self.module_completion.get(module_id, True)
+
+    def is_chapter_complete(self, chapter_id):
+        """Check if all modules in a chapter are completed"""
+        return self.chapter_complete.get(chapter_id, False)
+
+    def is_module_locked(self, module_id):
+        """Check if a module is locked for a non-preview user"""
+        return self.module_locked.get(module_id, False)
+
+    def is_chapter_locked(self, chapter_id):
+        """Check if a chapter is locked for a non-preview user"""
+        if chapter_id <= 1:
+            return False
+        return not self.is_chapter_complete(chapter_id - 1)
+
+    def _compute_module_locks(self, chapter_id, modules):
+        """
+        Compute lock state for the modules of one chapter.
+
+        The first module is locked until the previous chapter is complete.
+        Other modules are locked until the module before them is complete.
+        Sub-modules (e.g., 2.2.1) are content within the parent module - the
+        quiz comes AFTER the sub-modules - so they are locked by the module
+        before the parent, not by the parent itself.
+        """
+        prev_chapter_complete = self.is_chapter_complete(chapter_id - 1) if chapter_id > 1 else True
+        locked = {}
+
+        for i, module_id in enumerate(modules):
+            if i == 0:
+                locked[module_id] = not prev_chapter_complete
+            elif is_sub_module_id(module_id):
+                parent_id = '.'.join(module_id.split('.')[:2])  # "2.2.1" -> "2.2"
+                parent_idx = modules.index(parent_id) if parent_id in modules else 0
+                if parent_idx == 0:
+                    locked[module_id] = not prev_chapter_complete
+                else:
+                    prev_module_id = modules[parent_idx - 1]
+                    # Skip any sub-modules when looking for the previous main module
+                    while is_sub_module_id(prev_module_id) and parent_idx > 1:
+                        parent_idx -= 1
+                        prev_module_id = modules[parent_idx - 1]
+                    locked[module_id] = not self.is_module_complete(prev_module_id)
+            else:
+                locked[module_id] = not self.is_module_complete(modules[i - 1])
+
+        return locked
@@ -0,0 +1,281 @@
+"""
+Module quiz bundles for Trinity Training Guide
+
+A bundle holds every quiz question of a module together with one user's
+answers and shuffle orders, loaded with a single joined query. Bundles are
+cached per worker for the span of a module attempt, so paging from question
+n to n+1 needs no database read.
+
+Answer submissions update the cached bundle in place. A random stamp kept in
+the user's session (session['quiz_stamp']) changes on every submission, so a
+worker holding a bundle from before an answer submitted through another
+worker sees the mismatch and reloads it. Bundles also record the user's
+session_version, so one loaded before the user's progress was reset
+(`flask user-reset`) is reloaded even though the session's stamp is unchanged.
+"""
+
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, session
+from sqlalchemy import and_
+
+from models import db, QuizQuestion, UserQuizAnswer, deterministic_answer_order
+
+
+class BundleQuestion:
+    """Plain, session-independent copy of a quiz question"""
+    __slots__ = ('id', 'question', 'choices', 'correct_choice', 'explanation')
+
+    def __init__(self, quiz):
+        self.id = quiz.id
+        self.question = quiz.question
+        self.choices = quiz.get_choices_dict()
+        self.correct_choice = quiz.correct_choice
+        self.explanation = quiz.explanation
+
+
+class ModuleQuizBundle:
+    """
+    All quiz questions of one module plus one user's answers.
+
+    answers maps question ID to a dict with keys:
+        selected_choice, is_correct, answer_order (list or None)
+    """
+    __slots__ = ('user_id', 'module_id', 'version', 'user_version', 'stamp', 'loaded_at', 'questions', 'answers')
+
+    def __init__(self, user_id, module_id, version, user_version, stamp, questions, answers):
+        self.user_id = user_id
+        self.module_id = module_id
+        self.version = version
+        self.user_version = user_version
+        self.stamp = stamp
+        self.loaded_at = time.monotonic()
+        self.questions = questions
+        self.answers = answers
+
+    def __repr__(self):
+        return f'<ModuleQuizBundle user={self.user_id} module={self.module_id} questions={len(self.questions)}>'
+
+    @classmethod
+    def load(cls, user_id, module_id, version, user_version, stamp):
+        """Load the module's questions and the user's answers in one joined query"""
+        rows = (
+            db.session.query(QuizQuestion, UserQuizAnswer)
+            .outerjoin(UserQuizAnswer, and_(
+                UserQuizAnswer.quiz_question_id == QuizQuestion.id,
+                UserQuizAnswer.user_id == user_id
+            ))
+            .filter(QuizQuestion.module_id == module_id)
+            .order_by(QuizQuestion.display_order)
+            .all()
+        )
+
+        questions = []
+        answers = {}
+        for quiz, answer in rows:
+            questions.append(BundleQuestion(quiz))
+            if answer:
+                answers[quiz.id] = {
+                    'selected_choice': answer.selected_choice,
+                    'is_correct': answer.is_correct,
+                    'answer_order': json.loads(answer.answer_order) if answer.answer_order else None
+                }
+
+        return cls(user_id, module_id, version, user_version, stamp, questions, answers)
+
+    @property
+    def total_questions(self):
+        return len(self.questions)
+
+    def get_answer_order(self, question_id):
+        """
+        Shuffle order for a question: the stored order if there is one,
+        otherwise the deterministic order. None in 'random' shuffle mode
+        when no order has been stored yet.
+        """
+        answer = self.answers.get(question_id)
+        if answer and answer['answer_order']:
+            return answer['answer_order']
+        if current_app.config.get('QUIZ_SHUFFLE_MODE', 'deterministic') == 'deterministic':
+            return deterministic_answer_order(self.user_id, question_id)
+        return None
+
+    def get_question(self, question_num):
+        """
+        Get the data for the quiz page of question number question_num (1-based).
+
+        Returns:
+            tuple of (question_data, already_answered, was_correct), where
+            question_data matches QuizQuestion.get_shuffled_for_user
+        """
+        question = self.questions[question_num - 1]
+        order = self.get_answer_order(question.id)
+
+        if order is None:
+            # 'random' shuffle mode: generate and store the order the old way
+            question_data = db.session.get(QuizQuestion, question.id).get_shuffled_for_user(self.user_id)
+            answer = self.answers.setdefault(question.id, {'selected_choice': None, 'is_correct': None})
+            answer['answer_order'] = question_data['answer_order']
+        else:
+            question_data = {
+                'id': question.id,
+                'question': question.question,
+                'choices': [question.choices[letter] for letter in order],
+                'correct_index': order.index(question.correct_choice),
+                'explanation': question.explanation,
+                'answer_order': order
+            }
+
+        answer = self.answers.get(question.id)
+        already_answered = bool(answer and answer['selected_choice'] is not None)
+        was_correct = bool(answer['is_correct']) if already_answered else None
+
+        # Add selected_choice so the template can highlight a wrong answer
+        if already_answered:
+            question_data['selected_choice'] = answer['selected_choice']
+
+        return question_data, already_answered, was_correct
+
+    def grade(self, question_id, selected_index, answer_order=None):
+        """
+        Grade an answer in memory against the cached answer key.
+
+        Args:
+            question_id: Quiz question ID (must belong to this module)
+            selected_index: Index (0-3) selected in the shuffled choices
+            answer_order: Client-side shuffle order, only used in 'random'
+                          shuffle mode when no order is stored
+
+        Returns:
+            dict with keys: question_id, selected_choice, is_correct,
+                            explanation, answer_order
+
+        Raises:
+            ValueError: if the question, answer order or index is invalid
+        """
+        question = next((q for q in self.questions if q.id == question_id), None)
+        if question is None:
+            raise ValueError(f'Question {question_id} is not part of module {self.module_id}')
+
+        order = self.get_answer_order(question_id) or answer_order
+        if (
+            not isinstance(order, list)
+            or not all(isinstance(letter, str) for letter in order)
+            or sorted(order) != ['a', 'b', 'c', 'd']
+        ):
+            raise ValueError(f'Invalid answer order for question {question_id}')
+        # bool is an int subclass - JSON true must not grade as choice 1
+        if (
+            isinstance(selected_index, bool)
+            or not isinstance(selected_index, int)
+            or not 0 <= selected_index < len(order)
+        ):
+            raise ValueError(f'Invalid selected_index for question {question_id}')
+
+        selected_choice = order[selected_index]
+        return {
+            'question_id': question_id,
+            'selected_choice': selected_choice,
+            'is_correct': selected_choice == question.correct_choice,
+            'explanation': question.explanation,
+            'answer_order': order
+        }
+
+    def completes_module(self, question_ids):
+        """Check if the module is complete once the given questions are answered"""
+        answered = {qid for qid, answer in self.answers.items() if answer['selected_choice'] is not None}
+        answered.update(question_ids)
+        return all(q.id in answered for q in self.questions)
+
+    def record_answer(self, question_id, selected_choice, is_correct, answer_order):
+        """Apply a submitted answer to the cached bundle"""
+        self.answers[question_id] = {
+            'selected_choice': selected_choice,
+            'is_correct': is_correct,
+            'answer_order': answer_order
+        }
+
+
+# ============================================================================
+# PER-WORKER CACHE
+# ============================================================================
+
+_bundles = OrderedDict()
+_lock = threading.Lock()
+
+
+def _is_fresh(bundle, version, user_version, stamp):
+    ttl = current_app.config.get('QUIZ_BUNDLE_TTL', 30 * 60)
+    return (
+        bundle.version == version and
+        bundle.user_version == user_version and
+        bundle.stamp == stamp and
+        time.monotonic() - bundle.loaded_at < ttl
+    )
+
+
+def get_module_quiz_bundle(user_id, module_id, version, user_version):
+    """
+    Get the cached quiz bundle for a user and module, loading it if it is
+    missing, expired, from an older content version or user session_version,
+    or older than the last answer the user submitted.
+    """
+    key = (user_id, module_id)
+    stamp = session.get('quiz_stamp')
+
+    with _lock:
+        bundle = _bundles.get(key)
+        if bundle and _is_fresh(bundle, version, user_version, stamp):
+            _bundles.move_to_end(key)
+            return bundle
+
+    bundle = ModuleQuizBundle.load(user_id, module_id, version, user_version, stamp)
+
+    with _lock:
+        _bundles[key] = bundle
+        _bundles.move_to_end(key)
+        max_size = current_app.config.get('QUIZ_BUNDLE_CACHE_SIZE', 2048)
+        while len(_bundles) > max_size:
+            _bundles.popitem(last=False)
+
+    return bundle
+
+
+def record_quiz_answer(user_id, module_id, question_id, selected_choice, is_correct, answer_order):
+    """
+    Update the cached bundle after an answer has been committed, and rotate
+    the session's quiz stamp so other workers reload their copy.
+    """
+    record_quiz_answers(user_id, module_id, [{
+        'question_id': question_id,
+        'selected_choice': selected_choice,
+        'is_correct': is_correct,
+        'answer_order': answer_order
+    }])
+
+
+def record_quiz_answers(user_id, module_id, graded_answers):
+    """
+    Apply several committed answers (dicts as returned by
+    ModuleQuizBundle.grade) to the cached bundle and rotate the quiz stamp.
+    """
+    old_stamp = session.get('quiz_stamp')
+    new_stamp = secrets.token_hex(4)
+    session['quiz_stamp'] = new_stamp
+
+    with _lock:
+        bundle = _bundles.get((user_id, module_id))
+        if not bundle:
+            return
+        question_ids = {q.id for q in bundle.questions}
+        if bundle.stamp == old_stamp and all(a['question_id'] in question_ids for a in graded_answers):
+            for answer in graded_answers:
+                bundle.record_answer(answer['question_id'], answer['selected_choice'],
+                                     answer['is_correct'], answer['answer_order'])
+            bundle.stamp = new_stamp
+        else:
+            del _bundles[(user_id, module_id)]
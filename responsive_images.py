@@ -0,0 +1,195 @@
+"""
+Responsive image derivatives for Trinity Training Guide
+
+The truck photos are 1200-1536px JPEGs shown about 300px wide on /trucks and
+in glossary tooltips. `flask build-images` writes WebP and JPEG (PNG for
+images with transparency) copies of each image in static/images at every
+width in RESPONSIVE_IMAGE_WIDTHS below the original width, plus one at the
+original width (capped at the largest bucket), into static/responsive/. It
+records them in static/responsive/manifest.json with the original
+dimensions. Unused *_original images are skipped.
+
+Templates call responsive_image() to emit a <picture> with WebP and fallback
+srcsets, sizes, width/height (so the layout does not shift) and
+loading="lazy". Images without derivatives get a plain lazy <img>. CSS
+backgrounds use responsive_image_url() to pick one derivative by width.
+
+Derivatives are only rebuilt when missing or older than their source. Run
+`flask build-images` before `flask build-assets` so the derivatives are
+fingerprinted too.
+"""
+
+import json
+import os
+from pathlib import Path, PurePosixPath
+
+from flask import current_app, url_for
+from markupsafe import Markup, escape
+
+
+OUTPUT_DIR = 'responsive'
+MANIFEST_NAME = 'manifest.json'
+
+SOURCE_DIR = 'images'
+SOURCE_SUFFIXES = {'.jpg', '.jpeg', '.png'}
+SKIP_STEM_SUFFIX = '_original'
+
+SAVE_OPTIONS = {
+    'webp': {'method': 6},
+    'jpeg': {'optimize': True, 'progressive': True},
+    'png': {'optimize': True},
+}
+
+
+def _bucket_widths(width, widths):
+    buckets = [w for w in sorted(widths) if w < width]
+    buckets.append(min(width, max(widths)))
+    return sorted(set(buckets))
+
+
+def _save_variant(image, path, fmt, quality):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    options = dict(SAVE_OPTIONS[fmt])
+    if fmt != 'png':
+        options['quality'] = quality
+    image.save(tmp_path, format=fmt.upper(), **options)
+    os.replace(tmp_path, path)
+
+
+def build_images(static_folder, widths, quality=80):
+    """
+    Write width-bucketed derivatives of static/images and their manifest.
+
+    Returns:
+        tuple of (manifest dict, number of files written)
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise RuntimeError("flask build-images needs the Pillow package")
+
+    static = Path(static_folder)
+    sources = sorted(
+        path for path in (static / SOURCE_DIR).rglob('*')
+        if path.is_file()
+        and path.suffix.lower() in SOURCE_SUFFIXES
+        and not path.stem.endswith(SKIP_STEM_SUFFIX)
+    )
+
+    manifest = {}
+    written = 0
+    for path in sources:
+        filename = path.relative_to(static).as_posix()
+        stem = PurePosixPath(filename).relative_to(SOURCE_DIR).with_suffix('')
+
+        with Image.open(path) as opened:
+            image = ImageOps.exif_transpose(opened)
+            has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        fallback = 'png' if has_alpha else 'jpeg'
+        variants = {'webp': [], fallback: []}
+        for width in _bucket_widths(image.width, widths):
+            height = round(image.height * width / image.width)
+            resized = None
+            for fmt in variants:
+                variant = PurePosixPath(OUTPUT_DIR) / f'{stem}-{width}.{fmt}'
+                target = static / variant
+                if not target.exists() or target.stat().st_mtime < path.stat().st_mtime:
+                    if resized is None:
+                        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                    _save_variant(resized, target, fmt, quality)
+                    written += 1
+                variants[fmt].append([width, str(variant)])
+
+        manifest[filename] = {
+            'width': image.width,
+            'height': image.height,
+            'fallback': fallback,
+            'variants': variants,
+        }
+
+    manifest_path = static / OUTPUT_DIR / MANIFEST_NAME
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_name(f'{MANIFEST_NAME}.{os.getpid()}.tmp')
+    tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding='utf-8')
+    os.replace(tmp_path, manifest_path)
+
+    return manifest, written
+
+
+# ============================================================================
+# TEMPLATES
+# ============================================================================
+
+def load_image_manifest(static_folder):
+    """Read static/responsive/manifest.json, or return {} if it has not been built"""
+    try:
+        with open(Path(static_folder) / OUTPUT_DIR / MANIFEST_NAME, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _srcset(variants):
+    return ', '.join(f"{url_for('static', filename=variant)} {width}w" for width, variant in variants)
+
+
+def responsive_image(filename, alt, sizes='100vw', class_=None, style=None, lazy=True):
+    """
+    <picture> markup for a static image, e.g.
+    {{ responsive_image('images/flatbed.jpeg', 'Flatbed trailer', sizes='300px') }}
+
+    Args:
+        filename: Path under static/ (e.g. "images/flatbed.jpeg")
+        alt: Alt text
+        sizes: Displayed width, as for the sizes attribute
+        class_: CSS class of the <img>
+        style: Inline style of the <img>
+        lazy: Defer loading until the image is near the viewport (turn off
+              for images at the top of the page)
+    """
+    entry = current_app.extensions.get('responsive_images', {}).get(filename)
+
+    attrs = [f'alt="{escape(alt)}"']
+    if class_:
+        attrs.append(f'class="{escape(class_)}"')
+    if style:
+        attrs.append(f'style="{escape(style)}"')
+    if lazy:
+        attrs.append('loading="lazy" decoding="async"')
+
+    if entry is None:
+        return Markup(f'<img src="{url_for("static", filename=filename)}" {" ".join(attrs)}>')
+
+    fallback = entry['variants'][entry['fallback']]
+    return Markup(
+        '<picture class="responsive-image">'
+        f'<source type="image/webp" srcset="{_srcset(entry["variants"]["webp"])}" sizes="{escape(sizes)}">'
+        f'<img src="{url_for("static", filename=fallback[-1][1])}" srcset="{_srcset(fallback)}" '
+        f'sizes="{escape(sizes)}" width="{entry["width"]}" height="{entry["height"]}" {" ".join(attrs)}>'
+        '</picture>'
+    )
+
+
+def responsive_image_url(filename, width):
+    """
+    URL of the smallest fallback-format derivative at least width pixels wide
+    (the largest if none is), for CSS backgrounds. The original if the image
+    has no derivatives.
+    """
+    entry = current_app.extensions.get('responsive_images', {}).get(filename)
+    if entry is None:
+        return url_for('static', filename=filename)
+
+    variants = entry['variants'][entry['fallback']]
+    variant = next((v for w, v in variants if w >= width), variants[-1][1])
+    return url_for('static', filename=variant)
+
+
+def init_responsive_images(app):
+    """Load the derivative manifest and make responsive_image() available to templates"""
+    app.extensions['responsive_images'] = load_image_manifest(app.static_folder)
+    app.jinja_env.globals['responsive_image'] = responsive_image
+    app.jinja_env.globals['responsive_image_url'] = responsive_image_url
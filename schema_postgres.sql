@@ -15,11 +15,24 @@ CREATE TABLE IF NOT EXISTS modules (
     chapter_id INTEGER NOT NULL,
     title VARCHAR(255) NOT NULL,
     content_markdown TEXT,
+    rendered_html TEXT,  -- content_markdown compiled by content_compiler.py
+    content_hash VARCHAR(64),  -- what rendered_html was compiled from
     display_order INTEGER NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (chapter_id) REFERENCES chapters(id) ON DELETE CASCADE
 );
 
+-- Pages of each module's compiled content (see content_compiler.py)
+CREATE TABLE IF NOT EXISTS module_pages (
+    module_id VARCHAR(10) NOT NULL,
+    page_num INTEGER NOT NULL,
+    line_start INTEGER NOT NULL,
+    line_end INTEGER NOT NULL,
+    content_html TEXT NOT NULL,
+    PRIMARY KEY (module_id, page_num),
+    FOREIGN KEY (module_id) REFERENCES modules(id) ON DELETE CASCADE
+);
+
 -- Chapter sections (intro, summary, action_items)
 CREATE TABLE IF NOT EXISTS chapter_sections (
     id SERIAL PRIMARY KEY,
@@ -54,7 +67,8 @@ CREATE TABLE IF NOT EXISTS users (
     password_hash VARCHAR(255),
     is_preview_mode BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    last_login TIMESTAMP
+    last_login TIMESTAMP,
+    session_version INTEGER NOT NULL DEFAULT 1
 );
 
 -- User progress tracking
@@ -69,6 +83,15 @@ CREATE TABLE IF NOT EXISTS user_progress (
     UNIQUE(user_id, module_id)
 );
 
+-- Compact per-user progress state (bitmasks of completed modules and seen chapter intros)
+CREATE TABLE IF NOT EXISTS user_state (
+    user_id INTEGER PRIMARY KEY,
+    completed_modules VARCHAR(128) NOT NULL DEFAULT '0',
+    content_version INTEGER,
+    seen_intros BIGINT NOT NULL DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
 -- User quiz answers (with JSONB support for better performance)
 CREATE TABLE IF NOT EXISTS user_quiz_answers (
     id SERIAL PRIMARY KEY,
@@ -93,6 +116,21 @@ CREATE TABLE IF NOT EXISTS glossary_terms (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Content version stamp (single row, bumped whenever content changes)
+CREATE TABLE IF NOT EXISTS content_version (
+    id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Server-side sessions (only used with SESSION_BACKEND=database)
+CREATE TABLE IF NOT EXISTS user_sessions (
+    id VARCHAR(64) PRIMARY KEY,
+    user_id INTEGER,
+    data TEXT NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);
+
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_modules_chapter_id ON modules(chapter_id);
 CREATE INDEX IF NOT EXISTS idx_quiz_questions_module_id ON quiz_questions(module_id);
@@ -104,4 +142,6 @@ CREATE INDEX IF NOT EXISTS idx_glossary_terms_term ON glossary_terms(term);
 
 -- PostgreSQL-specific: Create GIN index for JSONB answer_order
 CREATE INDEX IF NOT EXISTS idx_user_quiz_answers_order_gin ON user_quiz_answers USING GIN (answer_order);
+CREATE INDEX IF NOT EXISTS idx_user_sessions_user_id ON user_sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_user_sessions_expires_at ON user_sessions(expires_at);
 
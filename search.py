@@ -0,0 +1,536 @@
+"""
+Full-text search for Trinity Training Guide
+
+/search looks through all of the training text:
+- module pages (Module.content_markdown)
+- chapter summaries and action items (ChapterSection)
+- quiz answer explanations
+- glossary definitions
+
+Results are ranked with BM25, with words in a title counting extra, and
+shown with a snippet around the best cluster of matching words.
+
+By default the index lives in memory. Each worker builds it on its first
+search and rebuilds it when the content version stamp or the glossary
+changes. Building it takes about a tenth of a second for the whole manual,
+and a search is a few dictionary lookups per query word.
+
+With SEARCH_BACKEND = 'auto', searches go to the database's own full-text
+engine once `flask build-search-index` has filled its table:
+- SQLite: an FTS5 table (porter stemming, bm25() and snippet())
+- PostgreSQL: a table with a weighted tsvector column and a GIN index
+  (ts_rank_cd() and ts_headline())
+The table records which content it was built from. If the content has
+changed since, it is ignored and the in-memory index is used until the
+command is run again.
+"""
+
+import hashlib
+import heapq
+import html
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, url_for
+from markupsafe import Markup, escape
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from curriculum import _Frozen, get_curriculum_index
+from glossary import TRUCK_TERM_NAMES, get_glossary
+from models import db, Chapter, ChapterSection, Module, QuizQuestion
+
+
+WORD_PATTERN = re.compile(r'[A-Za-z0-9]+')
+
+STOP_WORDS = frozenset(
+    'a an and are as at be but by can do for from has have how i if in is it its of on or s so t '
+    'that the their them there these they this to was what when where which who will with you your'.split()
+)
+
+# BM25 parameters, and how many times a title word counts
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 3
+
+SNIPPET_WORDS = 32
+
+# Private-use characters marking highlights in database snippets until escaped
+HIGHLIGHT_START = '\ue000'
+HIGHLIGHT_STOP = '\ue001'
+
+SECTION_LABELS = {'summary': 'Summary', 'action_items': 'Action Items'}
+
+MARKDOWN_PATTERNS = (
+    (re.compile(r'<[^>]+>'), ' '),                                 # HTML tags
+    (re.compile(r'!?\[([^\]]*)\]\([^)]*\)'), r'\1'),               # links and images -> their text
+    (re.compile(r'^[ \t]*(?:#{1,6}|[-*+]|\d+\.|>)[ \t]+', re.M), ''),  # headings, list markers, quotes
+    (re.compile(r'[*_`~]+'), ''),                                  # emphasis and code
+)
+
+
+def plain_text(markdown_text):
+    """Readable text of a markdown document, on one line"""
+    text_ = markdown_text or ''
+    for pattern, replacement in MARKDOWN_PATTERNS:
+        text_ = pattern.sub(replacement, text_)
+    return ' '.join(html.unescape(text_).split())
+
+
+def stem(word):
+    """
+    Light suffix stripping so related forms share a term ("carriers" and
+    "carrier", "brokering" and "broker", "pricing" and "price").
+    Not a full stemmer - the database backends use Porter.
+    """
+    if len(word) > 4 and word.endswith('ies'):
+        word = word[:-3] + 'y'
+    elif len(word) > 4 and word.endswith(('sses', 'xes', 'ches', 'shes')):
+        word = word[:-2]
+    elif len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        word = word[:-1]
+
+    for suffix in ('ing', 'ed'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            word = word[:-len(suffix)]
+            if word[-1] == word[-2] and word[-1] not in 'lsz':
+                word = word[:-1]  # shipping -> ship
+            break
+
+    if len(word) >= 5 and word.endswith('e') and not word.endswith('ee'):
+        word = word[:-1]
+    return word
+
+
+def index_term(word):
+    """The term a word is indexed under, or None for stop words"""
+    word = word.lower()
+    return None if word in STOP_WORDS else stem(word)
+
+
+def query_terms(query):
+    """Distinct index terms of a search query, in order"""
+    terms = (index_term(match.group(0)) for match in WORD_PATTERN.finditer(query))
+    return list(dict.fromkeys(term for term in terms if term))
+
+
+def query_words(query):
+    """
+    Distinct lowercased words of a search query, stop words removed, in
+    order. Unstemmed: the database backends stem them with their own
+    tokenizer, which would not match words already cut by stem().
+    """
+    words = (match.group(0).lower() for match in WORD_PATTERN.finditer(query))
+    return list(dict.fromkeys(word for word in words if word not in STOP_WORDS))
+
+
+class SearchDocument(_Frozen):
+    """
+    One searchable page or part of a page.
+
+    Attributes:
+        kind: 'module', 'section', 'quiz' or 'glossary'
+        label: Where it is, for display (e.g. "Module 2.3", "Chapter 2 Summary")
+        title: Module title, chapter title, quiz question or glossary term
+        url: Link to the page
+        body: Plain text
+        words: (start, end, term) of each word in body, term None for stop words
+    """
+    __slots__ = ('kind', 'label', 'title', 'url', 'body', 'words')
+
+    def __repr__(self):
+        return f'<SearchDocument {self.label}: {self.title}>'
+
+    @classmethod
+    def create(cls, kind, label, title, url, body):
+        words = tuple(
+            (match.start(), match.end(), index_term(match.group(0)))
+            for match in WORD_PATTERN.finditer(body)
+        )
+        return cls(kind=kind, label=label, title=title, url=url, body=body, words=words)
+
+
+def collect_documents(glossary):
+    """
+    Gather every searchable document from the database and the glossary.
+    Must be called inside a request context (for url_for).
+    """
+    curriculum = get_curriculum_index()
+    chapter_titles = dict(db.session.query(Chapter.id, Chapter.title))
+    documents = []
+
+    for module in Module.query.order_by(Module.chapter_id, Module.display_order):
+        documents.append(SearchDocument.create(
+            'module', f'Module {module.id}', module.title,
+            url_for('module', module_id=module.id), plain_text(module.content_markdown)
+        ))
+
+    for section in ChapterSection.query.order_by(ChapterSection.chapter_id, ChapterSection.id):
+        if section.section_type not in SECTION_LABELS:
+            continue
+        documents.append(SearchDocument.create(
+            'section', f'Chapter {section.chapter_id} {SECTION_LABELS[section.section_type]}',
+            chapter_titles.get(section.chapter_id, ''),
+            url_for('chapter', chapter_num=section.chapter_id, page=section.section_type),
+            plain_text(section.content_markdown)
+        ))
+
+    questions = db.session.query(QuizQuestion.id, QuizQuestion.module_id, QuizQuestion.question, QuizQuestion.explanation)
+    for question_id, module_id, question, explanation in questions:
+        entry = curriculum.get_module(module_id)
+        if not explanation or entry is None or question_id not in entry.quiz_question_ids:
+            continue
+        question_num = entry.quiz_question_ids.index(question_id) + 1
+        documents.append(SearchDocument.create(
+            'quiz', f'Module {module_id} Quiz', plain_text(question),
+            url_for('quiz', module_id=module_id, question_num=question_num), plain_text(explanation)
+        ))
+
+    for term in glossary.terms:
+        page = 'trucks' if term.name in TRUCK_TERM_NAMES else 'glossary'
+        documents.append(SearchDocument.create(
+            'glossary', 'Glossary', term.name, url_for(page, _anchor=term.slug), term.definition
+        ))
+
+    return documents
+
+
+def highlight(body, words, terms, size=SNIPPET_WORDS):
+    """
+    Escaped snippet of about size words around the densest cluster of
+    matching words, with the matches wrapped in <mark>.
+    """
+    if not words:
+        return Markup('')
+
+    hits = [i for i, (_, _, term) in enumerate(words) if term in terms]
+    start = 0
+    if hits:
+        # Window starting at a hit that covers the most hits
+        best, best_count, right = hits[0], 0, 0
+        for left, hit in enumerate(hits):
+            while right < len(hits) and hits[right] < hit + size:
+                right += 1
+            if right - left > best_count:
+                best, best_count = hit, right - left
+        start = max(0, min(best - 4, len(words) - size))
+    end = min(len(words), start + size)
+
+    parts = ['&hellip; ' if start > 0 else '']
+    position = words[start][0]
+    for word_start, word_end, term in words[start:end]:
+        if term in terms:
+            parts.append(escape(body[position:word_start]))
+            parts.append(Markup('<mark>%s</mark>') % body[word_start:word_end])
+            position = word_end
+    parts.append(escape(body[position:words[end - 1][1]]))
+    if end < len(words):
+        parts.append(' &hellip;')
+    return Markup(''.join(parts))
+
+
+def _result(document, snippet, score):
+    return {
+        'kind': document.kind,
+        'label': document.label,
+        'title': document.title,
+        'url': document.url,
+        'snippet': snippet,
+        'score': score,
+    }
+
+
+# ============================================================================
+# IN-MEMORY BM25 INDEX
+# ============================================================================
+
+class SearchIndex:
+    """
+    BM25 inverted index over SearchDocuments. Each posting holds the term's
+    precomputed BM25 weight in the document, so a search only sums them.
+    """
+
+    def __init__(self, source, documents):
+        self.source = source
+        self.documents = documents
+
+        counts = []
+        for document in documents:
+            terms = Counter(term for _, _, term in document.words if term)
+            for term in query_terms(document.title):
+                terms[term] += TITLE_WEIGHT
+            counts.append(terms)
+
+        lengths = [sum(terms.values()) for terms in counts]
+        average = (sum(lengths) / len(lengths)) if lengths else 1.0
+        norms = [BM25_K1 * (1 - BM25_B + BM25_B * length / (average or 1.0)) for length in lengths]
+
+        postings = {}
+        for doc_id, terms in enumerate(counts):
+            for term, tf in terms.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        total = len(documents)
+        self.postings = {}
+        for term, entries in postings.items():
+            idf = math.log(1 + (total - len(entries) + 0.5) / (len(entries) + 0.5))
+            self.postings[term] = tuple(
+                (doc_id, idf * tf * (BM25_K1 + 1) / (tf + norms[doc_id]))
+                for doc_id, tf in entries
+            )
+
+    def __repr__(self):
+        return f'<SearchIndex {len(self.documents)} documents, {len(self.postings)} terms>'
+
+    def search(self, query, limit=20):
+        """
+        Returns:
+            tuple of (list of result dicts, best first, total number of matches)
+        """
+        terms = query_terms(query)
+        scores = {}
+        for term in terms:
+            for doc_id, weight in self.postings.get(term, ()):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        matched = set(terms)
+        results = []
+        for doc_id, score in top:
+            document = self.documents[doc_id]
+            results.append(_result(document, highlight(document.body, document.words, matched), score))
+        return results, len(scores)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index():
+    """
+    Get this worker's in-memory index, rebuilding it when the glossary's
+    source stamp (content version, project.md) changes.
+    """
+    global _index
+
+    glossary = get_glossary()
+    if _index is not None and _index.source == glossary.source:
+        return _index
+
+    with _index_lock:
+        if _index is None or _index.source != glossary.source:
+            _index = SearchIndex(glossary.source, collect_documents(glossary))
+    return _index
+
+
+# ============================================================================
+# DATABASE FULL-TEXT BACKENDS
+# ============================================================================
+
+SQLITE_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_documents USING fts5("
+    "kind UNINDEXED, label UNINDEXED, url UNINDEXED, title, body, tokenize = 'porter unicode61')",
+    "CREATE TABLE IF NOT EXISTS search_index_state (id INTEGER PRIMARY KEY, source VARCHAR(64) NOT NULL)",
+)
+
+POSTGRES_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS search_documents ("
+    "id SERIAL PRIMARY KEY, kind VARCHAR(20) NOT NULL, label TEXT NOT NULL, url TEXT NOT NULL, "
+    "title TEXT NOT NULL, body TEXT NOT NULL, "
+    "document TSVECTOR GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', body), 'B')) STORED)",
+    "CREATE INDEX IF NOT EXISTS ix_search_documents_document ON search_documents USING GIN (document)",
+    "CREATE TABLE IF NOT EXISTS search_index_state (id INTEGER PRIMARY KEY, source VARCHAR(64) NOT NULL)",
+)
+
+# bm25() takes one weight per column: kind, label, url, title, body
+SQLITE_QUERY = text(
+    "SELECT kind, label, title, url, "
+    "snippet(search_documents, 4, :start, :stop, '…', :words) AS snippet, "
+    "-bm25(search_documents, 0, 0, 0, :title_weight, 1) AS score "
+    "FROM search_documents WHERE search_documents MATCH :match "
+    "ORDER BY score DESC LIMIT :limit"
+)
+SQLITE_COUNT = text("SELECT count(*) FROM search_documents WHERE search_documents MATCH :match")
+
+POSTGRES_QUERY = text(
+    "SELECT kind, label, title, url, "
+    "ts_headline('english', body, query, :options) AS snippet, "
+    "ts_rank_cd(document, query) AS score "
+    "FROM search_documents, to_tsquery('english', :match) AS query "
+    "WHERE document @@ query "
+    "ORDER BY score DESC LIMIT :limit"
+)
+POSTGRES_COUNT = text(
+    "SELECT count(*) FROM search_documents WHERE document @@ to_tsquery('english', :match)"
+)
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def database_search_available():
+    """Whether the database has a full-text engine this module can use"""
+    return _dialect() in ('sqlite', 'postgresql')
+
+
+def content_source_key(glossary):
+    """
+    Identifies the searchable content for the database index: the content
+    version and a digest of the glossary terms (project.md can change
+    without a version bump, and its modification time differs per machine).
+    """
+    digest = hashlib.sha1()
+    for term in glossary.terms:
+        digest.update(f'{term.name}\0{term.definition}\0'.encode('utf-8'))
+    return f'{glossary.source[0]}:{digest.hexdigest()[:16]}'
+
+
+def build_search_index():
+    """
+    Fill the database's full-text table with the current content.
+    Must be called inside a request context (for url_for). Commits.
+
+    Returns:
+        Number of documents indexed
+    """
+    dialect = _dialect()
+    if dialect not in ('sqlite', 'postgresql'):
+        raise RuntimeError(f"No full-text search support for {dialect} - the in-memory index is used instead")
+
+    glossary = get_glossary()
+    documents = collect_documents(glossary)
+
+    for statement in (SQLITE_SCHEMA if dialect == 'sqlite' else POSTGRES_SCHEMA):
+        db.session.execute(text(statement))
+    db.session.execute(text("DELETE FROM search_documents"))
+    if documents:
+        db.session.execute(
+            text("INSERT INTO search_documents (kind, label, url, title, body) "
+                 "VALUES (:kind, :label, :url, :title, :body)"),
+            [
+                {'kind': d.kind, 'label': d.label, 'url': d.url, 'title': d.title, 'body': d.body}
+                for d in documents
+            ]
+        )
+    db.session.execute(text("DELETE FROM search_index_state"))
+    db.session.execute(
+        text("INSERT INTO search_index_state (id, source) VALUES (1, :source)"),
+        {'source': content_source_key(glossary)}
+    )
+    db.session.commit()
+
+    invalidate_database_index()
+    return len(documents)
+
+
+# Per-worker: (glossary source, whether the database table is current, checked_at)
+_database_state = (None, False, None)
+
+
+def _database_index_current(glossary):
+    """
+    Whether the database's full-text table holds the current content.
+    Checked at most once every CONTENT_VERSION_CHECK_INTERVAL seconds.
+    """
+    global _database_state
+
+    source, current, checked_at = _database_state
+    interval = current_app.config.get('CONTENT_VERSION_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+    if source == glossary.source and checked_at is not None and now - checked_at < interval:
+        return current
+
+    current = False
+    if database_search_available():
+        try:
+            stored = db.session.execute(text("SELECT source FROM search_index_state WHERE id = 1")).scalar()
+            current = stored == content_source_key(glossary)
+        except SQLAlchemyError:
+            db.session.rollback()  # Not built yet
+    _database_state = (glossary.source, current, now)
+    return current
+
+
+def invalidate_database_index():
+    """Force the next search to re-check the database's full-text table"""
+    global _database_state
+    _database_state = (None, False, None)
+
+
+def _database_match(words, dialect):
+    # Words are plain alphanumeric, so they need no quoting beyond this
+    if dialect == 'sqlite':
+        return ' OR '.join(f'"{word}"' for word in words)
+    return ' | '.join(words)
+
+
+def _database_snippet(snippet):
+    escaped = str(escape(snippet or ''))
+    return Markup(escaped.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>'))
+
+
+def _search_database(query, limit):
+    words = query_words(query)
+    if not words:
+        return [], 0
+
+    dialect = _dialect()
+    params = {'match': _database_match(words, dialect), 'limit': limit}
+    if dialect == 'sqlite':
+        statement, count = SQLITE_QUERY, SQLITE_COUNT
+        params.update(start=HIGHLIGHT_START, stop=HIGHLIGHT_STOP, words=SNIPPET_WORDS, title_weight=TITLE_WEIGHT)
+    else:
+        statement, count = POSTGRES_QUERY, POSTGRES_COUNT
+        params['options'] = (
+            f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, '
+            f'MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}'
+        )
+
+    results = []
+    for row in db.session.execute(statement, params):
+        results.append({
+            'kind': row.kind,
+            'label': row.label,
+            'title': row.title,
+            'url': row.url,
+            'snippet': _database_snippet(row.snippet),
+            'score': row.score,
+        })
+    total = db.session.execute(count, {'match': params['match']}).scalar() if results else 0
+    return results, total
+
+
+# ============================================================================
+# SEARCH
+# ============================================================================
+
+def search_content(query, limit=20):
+    """
+    Search the training content.
+
+    Returns:
+        tuple of (list of result dicts with kind, label, title, url, snippet
+        and score, best first; total number of matching documents)
+    """
+    if not query_terms(query):
+        return [], 0
+
+    global _database_state
+
+    if current_app.config.get('SEARCH_BACKEND', 'auto') == 'auto':
+        glossary = get_glossary()
+        if _database_index_current(glossary):
+            try:
+                return _search_database(query, limit)
+            except SQLAlchemyError:
+                db.session.rollback()
+                current_app.logger.exception('Full-text search failed - using the in-memory index')
+                # Until the next content version check
+                _database_state = (glossary.source, False, time.monotonic())
+
+    return get_search_index().search(query, limit)
@@ -0,0 +1,379 @@
+"""
+Server-side sessions for Trinity Training Guide
+
+By default Flask keeps the whole session (username, preview flag, seen
+chapter intros, ...) in a signed cookie that the browser re-sends with every
+request. With SESSION_BACKEND set, the session data is kept on the server and
+the cookie only carries a signed, opaque session ID. This keeps requests
+small, and lets the server end a user's sessions (e.g. after
+`flask user-reset`) without waiting for them to log in again.
+
+Backends:
+    'cookie'     - Flask's default signed cookie sessions (no server storage)
+    'database'   - user_sessions table in the application database
+    'filesystem' - one file per session in SESSION_FILE_DIR
+    'redis'      - any Redis-compatible client (redis-py, or a local stand-in
+                   implementing get/setex/delete/sadd/srem/smembers/expire)
+
+Sessions expire PERMANENT_SESSION_LIFETIME seconds after their last write. The
+expiry is pushed back at most once every SESSION_REFRESH_INTERVAL seconds, so
+a plain page view does not write to the store. A background thread per worker
+removes expired sessions every SESSION_SWEEP_INTERVAL seconds (the Redis
+backend relies on key TTLs instead).
+"""
+
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import delete, select
+from werkzeug.datastructures import CallbackDict
+
+from models import db, UserSession
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session whose data lives in a SessionBackend"""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.loaded_user_id = (initial or {}).get('user_id')
+        self.modified = False
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+class SessionBackend:
+    """
+    Storage for serialized sessions. Payloads are strings; expires_at is a
+    Unix timestamp.
+    """
+
+    def load(self, sid):
+        """Get the payload of a session, or None if it is missing or expired"""
+        raise NotImplementedError
+
+    def save(self, sid, payload, user_id, expires_at):
+        raise NotImplementedError
+
+    def delete(self, sid):
+        raise NotImplementedError
+
+    def delete_user(self, user_id):
+        """End every session of a user. Returns the number of sessions removed."""
+        raise NotImplementedError
+
+    def sweep(self):
+        """Remove expired sessions. Returns the number of sessions removed."""
+        return 0
+
+
+class DatabaseSessionBackend(SessionBackend):
+    """
+    Sessions in the user_sessions table. Uses its own short transactions so
+    saving a session never commits work pending in the request's db.session.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # The table is created by schema.sql / migrate_users_schema.py. Only
+        # development and test apps create it here, so workers never run DDL.
+        if app.debug or app.testing:
+            with app.app_context():
+                UserSession.__table__.create(bind=db.engine, checkfirst=True)
+
+    def load(self, sid):
+        table = UserSession.__table__
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                select(table.c.data, table.c.expires_at).where(table.c.id == sid)
+            ).first()
+        if row is None or row.expires_at <= datetime.utcnow():
+            return None
+        return row.data
+
+    def save(self, sid, payload, user_id, expires_at):
+        table = UserSession.__table__
+        values = {
+            'user_id': user_id,
+            'data': payload,
+            'expires_at': datetime.utcfromtimestamp(expires_at)
+        }
+        with db.engine.begin() as conn:
+            updated = conn.execute(table.update().where(table.c.id == sid).values(**values))
+            if updated.rowcount == 0:
+                conn.execute(table.insert().values(id=sid, **values))
+
+    def delete(self, sid):
+        table = UserSession.__table__
+        with db.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.id == sid))
+
+    def delete_user(self, user_id):
+        table = UserSession.__table__
+        with db.engine.begin() as conn:
+            return conn.execute(delete(table).where(table.c.user_id == user_id)).rowcount
+
+    def sweep(self):
+        table = UserSession.__table__
+        with self.app.app_context(), db.engine.begin() as conn:
+            return conn.execute(
+                delete(table).where(table.c.expires_at <= datetime.utcnow())
+            ).rowcount
+
+
+class FilesystemSessionBackend(SessionBackend):
+    """Sessions as small JSON files, one per session ID"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, sid):
+        return self.directory / f'{sid}.json'
+
+    def _read(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, sid):
+        record = self._read(self._path(sid))
+        if record is None or record['expires_at'] <= time.time():
+            return None
+        return record['data']
+
+    def save(self, sid, payload, user_id, expires_at):
+        path = self._path(sid)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'user_id': user_id, 'expires_at': expires_at, 'data': payload}, f)
+        os.replace(tmp_path, path)
+
+    def delete(self, sid):
+        try:
+            self._path(sid).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _remove_where(self, predicate):
+        removed = 0
+        for path in self.directory.glob('*.json'):
+            record = self._read(path)
+            if record is not None and predicate(record):
+                try:
+                    path.unlink()
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def delete_user(self, user_id):
+        return self._remove_where(lambda record: record['user_id'] == user_id)
+
+    def sweep(self):
+        now = time.time()
+        return self._remove_where(lambda record: record['expires_at'] <= now)
+
+
+class RedisSessionBackend(SessionBackend):
+    """
+    Sessions in a Redis-compatible store. Expiry uses key TTLs, and a set per
+    user tracks that user's session IDs so they can be ended together.
+    """
+
+    def __init__(self, client, prefix='session:'):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, sid):
+        return f'{self.prefix}{sid}'
+
+    def _user_key(self, user_id):
+        return f'{self.prefix}user:{user_id}'
+
+    def load(self, sid):
+        payload = self.client.get(self._key(sid))
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8')
+        return payload
+
+    def save(self, sid, payload, user_id, expires_at):
+        ttl = max(1, int(expires_at - time.time()))
+        self.client.setex(self._key(sid), ttl, payload)
+        if user_id is not None:
+            self.client.sadd(self._user_key(user_id), sid)
+            self.client.expire(self._user_key(user_id), ttl)
+
+    def delete(self, sid):
+        self.client.delete(self._key(sid))
+
+    def delete_user(self, user_id):
+        sids = [s.decode('utf-8') if isinstance(s, bytes) else s
+                for s in self.client.smembers(self._user_key(user_id))]
+        removed = self.client.delete(*[self._key(sid) for sid in sids]) if sids else 0
+        self.client.delete(self._user_key(user_id))
+        return removed
+
+
+# ============================================================================
+# FLASK SESSION INTERFACE
+# ============================================================================
+
+class ServerSideSessionInterface(SessionInterface):
+    """Keeps session data in a SessionBackend; the cookie holds a signed session ID"""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._sweeper = None
+        self._sweeper_pid = None
+        self._sweeper_lock = threading.Lock()
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-side-session')
+
+    def open_session(self, app, request):
+        self._ensure_sweeper(app)
+
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode('utf-8')
+            except BadSignature:
+                sid = None
+
+            payload = self.backend.load(sid) if sid else None
+            if payload is not None:
+                record = self.serializer.loads(payload)
+                return ServerSideSession(record['data'], sid=sid, expires_at=record['expires_at'])
+
+        return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.sid is not None:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        refresh_interval = app.config.get('SESSION_REFRESH_INTERVAL', 60 * 60)
+        lifetime = app.permanent_session_lifetime.total_seconds()
+
+        # A new login gets a new session ID (prevents session fixation)
+        new_sid = session.sid is None or session.get('user_id') != session.loaded_user_id
+        if new_sid and session.sid is not None:
+            self.backend.delete(session.sid)
+
+        needs_refresh = session.expires_at is None or session.expires_at - now < lifetime - refresh_interval
+        if not (new_sid or session.modified or needs_refresh):
+            return
+
+        if new_sid:
+            session.sid = secrets.token_urlsafe(32)
+        session.expires_at = now + lifetime
+
+        payload = self.serializer.dumps({'data': dict(session), 'expires_at': session.expires_at})
+        self.backend.save(session.sid, payload, session.get('user_id'), session.expires_at)
+
+        if new_sid or session.permanent:
+            response.set_cookie(
+                name,
+                self._signer(app).sign(session.sid).decode('utf-8'),
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+
+    def _ensure_sweeper(self, app):
+        """Start this worker's sweeper thread on first use"""
+        if self._sweeper_pid == os.getpid():
+            return
+        with self._sweeper_lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            interval = app.config.get('SESSION_SWEEP_INTERVAL', 60 * 60)
+            self._sweeper = threading.Thread(
+                target=self._sweep_forever, args=(app, interval), name='session-sweeper', daemon=True
+            )
+            self._sweeper_pid = os.getpid()
+            self._sweeper.start()
+
+    def _sweep_forever(self, app, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                removed = self.backend.sweep()
+                if removed:
+                    app.logger.info('Removed %d expired sessions', removed)
+            except Exception:
+                app.logger.exception('Session sweep failed')
+
+
+def create_session_backend(app):
+    """Create the backend named by SESSION_BACKEND, or None for cookie sessions"""
+    name = (app.config.get('SESSION_BACKEND') or 'cookie').lower()
+
+    if name == 'cookie':
+        return None
+    if name == 'database':
+        return DatabaseSessionBackend(app)
+    if name == 'filesystem':
+        return FilesystemSessionBackend(app.config.get('SESSION_FILE_DIR') or Path(app.instance_path) / 'sessions')
+    if name == 'redis':
+        client = app.config.get('SESSION_REDIS')
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("SESSION_BACKEND='redis' needs the redis package or a SESSION_REDIS client")
+            client = redis.from_url(app.config['SESSION_REDIS_URL'])
+        return RedisSessionBackend(client)
+
+    raise ValueError(f"Unknown SESSION_BACKEND: {name}")
+
+
+def init_session_store(app):
+    """Install server-side sessions on the app if SESSION_BACKEND asks for them"""
+    backend = create_session_backend(app)
+    if backend is not None:
+        app.session_interface = ServerSideSessionInterface(backend)
+
+
+def invalidate_user_sessions(app, user_id):
+    """
+    End every server-side session of a user.
+
+    Returns:
+        Number of sessions removed, or None with cookie sessions (which the
+        server cannot end - users.session_version covers those)
+    """
+    interface = app.session_interface
+    if not isinstance(interface, ServerSideSessionInterface):
+        return None
+    return interface.backend.delete_user(user_id)
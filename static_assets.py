@@ -0,0 +1,217 @@
+"""
+Fingerprinted static assets for Trinity Training Guide
+
+`flask build-assets` copies every file in static/ to static/dist/ under a
+content-hashed name (css/styles.css -> dist/css/styles.3f2a9c1b0d.css) and
+records the mapping in static/dist/manifest.json. Byte-identical files (e.g.
+images/step_deck.jpeg and images/step_deck_new.jpeg) share one hashed copy.
+Text assets also get pre-compressed .gz siblings, and .br siblings when the
+brotli package is installed.
+
+With STATIC_FINGERPRINTING enabled and a manifest present,
+url_for('static', filename=...) returns the hashed URL. A hashed file never
+changes, so it is served with a far-future immutable Cache-Control header,
+and as its pre-compressed sibling when the browser accepts that encoding.
+Files missing from the manifest are served as before.
+
+The manifest is read once per worker at startup, so run `flask build-assets`
+before (re)starting the workers on deploy.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from pathlib import Path, PurePosixPath
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # Optional - only .gz siblings are written without it
+    brotli = None
+
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+IMMUTABLE_POLICY = 'public, max-age=31536000, immutable'
+
+# Source files that are not served assets
+SKIP_SUFFIXES = {'.md'}
+SKIP_DIRS = {DIST_DIR, 'critical'}  # critical/ is inlined into pages, never requested
+
+# Only text formats gain anything from compression
+COMPRESSIBLE_SUFFIXES = {'.css', '.js', '.svg', '.json', '.txt', '.map'}
+MIN_COMPRESS_BYTES = 256
+
+# Preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def fingerprinted_name(filename, digest):
+    """'css/styles.css' -> 'dist/css/styles.<digest>.css'"""
+    path = PurePosixPath(filename)
+    return str(PurePosixPath(DIST_DIR) / path.with_name(f'{path.stem}.{digest}{path.suffix}'))
+
+
+def _compress(data, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def _write_file(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def build_assets(static_folder, clean=False):
+    """
+    Write the fingerprinted copies, compressed siblings and manifest.
+
+    Args:
+        static_folder: The app's static folder
+        clean: Remove files in dist/ that the new manifest no longer uses
+
+    Returns:
+        The manifest dict
+    """
+    static = Path(static_folder)
+    dist = static / DIST_DIR
+
+    sources = sorted(
+        path for path in static.rglob('*')
+        if path.is_file()
+        and path.relative_to(static).parts[0] not in SKIP_DIRS
+        and path.suffix.lower() not in SKIP_SUFFIXES
+    )
+
+    assets = {}
+    encodings = {}
+    by_digest = {}
+    for path in sources:
+        filename = path.relative_to(static).as_posix()
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+
+        # Identical content is served from the first copy's URL
+        if digest in by_digest:
+            assets[filename] = by_digest[digest]
+            continue
+
+        hashed = fingerprinted_name(filename, digest[:10])
+        by_digest[digest] = assets[filename] = hashed
+        target = static / hashed
+        if not target.exists():
+            _write_file(target, data)
+
+        if path.suffix.lower() in COMPRESSIBLE_SUFFIXES and len(data) >= MIN_COMPRESS_BYTES:
+            available = []
+            for encoding, suffix in ENCODINGS:
+                if encoding == 'br' and brotli is None:
+                    continue
+                compressed = _compress(data, encoding)
+                if len(compressed) < len(data):
+                    _write_file(static / f'{hashed}{suffix}', compressed)
+                    available.append(encoding)
+            if available:
+                encodings[hashed] = available
+
+    manifest = {'assets': assets, 'encodings': encodings}
+    _write_file(dist / MANIFEST_NAME, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+    if clean:
+        keep = {dist / MANIFEST_NAME}
+        for hashed in set(assets.values()):
+            keep.add(static / hashed)
+            keep.update(static / f'{hashed}{suffix}' for _, suffix in ENCODINGS)
+        for path in dist.rglob('*'):
+            if path.is_file() and path not in keep:
+                path.unlink()
+        for path in sorted(dist.rglob('*'), reverse=True):
+            if path.is_dir() and not any(path.iterdir()):
+                shutil.rmtree(path)
+
+    return manifest
+
+
+# ============================================================================
+# SERVING
+# ============================================================================
+
+class AssetManifest:
+    """Logical static filename -> fingerprinted filename, plus pre-compressed encodings"""
+
+    def __init__(self, assets, encodings):
+        self.assets = assets
+        self.encodings = encodings
+
+    @classmethod
+    def load(cls, static_folder):
+        """Read static/dist/manifest.json, or return None if it has not been built"""
+        try:
+            with open(Path(static_folder) / DIST_DIR / MANIFEST_NAME, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        return cls(manifest['assets'], manifest.get('encodings', {}))
+
+    def __len__(self):
+        return len(self.assets)
+
+
+def _fingerprint_url(endpoint, values):
+    """url_defaults hook: point url_for('static', ...) at the hashed file"""
+    if endpoint != 'static':
+        return
+    filename = values.get('filename')
+    hashed = current_app.extensions['static_assets'].assets.get(filename)
+    if hashed:
+        values['filename'] = hashed
+
+
+def serve_static(filename):
+    """
+    Static view: hashed files get immutable caching and, when the browser
+    accepts it, their pre-compressed sibling. Other files are served as usual.
+    """
+    if not filename.startswith(f'{DIST_DIR}/'):
+        return current_app.send_static_file(filename)
+
+    available = current_app.extensions['static_assets'].encodings.get(filename, ())
+    response = None
+    for encoding, suffix in ENCODINGS:
+        if encoding in available and request.accept_encodings[encoding] > 0:
+            response = send_from_directory(
+                current_app.static_folder, f'{filename}{suffix}',
+                mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            )
+            response.content_encoding = encoding
+            break
+    if response is None:
+        response = current_app.send_static_file(filename)
+
+    response.headers['Cache-Control'] = IMMUTABLE_POLICY
+    if available:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_static_assets(app):
+    """Serve fingerprinted assets if STATIC_FINGERPRINTING is on and a manifest has been built"""
+    if not app.config.get('STATIC_FINGERPRINTING', True):
+        return
+
+    manifest = AssetManifest.load(app.static_folder)
+    if manifest is None:
+        app.logger.info('No static asset manifest - run `flask build-assets` to fingerprint static files')
+        return
+
+    app.extensions['static_assets'] = manifest
+    app.url_defaults(_fingerprint_url)
+    app.view_functions['static'] = serve_static
@@ -3,7 +3,8 @@ Database Sync Script - Sync Local SQLite to Production PostgreSQL
 
 This script transfers data from the local SQLite database to the production
 PostgreSQL database on the server. It handles all models and maintains
-referential integrity.
+referential integrity. After syncing content it bumps the production content
+version, so running workers pick up the new content.
 
 Usage:
     python sync_to_production.py                    # Full sync
@@ -33,8 +34,8 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from flask import Flask
 from models import (
-    db, Chapter, Module, ChapterSection, QuizQuestion,
-    User, UserProgress, UserQuizAnswer, GlossaryTerm
+    db, Chapter, Module, ModulePage, ChapterSection, QuizQuestion,
+    User, UserProgress, UserQuizAnswer, UserState, GlossaryTerm, bump_content_version
 )
 from config import get_config, DevelopmentConfig, ProductionConfig
 
@@ -134,6 +135,17 @@ class DatabaseSyncer:
             local_session.close()
             prod_session.close()
     
+    @staticmethod
+    def copy_module_pages(local_module):
+        """Copies of a module's compiled pages, which go with its content_hash"""
+        return [
+            ModulePage(
+                page_num=page.page_num, line_start=page.line_start,
+                line_end=page.line_end, content_html=page.content_html
+            )
+            for page in local_module.pages
+        ]
+    
     def sync_modules(self):
         """Sync modules (depends on chapters)"""
         if not self.should_sync_table('modules'):
@@ -162,6 +174,9 @@ class DatabaseSyncer:
                     prod_module.chapter_id = local_module.chapter_id
                     prod_module.title = local_module.title
                     prod_module.content_markdown = local_module.content_markdown
+                    prod_module.rendered_html = local_module.rendered_html
+                    prod_module.content_hash = local_module.content_hash
+                    prod_module.pages = self.copy_module_pages(local_module)
                     prod_module.display_order = local_module.display_order
                     prod_module.created_at = local_module.created_at
                     if not self.dry_run:
@@ -175,6 +190,9 @@ class DatabaseSyncer:
                         chapter_id=local_module.chapter_id,
                         title=local_module.title,
                         content_markdown=local_module.content_markdown,
+                        rendered_html=local_module.rendered_html,
+                        content_hash=local_module.content_hash,
+                        pages=self.copy_module_pages(local_module),
                         display_order=local_module.display_order,
                         created_at=local_module.created_at
                     )
@@ -367,6 +385,35 @@ class DatabaseSyncer:
             local_session.close()
             prod_session.close()
     
+    def sync_content_version(self):
+        """
+        Bump the production content version stamp once the content tables are
+        synced, so production workers drop their cached curriculum, pages,
+        quiz bundles, glossary and search index.
+        """
+        content_tables = ['chapters', 'modules', 'chapter_sections', 'quiz_questions', 'glossary_terms']
+        if not any(self.should_sync_table(table) for table in content_tables):
+            return
+        
+        print("\n[*] Bumping Content Version...")
+        prod_session = self.ProdSession()
+        
+        try:
+            stamp = bump_content_version(prod_session)
+            if not self.dry_run:
+                prod_session.commit()
+                prod_session.refresh(stamp)
+                print(f"   [OK] Content version is now {stamp.version}")
+            else:
+                print("   Would bump the content version")
+        
+        except Exception as e:
+            print(f"   [!] Error bumping content version: {e}")
+            self.stats['errors']['content_version'] = str(e)
+            prod_session.rollback()
+        finally:
+            prod_session.close()
+    
     def sync_users(self):
         """Sync users (no dependencies) and build ID mapping"""
         if not self.should_sync_table('users'):
@@ -602,6 +649,40 @@ class DatabaseSyncer:
             local_session.close()
             prod_session.close()
     
+    def reset_user_state(self):
+        """
+        Clear the content version of the synced users' progress state, so
+        their completed-modules masks (which the synced answers and progress
+        bypassed) are recomputed from the answers instead of trusted.
+        """
+        if not (self.should_sync_table('user_progress') or self.should_sync_table('user_quiz_answers')):
+            return
+        
+        print("\n[*] Resetting User Progress State...")
+        prod_user_ids = sorted(set(self.user_id_map.values()))
+        if self.dry_run:
+            print(f"   Would reset progress state for {len(prod_user_ids)} users")
+            return
+        if not prod_user_ids:
+            print("   No synced users")
+            return
+        
+        prod_session = self.ProdSession()
+        
+        try:
+            reset = prod_session.query(UserState).filter(
+                UserState.user_id.in_(prod_user_ids)
+            ).update({UserState.content_version: None}, synchronize_session=False)
+            prod_session.commit()
+            print(f"   [OK] Reset progress state for {reset} users")
+        
+        except Exception as e:
+            print(f"   [!] Error resetting user progress state: {e}")
+            self.stats['errors']['user_state'] = str(e)
+            prod_session.rollback()
+        finally:
+            prod_session.close()
+    
     def sync_all(self):
         """Sync all tables in the correct order"""
         print("="*60)
@@ -617,11 +698,13 @@ class DatabaseSyncer:
         self.sync_chapter_sections()
         self.sync_quiz_questions()
         self.sync_glossary_terms()
+        self.sync_content_version()
         
         if not self.skip_users:
             self.sync_users()
             self.sync_user_progress()
             self.sync_user_quiz_answers()
+            self.reset_user_state()
         
         self.print_summary()
     
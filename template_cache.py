@@ -0,0 +1,79 @@
+"""
+Template compilation for Trinity Training Guide
+
+There are over a hundred chapter and module templates, plus toc.html (55KB).
+Compiling all of them takes about a third of a second. Each gunicorn worker
+used to pay that cost template by template, on the first request for each
+page, and again every time the worker was recycled.
+
+init_template_cache(app) does two things:
+- It puts a file-system bytecode cache on app.jinja_env. A template that
+  any worker has compiled before is loaded as Python bytecode instead of
+  being parsed and compiled again. Entries are checked against the template
+  source, so edited templates are recompiled.
+- With TEMPLATE_WARMUP on, it loads every template at startup, so the first
+  request for each page is as fast as later ones. With gunicorn --preload
+  this happens once in the master process and the workers inherit the
+  compiled templates.
+
+The startup time and the warm-up time are logged and available at
+/metrics/startup.
+"""
+
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+
+TEMPLATE_SUFFIXES = ('.html',)
+
+
+def warm_templates(app):
+    """
+    Load every template into the Jinja environment's cache.
+
+    Returns:
+        Number of templates loaded
+    """
+    env = app.jinja_env
+    names = [name for name in env.list_templates() if name.endswith(TEMPLATE_SUFFIXES)]
+    if env.cache is not None and env.cache.capacity < len(names):
+        env.cache.capacity = len(names)  # Otherwise warm templates would be evicted
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def init_template_cache(app, started=None):
+    """
+    Configure the bytecode cache and warm the templates.
+
+    Args:
+        app: The Flask app (before any template has been rendered)
+        started: time.perf_counter() when the process began loading the
+                 app, for reporting the startup time
+    """
+    stats = {'bytecode_cache': None, 'templates': 0, 'warmup_ms': None, 'startup_ms': None}
+
+    if app.config.get('JINJA_BYTECODE_CACHE', True):
+        directory = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(directory, pattern='trinity-%s.cache')
+        app.jinja_env.bytecode_cache = bytecode_cache
+        stats['bytecode_cache'] = bytecode_cache.directory
+
+    if app.config.get('TEMPLATE_WARMUP', True):
+        warmup_started = time.perf_counter()
+        stats['templates'] = warm_templates(app)
+        stats['warmup_ms'] = round((time.perf_counter() - warmup_started) * 1000, 1)
+
+    if started is not None:
+        stats['startup_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    app.extensions['template_cache'] = stats
+    if stats['warmup_ms'] is not None:
+        app.logger.info('Compiled %d templates in %s ms', stats['templates'], stats['warmup_ms'])
+    if stats['startup_ms'] is not None:
+        app.logger.info('App started in %s ms', stats['startup_ms'])
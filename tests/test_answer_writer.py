@@ -0,0 +1,74 @@
+"""
+Tests for AnswerWriter: a row that cannot be written is dropped on its own
+instead of taking the rest of its batch with it, and write_user() writes
+one user's queued answers at once.
+"""
+
+import pytest
+from flask import Flask
+
+from answer_writer import AnswerWriter
+from config import TestingConfig
+from models import db, Chapter, Module, QuizQuestion, User, UserQuizAnswer
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.from_object(TestingConfig)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Chapter(id=1, title='Chapter 1', display_order=1))
+        db.session.add(Module(id='1.1', chapter_id=1, title='Module 1.1', display_order=0))
+        for n in range(2):
+            db.session.add(QuizQuestion(
+                id=f'q{n}', module_id='1.1', question='?', choice_a='a', choice_b='b',
+                choice_c='c', choice_d='d', correct_choice='a', display_order=n
+            ))
+        db.session.add_all([User(id=1, username='one'), User(id=2, username='two')])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def graded(question_id, selected_choice='a'):
+    return {
+        'question_id': question_id,
+        'selected_choice': selected_choice,
+        'is_correct': selected_choice == 'a',
+        'answer_order': ['a', 'b', 'c', 'd'],
+    }
+
+
+def test_bad_row_does_not_drop_its_batch(app):
+    writer = AnswerWriter(app)
+    writer.submit(1, '1.1', [graded('q0'), graded('q1', 'b')])
+    writer.submit(None, '1.1', [graded('q0')])  # Violates user_id NOT NULL
+    writer.submit(2, '1.1', [graded('q1')])
+    writer.stop()
+
+    answers = {(a.user_id, a.quiz_question_id): a.selected_choice for a in UserQuizAnswer.query}
+    assert answers == {(1, 'q0'): 'a', (1, 'q1'): 'b', (2, 'q1'): 'a'}
+
+    stats = writer.stats()
+    assert stats['written'] == 3
+    assert stats['dropped'] == 1
+    assert stats['depth'] == 0
+
+
+def test_write_user_writes_only_that_users_answers(app):
+    app.config['ANSWER_QUEUE_FLUSH_INTERVAL'] = 60
+    writer = AnswerWriter(app)
+    writer.submit(1, '1.1', [graded('q0')])
+    writer.submit(2, '1.1', [graded('q0')])
+    writer.submit(1, '1.1', [graded('q1')])
+    writer.write_user(1)
+
+    answered = {(a.user_id, a.quiz_question_id) for a in UserQuizAnswer.query}
+    assert answered == {(1, 'q0'), (1, 'q1')}
+    assert writer.stats()['depth'] == 1
+
+    writer.stop()
+    assert UserQuizAnswer.query.count() == 3
@@ -0,0 +1,115 @@
+"""
+Tests for glossary_links: terms are linked once, never inside another link
+and never inside the elements in SKIP_TAGS.
+"""
+
+import random
+from html.parser import HTMLParser
+
+from glossary import GlossaryEntry
+from glossary_links import SKIP_TAGS, GlossaryLinker, TermMatcher
+
+
+TERMS = [
+    ('ltl', 'Less-Than-Truckload (LTL)', 'Freight that does not fill a trailer.'),
+    ('reefer', 'Reefer', 'A refrigerated trailer.'),
+    ('rate-con', 'Rate Confirmation', 'The signed load agreement.'),
+    ('rate', 'Rate', 'The price of a load.'),
+]
+
+WORDS = ['LTL', 'reefers', 'Rate Confirmation', 'rate', 'less than truckload', 'loads', 'and', 'the']
+WRAPPERS = ['p', 'li', 'strong', 'em'] + sorted(SKIP_TAGS - {'svg', 'select'})
+
+
+def make_linker():
+    terms = [
+        GlossaryEntry(slug=slug, name=name, module=None, definition=definition, search_text='')
+        for slug, name, definition in TERMS
+    ]
+    return GlossaryLinker('test', terms, {slug: f'/glossary#{slug}' for slug, _, _ in TERMS})
+
+
+class LinkChecker(HTMLParser):
+    """Records glossary links, the depth of nested <a> and links opened inside SKIP_TAGS"""
+
+    def __init__(self):
+        super().__init__()
+        self.stack = []
+        self.max_link_depth = 0
+        self.links = []
+        self.links_in_skip_tags = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            if ('class', 'glossary-term-link') in attrs:
+                self.links.append(dict(attrs)['href'])
+                if any(open_tag in SKIP_TAGS for open_tag in self.stack):
+                    self.links_in_skip_tags.append(list(self.stack))
+            self.max_link_depth = max(self.max_link_depth, self.stack.count('a') + 1)
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.stack:
+            del self.stack[len(self.stack) - 1 - self.stack[::-1].index(tag):]
+
+
+def check(html):
+    checker = LinkChecker()
+    checker.feed(html)
+    checker.close()
+    return checker
+
+
+def random_fragment(rng, depth=0, in_link=False):
+    """Random valid HTML (no <a> inside <a>) of terms, other words and nested tags"""
+    parts = []
+    for _ in range(rng.randint(1, 4)):
+        if depth < 3 and rng.random() < 0.5:
+            tag = rng.choice([wrapper for wrapper in WRAPPERS if not (in_link and wrapper == 'a')])
+            attrs = ' href="/somewhere"' if tag == 'a' else ''
+            inner = random_fragment(rng, depth + 1, in_link or tag == 'a')
+            parts.append(f'<{tag}{attrs}>{inner}</{tag}>')
+        else:
+            parts.append(' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 5))))
+    return ' '.join(parts)
+
+
+def test_term_matcher_finds_every_occurrence():
+    matcher = TermMatcher({'rate': 'rate', 'rate confirmation': 'rate-con', 'ate': 'ate'})
+    found = sorted(matcher.finditer('the rate confirmation'))
+    assert found == [(4, 8, 'rate'), (4, 21, 'rate-con'), (5, 8, 'ate')]
+
+
+def test_links_first_mention_outside_skip_tags():
+    html = (
+        '<header>LTL</header><main>'
+        '<h2>LTL basics</h2>'
+        '<a href="/elsewhere">Book a reefer</a>'
+        '<p>Most LTL loads ship in a reefer. More LTL here.</p>'
+        '<pre>Rate Confirmation</pre><p>Sign the Rate Confirmation.</p>'
+        '</main>'
+    )
+    linked = make_linker().link(html)
+    checker = check(linked)
+
+    assert checker.links == ['/glossary#ltl', '/glossary#reefer', '/glossary#rate-con']
+    assert checker.max_link_depth == 1
+    assert not checker.links_in_skip_tags
+    assert linked.startswith('<header>LTL</header><main><h2>LTL basics</h2><a href="/elsewhere">Book a reefer</a>')
+    assert '<pre>Rate Confirmation</pre>' in linked
+
+
+def test_terms_the_template_links_are_left_alone():
+    html = '<main><a href="/glossary#reefer" class="glossary-term-link">reefer</a><p>A reefer.</p></main>'
+    assert make_linker().link(html) == html
+
+
+def test_never_nests_links_or_links_inside_skip_tags():
+    linker = make_linker()
+    rng = random.Random(20)
+    for _ in range(300):
+        html = f'<main>{random_fragment(rng)}</main>'
+        checker = check(linker.link(html))
+        assert checker.max_link_depth <= 1, html
+        assert not checker.links_in_skip_tags, html
+        assert len(checker.links) == len(set(checker.links)), html
@@ -0,0 +1,43 @@
+"""
+Tests for ModuleQuizBundle.grade: answers are graded against the
+deterministic shuffle order, and malformed selections are rejected.
+"""
+
+import pytest
+from flask import Flask
+
+from config import TestingConfig
+from models import QuizQuestion, deterministic_answer_order
+from quiz_bundle import BundleQuestion, ModuleQuizBundle
+
+
+@pytest.fixture
+def bundle():
+    app = Flask(__name__)
+    app.config.from_object(TestingConfig)
+    question = QuizQuestion(
+        id='q1', module_id='1.1', question='?', choice_a='a', choice_b='b',
+        choice_c='c', choice_d='d', correct_choice='c', explanation='Because.'
+    )
+    with app.app_context():
+        yield ModuleQuizBundle(1, '1.1', 1, 1, None, [BundleQuestion(question)], {})
+
+
+def test_grades_against_the_shuffled_order(bundle):
+    order = deterministic_answer_order(1, 'q1')
+    for index, letter in enumerate(order):
+        result = bundle.grade('q1', index)
+        assert result['selected_choice'] == letter
+        assert result['is_correct'] == (letter == 'c')
+        assert result['answer_order'] == order
+
+
+@pytest.mark.parametrize('selected_index', [True, False, -1, 4, 1.0, '1', None])
+def test_rejects_invalid_selected_index(bundle, selected_index):
+    with pytest.raises(ValueError):
+        bundle.grade('q1', selected_index)
+
+
+def test_rejects_questions_from_other_modules(bundle):
+    with pytest.raises(ValueError):
+        bundle.grade('q2', 0)
@@ -0,0 +1,62 @@
+"""
+Tests for search: the database full-text backend and the in-memory BM25
+index find the same documents for the same query.
+"""
+
+import pytest
+from flask import Flask
+from sqlalchemy import text
+
+from config import TestingConfig
+from models import db
+from search import SQLITE_SCHEMA, SearchDocument, SearchIndex, _search_database, query_words
+
+
+DOCUMENTS = [
+    ('module', 'Module 1.1', 'Cargo Insurance', '/module/1.1',
+     'Every carrier must carry cargo insurance before it is licensed to haul freight.'),
+    ('module', 'Module 2.1', 'Pricing Loads', '/module/2.1',
+     'Pricing a load starts with the lane, the equipment and the current market rate.'),
+    ('section', 'Chapter 2 Summary', 'Brokering Basics', '/chapter/2/summary',
+     'Licensed brokers arrange shipping between shippers and carriers.'),
+    ('glossary', 'Glossary', 'Reefer', '/glossary#reefer',
+     'A refrigerated trailer for shipments that must stay cold.'),
+]
+
+QUERIES = ['insurance', 'pricing', 'licensed', 'carriers', 'shipping', 'refrigerated trailer', 'the loads']
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.from_object(TestingConfig)
+    db.init_app(app)
+    with app.app_context():
+        for statement in SQLITE_SCHEMA:
+            db.session.execute(text(statement))
+        db.session.execute(
+            text("INSERT INTO search_documents (kind, label, url, title, body) "
+                 "VALUES (:kind, :label, :url, :title, :body)"),
+            [
+                {'kind': kind, 'label': label, 'url': url, 'title': title, 'body': body}
+                for kind, label, title, url, body in DOCUMENTS
+            ]
+        )
+        db.session.commit()
+        yield app
+        db.session.remove()
+
+
+def test_query_words_are_unstemmed():
+    assert query_words('Insurance and the PRICING of licensed loads') == ['insurance', 'pricing', 'licensed', 'loads']
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_database_and_memory_backends_agree(app, query):
+    index = SearchIndex('test', [SearchDocument.create(*document) for document in DOCUMENTS])
+    memory_results, memory_total = index.search(query)
+    database_results, database_total = _search_database(query, 20)
+
+    assert memory_results, query
+    assert {r['url'] for r in database_results} == {r['url'] for r in memory_results}
+    assert database_total == memory_total
@@ -0,0 +1,138 @@
+"""
+Tests for the UserState completed-modules mask: masks from
+compute_completed_mask and from per-answer updates agree with the
+aggregate answer counts.
+"""
+
+import pytest
+from flask import Flask
+from sqlalchemy import func
+
+from config import TestingConfig
+from models import (
+    db, Chapter, Module, QuizQuestion, User, UserQuizAnswer, UserState,
+    bump_content_version, compute_completed_mask, get_module_bits, mark_intro_seen,
+    rebuild_user_state, set_module_complete_in_state
+)
+
+
+# {module_id: number of quiz questions}
+MODULES = {'1.1': 2, '1.2': 3, '1.2.1': 1, '1.10': 2, '2.1': 0, '2.2': 1}
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.from_object(TestingConfig)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Chapter(id=1, title='Chapter 1', display_order=1),
+            Chapter(id=2, title='Chapter 2', display_order=2),
+        ])
+        for order, (module_id, quiz_count) in enumerate(MODULES.items()):
+            db.session.add(Module(
+                id=module_id, chapter_id=int(module_id.split('.')[0]),
+                title=f'Module {module_id}', display_order=order
+            ))
+            for n in range(quiz_count):
+                db.session.add(QuizQuestion(
+                    id=f'q{module_id}_{n}', module_id=module_id, question='?',
+                    choice_a='a', choice_b='b', choice_c='c', choice_d='d',
+                    correct_choice='a', display_order=n
+                ))
+        db.session.add(User(id=1, username='trainee'))
+        bump_content_version()
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def answer(module_id, n, selected_choice='a'):
+    db.session.add(UserQuizAnswer(
+        user_id=1, quiz_question_id=f'q{module_id}_{n}', selected_choice=selected_choice
+    ))
+
+
+def completed_by_aggregate():
+    """Completed modules from the aggregate query ProgressSnapshot falls back to"""
+    answered = dict(
+        db.session.query(QuizQuestion.module_id, func.count(UserQuizAnswer.id))
+        .join(UserQuizAnswer, UserQuizAnswer.quiz_question_id == QuizQuestion.id)
+        .filter(UserQuizAnswer.user_id == 1, UserQuizAnswer.selected_choice.isnot(None))
+        .group_by(QuizQuestion.module_id)
+        .all()
+    )
+    return {module_id for module_id, count in MODULES.items() if answered.get(module_id, 0) >= count}
+
+
+def decode(mask, bits):
+    return {module_id for module_id, bit in bits.items() if mask >> bit & 1}
+
+
+def encode(module_ids, bits):
+    return sum(1 << bits[module_id] for module_id in module_ids)
+
+
+def test_bits_follow_course_order(app):
+    bits = get_module_bits(1)
+    assert sorted(bits, key=bits.get) == ['1.1', '1.2', '1.2.1', '1.10', '2.1', '2.2']
+
+
+def test_mask_round_trips_against_aggregate(app):
+    bits = get_module_bits(1)
+    steps = [
+        [],
+        [('1.1', 0)],
+        [('1.1', 1), ('1.2', 0)],
+        [('1.2', 1), ('1.2', 2, None)],  # An unanswered (shuffle-only) row does not count
+        [('1.2', 2), ('1.2.1', 0), ('1.10', 0)],
+        [('1.10', 1), ('2.2', 0)],
+    ]
+    for step in steps:
+        for module_id, n, *choice in step:
+            selected_choice = choice[0] if choice else 'a'
+            existing = UserQuizAnswer.query.filter_by(user_id=1, quiz_question_id=f'q{module_id}_{n}').first()
+            if existing:
+                existing.selected_choice = selected_choice
+            else:
+                answer(module_id, n, selected_choice)
+        db.session.flush()
+
+        expected = completed_by_aggregate()
+        mask = compute_completed_mask(1, bits)
+        assert decode(mask, bits) == expected
+        assert encode(expected, bits) == mask
+
+
+def test_incremental_updates_match_rebuild(app):
+    for module_id, quiz_count in MODULES.items():
+        for n in range(quiz_count):
+            answer(module_id, n)
+        db.session.flush()
+        state = set_module_complete_in_state(1, module_id)
+        incremental = state.completed_mask
+        assert rebuild_user_state(1).completed_mask == incremental
+        assert decode(incremental, get_module_bits(1)) == completed_by_aggregate()
+    db.session.commit()
+
+    state = db.session.get(UserState, 1)
+    assert decode(state.completed_mask, get_module_bits(1)) == set(MODULES)
+
+
+def test_completion_keeps_a_row_created_elsewhere(app):
+    # Another request created the row (e.g. by viewing an intro) since this
+    # session last looked - the completion must update it, not insert again
+    assert db.session.get(UserState, 1) is None
+    mark_intro_seen(1, 2)
+    answer('1.1', 0)
+    answer('1.1', 1)
+    db.session.flush()
+
+    state = set_module_complete_in_state(1, '1.1')
+    db.session.commit()
+
+    assert state.has_seen_intro(2)
+    assert decode(state.completed_mask, get_module_bits(1)) == {'1.1', '2.1'}